@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 from dotenv import load_dotenv
@@ -82,10 +83,60 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+        # Segundos que una escritura de stock espera el bloqueo de escritura de SQLite
+        # (ver core.transacciones) antes de fallar con "database is locked".
+        "OPTIONS": {
+            "timeout": 20,
+        },
     }
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# El backend del caché del dashboard se elige con DASHBOARD_CACHE_BACKEND
+# (p. ej. django.core.cache.backends.redis.RedisCache) y DASHBOARD_CACHE_LOCATION.
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "dashboard": {
+        "BACKEND": os.getenv("DASHBOARD_CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.getenv("DASHBOARD_CACHE_LOCATION", "synkro-dashboard"),
+    },
+}
+
+DASHBOARD_CACHE_ALIAS = "dashboard"
+DASHBOARD_CACHE_TIMEOUT = int(os.getenv("DASHBOARD_CACHE_TIMEOUT", "300"))
+
+# Versión compartida del índice en memoria del autocompletado de productos.
+# Debe ser un caché común a todos los procesos (p. ej. Redis) para que vean los cambios de los demás;
+# el LocMemCache por defecto solo sirve con un único proceso (manage.py check avisa con core.W001).
+INDICE_PRODUCTOS_CACHE_ALIAS = "dashboard"
+
+# Horas que una cotización o un borrador aparta su stock (ver core.services.reservas).
+# Las reservas vencidas se liberan con el comando liberar_reservas_vencidas.
+RESERVA_STOCK_HORAS = int(os.getenv("RESERVA_STOCK_HORAS", "24"))
+
+# Horas que se recuerda una clave de idempotencia del punto de venta (ver core.services.idempotencia).
+# Las vencidas se borran con el comando purgar_claves_idempotencia.
+IDEMPOTENCIA_HORAS = int(os.getenv("IDEMPOTENCIA_HORAS", "24"))
+
+REST_FRAMEWORK = {
+    "DEFAULT_AUTHENTICATION_CLASSES": [
+        "rest_framework.authentication.SessionAuthentication",
+        "rest_framework.authentication.BasicAuthentication",
+    ],
+    "DEFAULT_PERMISSION_CLASSES": [
+        "rest_framework.permissions.IsAuthenticated",
+    ],
+    "DEFAULT_RENDERER_CLASSES": [
+        "rest_framework.renderers.JSONRenderer",
+    ],
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
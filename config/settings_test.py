@@ -0,0 +1,12 @@
+"""
+Configuración para `manage.py test` (ver manage.py).
+
+La base de pruebas va en un archivo y no en la memoria compartida de SQLite,
+para que las pruebas de concurrencia usen el mismo bloqueo de archivo que
+producción: con la memoria compartida las escrituras simultáneas fallan al
+instante en lugar de esperar su turno.
+"""
+from .settings import *  # noqa: F401,F403
+from .settings import BASE_DIR, DATABASES
+
+DATABASES["default"]["TEST"] = {"NAME": BASE_DIR / "test_db.sqlite3"}
@@ -5,8 +5,10 @@ from django.utils.html import format_html
 from .models import (
     Categoria, Producto, Cliente, Venta, VentaDetalle,
     Proveedor, PedidoProveedor, PedidoDetalle,
-    NotaEntregaVenta, DetalleNotaEntrega
+    NotaEntregaVenta, DetalleNotaEntrega, InventarioMovimiento, ReservaStock,
+    StockSucursal
 )
+from .services.reservas import liberar
 
 # --- Inlines para mejorar la experiencia de usuario ---
 
@@ -26,11 +28,15 @@ class DetalleNotaEntregaInline(admin.TabularInline):
     autocomplete_fields = ['producto']
     readonly_fields = ('get_cantidad_pendiente',)
     
+    def get_formset(self, request, obj=None, **kwargs):
+        # Lo pendiente de toda la venta en una consulta, no una por fila
+        self._pendientes = obj.venta.pendientes_por_producto() if obj else {}
+        return super().get_formset(request, obj, **kwargs)
+    
     def get_cantidad_pendiente(self, obj):
         """Muestra la cantidad pendiente de entregar del producto"""
-        if obj.nota_entrega and obj.producto:
-            venta = obj.nota_entrega.venta
-            pendiente = venta.cantidad_pendiente_producto(obj.producto)
+        pendiente = getattr(self, '_pendientes', {}).get(obj.producto_id)
+        if pendiente is not None:
             return f"{pendiente} unidades pendientes"
         return "-"
     get_cantidad_pendiente.short_description = "Cantidad Pendiente"
@@ -170,4 +176,76 @@ class NotaEntregaVentaAdmin(admin.ModelAdmin):
         
         if revertidas > 0:
             self.message_user(request, f"Se revirtió el descuento de inventario de {revertidas} nota(s)")
-    revertir_descuento_inventario.short_description = "Revertir descuento de inventario"
\ No newline at end of file
+    revertir_descuento_inventario.short_description = "Revertir descuento de inventario"
+
+# --- LIBRO DE INVENTARIO ---
+
+@admin.register(InventarioMovimiento)
+class InventarioMovimientoAdmin(admin.ModelAdmin):
+    """Solo lectura: los movimientos se registran desde core.services.inventario."""
+    list_display = ('fecha', 'producto', 'tipo', 'cantidad', 'sucursal', 'venta', 'pedido', 'nota_entrega')
+    list_filter = ('tipo', 'sucursal', 'fecha')
+    search_fields = ('producto__nombre', 'producto__sku')
+    list_select_related = ('producto',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+# --- RESERVAS DE STOCK ---
+
+@admin.register(ReservaStock)
+class ReservaStockAdmin(admin.ModelAdmin):
+    """
+    Solo lectura: las reservas se crean y liberan desde core.services.reservas.
+    Borrarlas directamente dejaría Producto.stock_reservado apartando unidades;
+    para soltarlas está la acción que usa reservas.liberar().
+    """
+    list_display = ('producto', 'cantidad', 'expira', 'detalle')
+    list_filter = ('expira',)
+    search_fields = ('producto__nombre', 'producto__sku')
+    list_select_related = ('producto', 'detalle')
+    actions = ['liberar_reservas']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    def liberar_reservas(self, request, queryset):
+        """Acción para liberar las reservas seleccionadas y devolver sus unidades al stock disponible"""
+        self.message_user(request, f"Se liberaron {liberar(queryset)} reserva(s)")
+    liberar_reservas.short_description = "Liberar reservas seleccionadas"
+
+
+# --- STOCK POR SUCURSAL ---
+
+@admin.register(StockSucursal)
+class StockSucursalAdmin(admin.ModelAdmin):
+    """
+    Solo lectura: el stock de cada sucursal se mueve desde core.services.inventario.
+    El saldo inicial y los conteos físicos se cargan con el comando ajustar_stock_sucursal.
+    """
+    list_display = ('sucursal', 'producto', 'cantidad')
+    list_filter = ('sucursal',)
+    search_fields = ('producto__nombre', 'producto__sku')
+    list_select_related = ('sucursal', 'producto')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,123 @@
+# core/api_views.py
+"""
+API JSON de solo lectura para las entidades de catálogo (Django REST Framework).
+
+- Paginación por cursor ordenada por id (`?cursor=`, `?page_size=`).
+- Campos a demanda (`?fields=id,nombre,sku`), que también limitan las columnas consultadas.
+- `?search=` con los mismos filtros que los listados HTML (core.busquedas).
+- Filtros exactos por parámetro (`filtros`); un valor que no corresponde al campo responde 400.
+- ETag calculado sobre la respuesta: un GET con If-None-Match devuelve 304 si no cambió.
+"""
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import models
+from django.middleware.http import ConditionalGetMiddleware
+from django.utils.decorators import decorator_from_middleware, method_decorator
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import CursorPagination
+from rest_framework.viewsets import ReadOnlyModelViewSet
+
+from .busquedas import aplicar_busqueda
+from .models import Cliente, Producto, Proveedor, Sucursal, Repartidor
+from .serializers import (
+    ClienteSerializer, ProductoSerializer, ProveedorSerializer,
+    SucursalSerializer, RepartidorSerializer
+)
+
+etag_condicional = decorator_from_middleware(ConditionalGetMiddleware)
+
+
+class PaginacionCursor(CursorPagination):
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    ordering = '-id'
+
+
+@method_decorator(etag_condicional, name='dispatch')
+class CatalogoViewSet(ReadOnlyModelViewSet):
+    pagination_class = PaginacionCursor
+    # Clave de core.busquedas.CAMPOS_BUSQUEDA
+    entidad = None
+    # Parámetro GET -> lookup exacto
+    filtros = {}
+    # Campo del serializer -> (relación para select_related, columna de la relación)
+    relaciones = {}
+
+    def campos_pedidos(self):
+        campos = self.request.query_params.get('fields')
+        if not campos:
+            return None
+        return {campo.strip() for campo in campos.split(',') if campo.strip()}
+
+    def valor_filtro(self, modelo, parametro, lookup, valor):
+        """Convierte el valor de un filtro al tipo de su campo; si no es válido responde 400."""
+        campo = modelo._meta.get_field(lookup)
+        if isinstance(campo, models.BooleanField):
+            # true/false como en el JSON de las respuestas
+            valor = valor.capitalize()
+        try:
+            valor = campo.to_python(valor)
+            if campo.choices:
+                campo.validate(valor, None)
+        except DjangoValidationError as error:
+            raise ValidationError({parametro: error.messages})
+        return valor
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        queryset = aplicar_busqueda(queryset, self.request.query_params.get('search', ''), self.entidad)
+        for parametro, lookup in self.filtros.items():
+            valor = self.request.query_params.get(parametro)
+            if valor:
+                queryset = queryset.filter(**{lookup: self.valor_filtro(queryset.model, parametro, lookup, valor)})
+
+        pedidos = self.campos_pedidos()
+        columnas = ['id']
+        for campo, (relacion, columna) in self.relaciones.items():
+            if pedidos is None or campo in pedidos:
+                queryset = queryset.select_related(relacion)
+                columnas.append(columna)
+        if pedidos is not None:
+            concretos = {field.name for field in queryset.model._meta.concrete_fields}
+            columnas.extend(campo for campo in pedidos if campo in concretos)
+            queryset = queryset.only(*columnas)
+        return queryset
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+
+class ClienteViewSet(CatalogoViewSet):
+    queryset = Cliente.objects.all()
+    serializer_class = ClienteSerializer
+    entidad = 'cliente'
+
+
+class ProductoViewSet(CatalogoViewSet):
+    queryset = Producto.objects.all()
+    serializer_class = ProductoSerializer
+    entidad = 'producto'
+    filtros = {'categoria': 'categoria_id'}
+    relaciones = {'categoria_nombre': ('categoria', 'categoria__nombre')}
+
+
+class ProveedorViewSet(CatalogoViewSet):
+    queryset = Proveedor.objects.all()
+    serializer_class = ProveedorSerializer
+    entidad = 'proveedor'
+
+
+class SucursalViewSet(CatalogoViewSet):
+    queryset = Sucursal.objects.all()
+    serializer_class = SucursalSerializer
+    entidad = 'sucursal'
+    filtros = {'activa': 'activa'}
+
+
+class RepartidorViewSet(CatalogoViewSet):
+    queryset = Repartidor.objects.all()
+    serializer_class = RepartidorSerializer
+    entidad = 'repartidor'
+    filtros = {'estado': 'estado'}
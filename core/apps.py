@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "core"
+
+    def ready(self):
+        # Registrar las señales de invalidación de caché
+        from . import signals  # noqa: F401
+        # Registrar las comprobaciones de configuración
+        from . import checks  # noqa: F401
@@ -0,0 +1,23 @@
+"""
+Filtros de búsqueda compartidos por los listados HTML y la API JSON,
+para que `?search=` devuelva las mismas filas en ambos.
+"""
+from django.db.models import Q
+
+CAMPOS_BUSQUEDA = {
+    'cliente': ('nombre', 'email', 'telefono'),
+    'producto': ('nombre', 'sku', 'descripcion'),
+    'proveedor': ('nombre', 'email', 'telefono'),
+    'sucursal': ('nombre', 'codigo', 'ciudad'),
+    'repartidor': ('nombre', 'documento', 'telefono'),
+}
+
+
+def aplicar_busqueda(queryset, search, entidad):
+    """Filtra con icontains sobre los campos de búsqueda de la entidad (OR entre campos)."""
+    if not search:
+        return queryset
+    condicion = Q()
+    for campo in CAMPOS_BUSQUEDA[entidad]:
+        condicion |= Q(**{f'{campo}__icontains': search})
+    return queryset.filter(condicion)
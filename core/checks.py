@@ -0,0 +1,28 @@
+"""
+Comprobaciones de configuración (manage.py check).
+
+El índice en memoria del autocompletado (core.services.indice_productos) se
+entera de los cambios hechos por otros procesos a través de un contador en
+INDICE_PRODUCTOS_CACHE_ALIAS. Con un LocMemCache cada proceso tiene su propio
+contador y, con varios workers, el autocompletado de uno muestra el stock
+viejo de lo que vendieron los demás sin que nada lo avise.
+"""
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+LOCMEM = 'django.core.cache.backends.locmem.LocMemCache'
+
+
+@register(Tags.caches)
+def indice_productos_con_cache_compartido(app_configs, **kwargs):
+    alias = getattr(settings, 'INDICE_PRODUCTOS_CACHE_ALIAS', 'default')
+    backend = settings.CACHES.get(alias, {}).get('BACKEND')
+    if settings.DEBUG or backend != LOCMEM:
+        return []
+    return [Warning(
+        f"INDICE_PRODUCTOS_CACHE_ALIAS ('{alias}') usa LocMemCache, que no se comparte entre procesos: "
+        "con varios workers el autocompletado de productos mostrará stock desactualizado.",
+        hint="Configura un caché compartido (p. ej. DASHBOARD_CACHE_BACKEND="
+             "django.core.cache.backends.redis.RedisCache y DASHBOARD_CACHE_LOCATION).",
+        id='core.W001',
+    )]
@@ -1,6 +1,116 @@
 from django import forms
+from django.core.exceptions import ValidationError
+from django.urls import reverse
+from django.utils.functional import cached_property
+from django.utils.http import urlencode
 from .models import Cliente, Producto, Categoria, Venta, VentaDetalle, Proveedor, PedidoProveedor, PedidoDetalle, PagoProveedor, Sucursal, Repartidor, RutaEntrega, DetalleRuta, NotaEntregaVenta, DetalleNotaEntrega
 
+# === SELECCIÓN DE PRODUCTOS EN DETALLES ===
+
+class BuscadorProductoWidget(forms.Select):
+    """
+    Select que solo renderiza la opción elegida; el resto se busca con AJAX en
+    api/buscar-productos/ (ver templates/buscador_productos.html).
+    `parametros` se agregan a la URL de búsqueda.
+    """
+
+    def __init__(self, attrs=None, parametros=None):
+        super().__init__(attrs)
+        self.parametros = parametros or {}
+        self.precargados = None
+
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        url = reverse('buscar_productos')
+        if self.parametros:
+            url += '?' + urlencode(self.parametros)
+        context['widget']['attrs']['data-buscar-url'] = url
+        return context
+
+    def optgroups(self, name, value, attrs=None):
+        ids = [int(v) for v in value if str(v).isdigit()]
+        productos = self.precargados
+        if productos is None and ids:
+            productos = self.choices.queryset.in_bulk(ids)
+        opciones = [self.create_option(name, '', self.choices.field.empty_label or '', not ids, 0)]
+        for indice, pk in enumerate(ids, start=1):
+            if productos and pk in productos:
+                etiqueta = self.choices.field.label_from_instance(productos[pk])
+                opciones.append(self.create_option(name, str(pk), etiqueta, True, indice))
+        return [(None, opciones, 0)]
+
+
+class ProductoChoiceField(forms.ModelChoiceField):
+    """
+    ModelChoiceField que valida contra los productos que el formset ya cargó
+    (con una sola consulta para todas las filas) en lugar de consultar por fila.
+    """
+    widget = BuscadorProductoWidget
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.precargados = None
+
+    def usar_precargados(self, productos):
+        self.precargados = self.widget.precargados = productos
+
+    def to_python(self, value):
+        if self.precargados is None or value in self.empty_values:
+            return super().to_python(value)
+        try:
+            return self.precargados[int(value)]
+        except (KeyError, ValueError, TypeError):
+            raise ValidationError(
+                self.error_messages['invalid_choice'], code='invalid_choice', params={'value': value}
+            )
+
+
+class ProductoBuscadorMixin:
+    """Formularios de detalle con un ProductoChoiceField llamado `producto`."""
+
+    def __init__(self, *args, productos=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if productos is not None:
+            self.fields['producto'].usar_precargados(productos)
+
+    def _get_validation_exclusions(self):
+        exclusiones = super()._get_validation_exclusions()
+        # El campo ya validó que el producto existe; el modelo lo volvería a consultar por fila
+        if self.fields['producto'].precargados is not None:
+            exclusiones.add('producto')
+        return exclusiones
+
+
+class DetalleProductoFormSet(forms.BaseInlineFormSet):
+    """
+    Formset de detalles que carga con un solo in_bulk los productos elegidos
+    en todas sus filas. `productos` restringe los productos válidos; por
+    omisión se usa el queryset del campo del formulario.
+    """
+
+    def __init__(self, *args, productos=None, **kwargs):
+        self.productos = productos
+        super().__init__(*args, **kwargs)
+
+    @cached_property
+    def productos_elegidos(self):
+        if self.is_bound:
+            valores = [
+                self.data.get(f"{self.add_prefix(i)}-producto")
+                for i in range(self.total_form_count())
+            ]
+        else:
+            valores = [detalle.producto_id for detalle in self.get_queryset()]
+        ids = {int(valor) for valor in valores if str(valor).isdigit()}
+        queryset = self.productos if self.productos is not None else self.form.base_fields['producto'].queryset
+        return queryset.in_bulk(ids) if ids else {}
+
+    def get_form_kwargs(self, index):
+        kwargs = super().get_form_kwargs(index)
+        kwargs['productos'] = self.productos_elegidos
+        return kwargs
+
+
 class ClienteForm(forms.ModelForm):
     class Meta:
         model = Cliente
@@ -86,11 +196,15 @@ class ProductoForm(forms.ModelForm):
         }
 
 class VentaForm(forms.ModelForm):
+    # Generada al mostrar el formulario: un reenvío con la misma clave no crea otra venta
+    clave_idempotencia = forms.CharField(widget=forms.HiddenInput, required=False, max_length=64)
+
     class Meta:
         model = Venta
         fields = [
             'cliente', 
             'estado', 
+            'sucursal',
             'requiere_domicilio', 
             'direccion_entrega',
             'prioridad_entrega',
@@ -105,6 +219,9 @@ class VentaForm(forms.ModelForm):
             'estado': forms.Select(attrs={
                 'class': 'form-select'
             }),
+            'sucursal': forms.Select(attrs={
+                'class': 'form-select'
+            }),
             'direccion_entrega': forms.Textarea(attrs={'rows': 3}),
             # --- WIDGETS PARA LOS CAMPOS DE HORA ---
             'ventana_tiempo_inicio': forms.TimeInput(attrs={'type': 'time'}),
@@ -149,14 +266,17 @@ class VentaDomicilioForm(forms.ModelForm):
             'ventana_tiempo_fin': forms.TimeInput(attrs={'class': 'form-control', 'type': 'time'}),
         }
 
-class VentaDetalleForm(forms.ModelForm):
+class VentaDetalleForm(ProductoBuscadorMixin, forms.ModelForm):
+    # Solo productos con stock disponible (sin contar lo reservado por cotizaciones y borradores)
+    producto = ProductoChoiceField(
+        queryset=Producto.objects.filter(stock_disponible__gt=0),
+        widget=BuscadorProductoWidget(attrs={'class': 'form-select producto-select'}),
+    )
+
     class Meta:
         model = VentaDetalle
         fields = ['producto', 'cantidad', 'precio_unitario_venta']
         widgets = {
-            'producto': forms.Select(attrs={
-                'class': 'form-select producto-select'
-            }),
             'cantidad': forms.NumberInput(attrs={
                 'class': 'form-control cantidad-input',
                 'min': '1',
@@ -170,16 +290,12 @@ class VentaDetalleForm(forms.ModelForm):
             }),
         }
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        # Solo mostrar productos con stock disponible
-        self.fields['producto'].queryset = Producto.objects.filter(stock_actual__gt=0)
-
 # Formset para manejar múltiples detalles de venta
 VentaDetalleFormSet = forms.inlineformset_factory(
     Venta, 
     VentaDetalle, 
     form=VentaDetalleForm,
+    formset=DetalleProductoFormSet,
     extra=1,
     min_num=1,
     validate_min=True,
@@ -252,21 +368,26 @@ class PagoProveedorForm(forms.ModelForm):
 class PedidoProveedorForm(forms.ModelForm):
     class Meta:
         model = PedidoProveedor
-        fields = ['proveedor']
+        fields = ['proveedor', 'sucursal']
         widgets = {
             'proveedor': forms.Select(attrs={
                 'class': 'form-select'
             }),
+            'sucursal': forms.Select(attrs={
+                'class': 'form-select'
+            }),
         }
 
-class PedidoDetalleForm(forms.ModelForm):
+class PedidoDetalleForm(ProductoBuscadorMixin, forms.ModelForm):
+    producto = ProductoChoiceField(
+        queryset=Producto.objects.all(),
+        widget=BuscadorProductoWidget(attrs={'class': 'form-select producto-select'}, parametros={'con_stock': 0}),
+    )
+
     class Meta:
         model = PedidoDetalle
         fields = ['producto', 'cantidad', 'costo_unitario_compra']
         widgets = {
-            'producto': forms.Select(attrs={
-                'class': 'form-select producto-select'
-            }),
             'cantidad': forms.NumberInput(attrs={
                 'class': 'form-control cantidad-input',
                 'min': '1',
@@ -284,6 +405,7 @@ PedidoDetalleFormSet = forms.inlineformset_factory(
     PedidoProveedor, 
     PedidoDetalle, 
     form=PedidoDetalleForm,
+    formset=DetalleProductoFormSet,
     extra=1,
     min_num=1,
     validate_min=True,
@@ -464,16 +586,19 @@ class NotaEntregaVentaForm(forms.ModelForm):
         }
 
 
-class DetalleNotaEntregaForm(forms.ModelForm):
+class DetalleNotaEntregaForm(ProductoBuscadorMixin, forms.ModelForm):
     """Formulario para especificar productos y cantidades entregadas"""
     
+    producto = ProductoChoiceField(
+        queryset=Producto.objects.all(),
+        widget=BuscadorProductoWidget(attrs={'class': 'form-select producto-entrega-select'}),
+        label='Producto',
+    )
+    
     class Meta:
         model = DetalleNotaEntrega
         fields = ['producto', 'cantidad_entregada']
         widgets = {
-            'producto': forms.Select(attrs={
-                'class': 'form-select producto-entrega-select'
-            }),
             'cantidad_entregada': forms.NumberInput(attrs={
                 'class': 'form-control cantidad-entrega-input',
                 'min': '1',
@@ -492,6 +617,7 @@ class DetalleNotaEntregaForm(forms.ModelForm):
         if venta:
             productos_venta = venta.detalles.values_list('producto', flat=True)
             self.fields['producto'].queryset = Producto.objects.filter(id__in=productos_venta)
+            self.fields['producto'].widget.parametros = {'venta': venta.id}
             
             # Agregar información de cantidades pendientes en el help_text
             self.venta = venta
@@ -502,6 +628,7 @@ DetalleNotaEntregaFormSet = forms.inlineformset_factory(
     NotaEntregaVenta,
     DetalleNotaEntrega,
     form=DetalleNotaEntregaForm,
+    formset=DetalleProductoFormSet,
     extra=1,
     min_num=1,
     validate_min=True,
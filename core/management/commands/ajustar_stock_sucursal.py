@@ -0,0 +1,60 @@
+# core/management/commands/ajustar_stock_sucursal.py
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import Producto, StockSucursal, Sucursal
+from core.services.inventario import StockInsuficiente, ajustar_stock_sucursal, stock_sin_sucursal
+
+
+class Command(BaseCommand):
+    help = (
+        'Carga o corrige el stock de una sucursal (movimientos AJUSTE). Sin --asignar es un conteo físico '
+        'y cambia también el stock global; con --asignar (saldo inicial) las unidades se toman del stock que '
+        'aún no está en ninguna sucursal. --resto asigna a la sucursal todo ese stock sin sucursal.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('sucursal', help='Código de la sucursal.')
+        parser.add_argument('cantidades', nargs='*', help='Pares SKU=CANTIDAD con el stock que debe quedar.')
+        parser.add_argument('--asignar', action='store_true', help='Saldo inicial: no cambia el stock global.')
+        parser.add_argument('--resto', action='store_true', help='Asigna todo el stock sin sucursal a esta sucursal.')
+
+    def handle(self, *args, **kwargs):
+        try:
+            sucursal = Sucursal.objects.get(codigo=kwargs['sucursal'])
+        except Sucursal.DoesNotExist:
+            raise CommandError(f"No existe la sucursal con código {kwargs['sucursal']}.")
+
+        cantidades = self._cantidades(kwargs['cantidades'])
+        asignar = kwargs['asignar'] or kwargs['resto']
+        if kwargs['resto']:
+            actuales = dict(StockSucursal.objects.filter(sucursal=sucursal).values_list('producto_id', 'cantidad'))
+            for producto_id, libre in stock_sin_sucursal().items():
+                if libre > 0 and producto_id not in cantidades:
+                    cantidades[producto_id] = actuales.get(producto_id, 0) + libre
+        if not cantidades:
+            raise CommandError('Indica pares SKU=CANTIDAD o --resto.')
+
+        try:
+            movimientos = ajustar_stock_sucursal(sucursal.id, cantidades, asignar=asignar)
+        except StockInsuficiente as error:
+            raise CommandError('\n'.join(error.messages))
+        productos = len({movimiento.producto_id for movimiento in movimientos})
+        self.stdout.write(self.style.SUCCESS(
+            f'Stock de {sucursal.nombre} ajustado: {productos} producto(s) cambiaron '
+            f'({"saldo inicial" if asignar else "conteo físico"}).'
+        ))
+
+    def _cantidades(self, pares):
+        """{producto_id: cantidad} a partir de los pares SKU=CANTIDAD."""
+        por_sku = {}
+        for par in pares:
+            sku, _, cantidad = par.rpartition('=')
+            if not sku or not cantidad.isdigit():
+                raise CommandError(f'"{par}" no es un par SKU=CANTIDAD válido.')
+            por_sku[sku] = int(cantidad)
+        ids = dict(Producto.objects.filter(sku__in=por_sku).values_list('sku', 'id'))
+        desconocidos = sorted(set(por_sku) - set(ids))
+        if desconocidos:
+            raise CommandError(f'SKU desconocidos: {", ".join(desconocidos)}')
+        return {ids[sku]: cantidad for sku, cantidad in por_sku.items()}
@@ -0,0 +1,85 @@
+# core/management/commands/benchmark_busqueda_productos.py
+
+import random
+import statistics
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.models import Producto
+from core.services.busqueda_productos import buscar_productos, reconstruir_indice
+from core.busquedas import aplicar_busqueda
+
+SILABAS = [
+    'ba', 'be', 'ca', 'co', 'da', 'de', 'fa', 'fi', 'ga', 'go', 'la', 'lo', 'ma', 'me', 'na', 'no',
+    'pa', 'pe', 'ra', 'ro', 'sa', 'se', 'ta', 'to', 'va', 'vi', 'za', 'tri', 'bro', 'cla', 'pla', 'gra',
+]
+
+
+def _vocabulario(tamano):
+    """Palabras sintéticas pronunciables, para que cada término aparezca en pocos productos."""
+    palabras = set()
+    while len(palabras) < tamano:
+        palabras.add(''.join(random.choices(SILABAS, k=random.randint(2, 4))))
+    return sorted(palabras)
+
+
+class Command(BaseCommand):
+    help = ('Mide la latencia de la búsqueda de productos (índice de texto completo vs icontains) '
+            'sobre un catálogo sintético. Los datos se crean en una transacción que se revierte.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--productos', type=int, default=200000, help='Tamaño del catálogo sintético.')
+        parser.add_argument('--consultas', type=int, default=200, help='Número de búsquedas a medir.')
+        parser.add_argument('--vocabulario', type=int, default=5000, help='Palabras distintas del catálogo sintético.')
+        parser.add_argument('--sin-icontains', action='store_true', help='No medir la búsqueda con icontains.')
+
+    def _medir(self, funcion, consultas):
+        tiempos = []
+        for texto in consultas:
+            inicio = time.perf_counter()
+            funcion(texto)
+            tiempos.append((time.perf_counter() - inicio) * 1000)
+        tiempos.sort()
+        p95 = tiempos[max(int(len(tiempos) * 0.95) - 1, 0)]
+        return statistics.median(tiempos), p95
+
+    def handle(self, *args, **kwargs):
+        random.seed(42)
+        total = kwargs['productos']
+        with transaction.atomic():
+            self.stdout.write(f"Creando {total} productos sintéticos...")
+            base = Producto.objects.count()
+            palabras = _vocabulario(kwargs['vocabulario'])
+            Producto.objects.bulk_create([
+                Producto(
+                    nombre=' '.join(random.sample(palabras, 3)).title(),
+                    sku=f"BEN{base + i:07d}",
+                    descripcion=' '.join(random.choices(palabras, k=8)),
+                    precio_venta=Decimal('10.00'),
+                    stock_actual=random.randint(0, 50),
+                )
+                for i in range(total)
+            ], batch_size=5000)
+            # bulk_create no dispara señales
+            reconstruir_indice()
+
+            # Palabras completas o sus primeras letras, como al escribir en el punto de venta
+            consultas = [random.choice(palabras)[:random.randint(4, 8)] for _ in range(kwargs['consultas'])]
+            consultas += [f"BEN{random.randint(base, base + total - 1):07d}" for _ in range(kwargs['consultas'] // 4)]
+
+            mediana, p95 = self._medir(
+                lambda texto: buscar_productos(Producto.objects.all(), texto, limite=10, con_stock=True), consultas
+            )
+            self.stdout.write(self.style.SUCCESS(f"Índice de texto completo: mediana {mediana:.2f} ms, p95 {p95:.2f} ms"))
+
+            if not kwargs['sin_icontains']:
+                mediana, p95 = self._medir(
+                    lambda texto: list(aplicar_busqueda(Producto.objects.filter(stock_actual__gt=0), texto, 'producto')[:10]),
+                    consultas
+                )
+                self.stdout.write(f"icontains:                 mediana {mediana:.2f} ms, p95 {p95:.2f} ms")
+
+            transaction.set_rollback(True)
@@ -0,0 +1,32 @@
+# core/management/commands/calcular_puntos_reorden.py
+
+import time
+from django.core.management.base import BaseCommand
+
+from core.services.pronostico_demanda import actualizar_puntos_reorden
+
+
+class Command(BaseCommand):
+    help = 'Pronostica la demanda de cada producto y guarda el punto de reorden y la cantidad de pedido sugeridos.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, default=180, help='Días de historial de ventas a considerar.')
+        parser.add_argument('--tiempo-entrega', type=int, default=7, help='Días que tarda un pedido al proveedor.')
+        parser.add_argument('--nivel-servicio', type=float, default=0.95, help='Probabilidad de no quedarse sin stock (0-1).')
+        parser.add_argument('--cobertura', type=int, default=30, help='Días de demanda que debe cubrir cada pedido.')
+        parser.add_argument('--alfa', type=float, default=0.3, help='Factor de suavizado exponencial (0-1).')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Tamaño de lote para la actualización masiva.')
+
+    def handle(self, *args, **kwargs):
+        start_time = time.time()
+        self.stdout.write("Calculando puntos de reorden...")
+        total = actualizar_puntos_reorden(
+            batch_size=kwargs['batch_size'],
+            dias=kwargs['dias'],
+            tiempo_entrega=kwargs['tiempo_entrega'],
+            nivel_servicio=kwargs['nivel_servicio'],
+            dias_cobertura=kwargs['cobertura'],
+            alfa=kwargs['alfa'],
+        )
+        duracion = time.time() - start_time
+        self.stdout.write(self.style.SUCCESS(f'Sugerencias actualizadas para {total} productos en {duracion:.2f} segundos.'))
@@ -0,0 +1,32 @@
+# core/management/commands/cambiar_estado_ventas.py
+
+import time
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import Venta
+from core.services.ventas import VentaService
+
+
+class Command(BaseCommand):
+    help = 'Cambia el estado de varias ventas en una sola transacción (p. ej. el cierre del día).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('estado', help='Estado destino (COMPLETADA, CANCELADA, ...).')
+        parser.add_argument('ventas', nargs='+', type=int, help='IDs de las ventas.')
+
+    def handle(self, *args, **kwargs):
+        estado = kwargs['estado']
+        if estado not in dict(Venta.ESTADO_CHOICES):
+            raise CommandError(f'Estado no válido: {estado}')
+
+        start_time = time.time()
+        resultados = VentaService.cambiar_estados(kwargs['ventas'], estado)
+        duracion = time.time() - start_time
+        fallidas = 0
+        for venta_id, error in resultados.items():
+            if error is not None:
+                fallidas += 1
+                self.stdout.write(self.style.ERROR(f'Venta #{venta_id}: {error}'))
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(resultados) - fallidas} venta(s) en {estado}, {fallidas} con error, en {duracion:.2f} segundos.'
+        ))
@@ -0,0 +1,19 @@
+# core/management/commands/generar_pedidos_reposicion.py
+
+from django.core.management.base import BaseCommand
+
+from core.services.reposicion import generar_pedidos
+
+
+class Command(BaseCommand):
+    help = 'Crea pedidos BORRADOR por proveedor para los productos bajo su umbral de reorden. Programar cada noche.'
+
+    def handle(self, *args, **kwargs):
+        creados, sin_proveedor = generar_pedidos()
+        lineas = sum(len(detalles) for _, detalles in creados)
+        self.stdout.write(self.style.SUCCESS(f'Pedidos borrador creados: {len(creados)} ({lineas} líneas).'))
+        if sin_proveedor:
+            self.stdout.write(self.style.WARNING(
+                f'{len(sin_proveedor)} producto(s) sin compras anteriores quedaron sin pedido: '
+                f'{", ".join(map(str, sin_proveedor[:20]))}{"..." if len(sin_proveedor) > 20 else ""}'
+            ))
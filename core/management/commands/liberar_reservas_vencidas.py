@@ -0,0 +1,13 @@
+# core/management/commands/liberar_reservas_vencidas.py
+
+from django.core.management.base import BaseCommand
+
+from core.services.reservas import liberar_vencidas
+
+
+class Command(BaseCommand):
+    help = 'Libera en bloque las reservas de stock vencidas de cotizaciones y borradores. Programar periódicamente.'
+
+    def handle(self, *args, **kwargs):
+        liberadas = liberar_vencidas()
+        self.stdout.write(self.style.SUCCESS(f'Reservas vencidas liberadas: {liberadas}.'))
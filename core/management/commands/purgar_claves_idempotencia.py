@@ -0,0 +1,13 @@
+# core/management/commands/purgar_claves_idempotencia.py
+
+from django.core.management.base import BaseCommand
+
+from core.services.idempotencia import purgar_claves_vencidas
+
+
+class Command(BaseCommand):
+    help = 'Borra en bloque las claves de idempotencia vencidas del punto de venta. Programar periódicamente.'
+
+    def handle(self, *args, **kwargs):
+        borradas = purgar_claves_vencidas()
+        self.stdout.write(self.style.SUCCESS(f'Claves de idempotencia borradas: {borradas}.'))
@@ -0,0 +1,21 @@
+# core/management/commands/recalcular_entregas.py
+
+import time
+from django.core.management.base import BaseCommand
+
+from core.services.entregas import recalcular
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye la cantidad entregada de cada línea de venta desde las notas de entrega aplicadas.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('ventas', nargs='*', type=int, help='IDs de las ventas (todas si se omite).')
+
+    def handle(self, *args, **kwargs):
+        start_time = time.time()
+        cambiadas = recalcular(kwargs['ventas'] or None)
+        duracion = time.time() - start_time
+        self.stdout.write(self.style.SUCCESS(
+            f'{cambiadas} línea(s) de venta corregidas en {duracion:.2f} segundos.'
+        ))
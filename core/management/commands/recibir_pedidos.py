@@ -0,0 +1,26 @@
+# core/management/commands/recibir_pedidos.py
+
+import time
+from django.core.management.base import BaseCommand
+
+from core.services.pedidos import PedidoService
+
+
+class Command(BaseCommand):
+    help = 'Marca como recibidos varios pedidos a proveedores en una sola transacción y suma su stock.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('pedidos', nargs='+', type=int, help='IDs de los pedidos.')
+
+    def handle(self, *args, **kwargs):
+        start_time = time.time()
+        resultados = PedidoService.recibir(kwargs['pedidos'])
+        duracion = time.time() - start_time
+        fallidos = 0
+        for pedido_id, error in resultados.items():
+            if error is not None:
+                fallidos += 1
+                self.stdout.write(self.style.ERROR(f'Pedido #{pedido_id}: {error}'))
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(resultados) - fallidos} pedido(s) recibidos, {fallidos} con error, en {duracion:.2f} segundos.'
+        ))
@@ -0,0 +1,20 @@
+# core/management/commands/reconstruir_resumen_ventas.py
+
+import time
+from django.core.management.base import BaseCommand
+
+from core.services.resumen_ventas import reconstruir_resumen
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye el resumen diario de ventas (VentaResumenDiario) a partir del histórico.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Tamaño de lote para la inserción masiva.')
+
+    def handle(self, *args, **kwargs):
+        start_time = time.time()
+        self.stdout.write("Reconstruyendo resumen diario de ventas...")
+        total_filas = reconstruir_resumen(batch_size=kwargs['batch_size'])
+        duracion = time.time() - start_time
+        self.stdout.write(self.style.SUCCESS(f'Resumen reconstruido: {total_filas} filas en {duracion:.2f} segundos.'))
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-18 03:31
+
+import django.db.models.expressions
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_ventaresumendiario_usuario'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='producto',
+            name='deficit',
+            field=models.GeneratedField(db_persist=True, expression=django.db.models.expressions.CombinedExpression(models.F('stock_minimo'), '-', models.F('stock_actual')), help_text='Unidades faltantes para llegar al stock mínimo', output_field=models.IntegerField()),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(fields=['-deficit', 'id'], name='producto_deficit_idx'),
+        ),
+    ]
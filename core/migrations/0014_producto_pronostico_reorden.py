@@ -0,0 +1,33 @@
+# Generated by Django 5.2.6 on 2026-10-18 03:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_producto_deficit'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='producto',
+            name='cantidad_pedido_sugerida',
+            field=models.PositiveIntegerField(blank=True, help_text='Unidades sugeridas por pedido', null=True),
+        ),
+        migrations.AddField(
+            model_name='producto',
+            name='demanda_diaria_pronostico',
+            field=models.DecimalField(blank=True, decimal_places=3, help_text='Demanda diaria pronosticada', max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='producto',
+            name='pronostico_actualizado',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='producto',
+            name='punto_reorden_sugerido',
+            field=models.PositiveIntegerField(blank=True, help_text='Stock al que conviene volver a pedir', null=True),
+        ),
+    ]
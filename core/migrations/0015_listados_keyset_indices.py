@@ -0,0 +1,31 @@
+# Generated by Django 5.2.6 on 2026-10-18 03:35
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_producto_pronostico_reorden'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pedidoproveedor',
+            index=models.Index(fields=['-fecha_pedido', '-id'], name='pedido_fecha_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pedidoproveedor',
+            index=models.Index(fields=['estado', '-fecha_pedido', '-id'], name='pedido_estado_fecha_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='venta',
+            index=models.Index(fields=['-fecha', '-id'], name='venta_fecha_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='venta',
+            index=models.Index(fields=['estado', '-fecha', '-id'], name='venta_estado_fecha_id_idx'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+from django.db import migrations
+
+# SQLite: tabla FTS5 con tokenizador trigram (búsqueda por subcadena, sin distinguir mayúsculas).
+# Se llena aquí y después se mantiene desde core.signals.
+SQLITE_CREAR = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS core_producto_fts USING fts5(nombre, sku, descripcion, tokenize='trigram')",
+    "INSERT INTO core_producto_fts(rowid, nombre, sku, descripcion) SELECT id, nombre, sku, descripcion FROM core_producto",
+]
+SQLITE_ELIMINAR = [
+    "DROP TABLE IF EXISTS core_producto_fts",
+]
+
+# PostgreSQL: índices GIN trigram sobre las expresiones que genera icontains (UPPER(col) LIKE ...).
+POSTGRES_CREAR = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS core_producto_nombre_trgm ON core_producto USING gin (UPPER(nombre) gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS core_producto_sku_trgm ON core_producto USING gin (UPPER(sku) gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS core_producto_descripcion_trgm ON core_producto USING gin (UPPER(descripcion) gin_trgm_ops)",
+]
+POSTGRES_ELIMINAR = [
+    "DROP INDEX IF EXISTS core_producto_nombre_trgm",
+    "DROP INDEX IF EXISTS core_producto_sku_trgm",
+    "DROP INDEX IF EXISTS core_producto_descripcion_trgm",
+]
+
+
+def _ejecutar(schema_editor, sentencias):
+    for sql in sentencias.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql)
+
+
+def crear_indice(apps, schema_editor):
+    _ejecutar(schema_editor, {'sqlite': SQLITE_CREAR, 'postgresql': POSTGRES_CREAR})
+
+
+def eliminar_indice(apps, schema_editor):
+    _ejecutar(schema_editor, {'sqlite': SQLITE_ELIMINAR, 'postgresql': POSTGRES_ELIMINAR})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_listados_keyset_indices'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_indice, eliminar_indice),
+    ]
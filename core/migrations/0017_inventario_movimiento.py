@@ -0,0 +1,33 @@
+# Generated by Django 5.2.6 on 2026-10-18 03:55
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_producto_indice_busqueda'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InventarioMovimiento',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cantidad', models.IntegerField(help_text='Unidades que entran (+) o salen (-)')),
+                ('tipo', models.CharField(choices=[('VENTA', 'Venta completada'), ('VENTA_REVERTIDA', 'Venta revertida'), ('RECEPCION', 'Recepción de pedido'), ('RECEPCION_REVERTIDA', 'Recepción revertida'), ('ENTREGA', 'Nota de entrega'), ('ENTREGA_REVERTIDA', 'Nota de entrega revertida'), ('AJUSTE', 'Ajuste')], max_length=20)),
+                ('fecha', models.DateTimeField(default=django.utils.timezone.now)),
+                ('nota_entrega', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='movimientos_inventario', to='core.notaentregaventa')),
+                ('pedido', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='movimientos_inventario', to='core.pedidoproveedor')),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='movimientos', to='core.producto')),
+                ('venta', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='movimientos_inventario', to='core.venta')),
+            ],
+            options={
+                'verbose_name': 'Movimiento de Inventario',
+                'verbose_name_plural': 'Movimientos de Inventario',
+                'indexes': [models.Index(fields=['producto', 'fecha'], name='core_invent_product_269590_idx'), models.Index(fields=['fecha'], name='core_invent_fecha_88e08e_idx')],
+            },
+        ),
+    ]
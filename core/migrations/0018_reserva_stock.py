@@ -0,0 +1,39 @@
+# Generated by Django 5.2.6 on 2026-10-18 04:07
+
+import django.db.models.deletion
+import django.db.models.expressions
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_inventario_movimiento'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='producto',
+            name='stock_reservado',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.CreateModel(
+            name='ReservaStock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cantidad', models.PositiveIntegerField()),
+                ('expira', models.DateTimeField(db_index=True)),
+                ('detalle', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='reserva', to='core.ventadetalle')),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservas', to='core.producto')),
+            ],
+            options={
+                'verbose_name': 'Reserva de Stock',
+                'verbose_name_plural': 'Reservas de Stock',
+            },
+        ),
+        migrations.AddField(
+            model_name='producto',
+            name='stock_disponible',
+            field=models.GeneratedField(db_persist=True, expression=django.db.models.expressions.CombinedExpression(models.F('stock_actual'), '-', models.F('stock_reservado')), help_text='Stock menos las unidades reservadas por cotizaciones y borradores', output_field=models.IntegerField()),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 04:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_clave_idempotencia'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='venta',
+            name='uuid_cliente',
+            field=models.UUIDField(blank=True, editable=False, null=True, unique=True),
+        ),
+    ]
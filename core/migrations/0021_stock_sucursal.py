@@ -0,0 +1,44 @@
+# Generated by Django 5.2.6 on 2026-10-18 04:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0020_venta_uuid_cliente'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inventariomovimiento',
+            name='sucursal',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='movimientos_inventario', to='core.sucursal'),
+        ),
+        migrations.AddField(
+            model_name='pedidoproveedor',
+            name='sucursal',
+            field=models.ForeignKey(blank=True, help_text='Sucursal que recibe la mercancía; sin sucursal solo cambia el stock global', null=True, on_delete=django.db.models.deletion.PROTECT, related_name='pedidos', to='core.sucursal'),
+        ),
+        migrations.AddField(
+            model_name='venta',
+            name='sucursal',
+            field=models.ForeignKey(blank=True, help_text='Sucursal de la que sale la mercancía; sin sucursal solo cambia el stock global', null=True, on_delete=django.db.models.deletion.PROTECT, related_name='ventas', to='core.sucursal'),
+        ),
+        migrations.CreateModel(
+            name='StockSucursal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cantidad', models.PositiveIntegerField(default=0)),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_sucursales', to='core.producto')),
+                ('sucursal', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock', to='core.sucursal')),
+            ],
+            options={
+                'verbose_name': 'Stock por Sucursal',
+                'verbose_name_plural': 'Stock por Sucursal',
+                'indexes': [models.Index(fields=['sucursal', 'producto', 'cantidad'], name='stock_sucursal_cantidad_idx')],
+                'constraints': [models.UniqueConstraint(fields=('sucursal', 'producto'), name='stock_sucursal_unico')],
+            },
+        ),
+    ]
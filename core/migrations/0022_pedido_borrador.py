@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 04:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0021_stock_sucursal'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='pedidoproveedor',
+            name='estado',
+            field=models.CharField(choices=[('BORRADOR', 'Borrador'), ('PENDIENTE', 'Pendiente'), ('RECIBIDO', 'Recibido'), ('CANCELADO', 'Cancelado'), ('PAGANDO', 'Pagando')], default='PENDIENTE', max_length=20),
+        ),
+    ]
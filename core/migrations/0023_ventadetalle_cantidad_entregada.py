@@ -0,0 +1,35 @@
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def llenar_cantidad_entregada(apps, schema_editor):
+    """Lo entregado hasta hoy, sumado de las notas aplicadas en una consulta agrupada."""
+    VentaDetalle = apps.get_model('core', 'VentaDetalle')
+    DetalleNotaEntrega = apps.get_model('core', 'DetalleNotaEntrega')
+    entregado = {
+        (venta_id, producto_id): total
+        for venta_id, producto_id, total in DetalleNotaEntrega.objects.filter(
+            nota_entrega__descuento_inventario_aplicado=True
+        ).order_by().values_list('nota_entrega__venta_id', 'producto_id').annotate(total=Sum('cantidad_entregada'))
+    }
+    detalles = []
+    for detalle in VentaDetalle.objects.filter(venta__notas_entrega__descuento_inventario_aplicado=True).distinct():
+        detalle.cantidad_entregada = entregado.get((detalle.venta_id, detalle.producto_id), 0)
+        detalles.append(detalle)
+    VentaDetalle.objects.bulk_update(detalles, ['cantidad_entregada'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0022_pedido_borrador'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ventadetalle',
+            name='cantidad_entregada',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Unidades ya entregadas con notas de entrega aplicadas'),
+        ),
+        migrations.RunPython(llenar_cantidad_entregada, migrations.RunPython.noop),
+    ]
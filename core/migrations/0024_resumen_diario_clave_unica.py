@@ -0,0 +1,43 @@
+# Generated by Django 5.2.6 on 2026-10-18 05:04
+
+import django.db.models.functions.comparison
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fusionar_duplicados(apps, schema_editor):
+    """Suma en una sola fila las filas repetidas del resumen que hayan dejado dos altas simultáneas."""
+    VentaResumenDiario = apps.get_model('core', 'VentaResumenDiario')
+    primeras, fusionadas, sobrantes = {}, {}, []
+    for fila in VentaResumenDiario.objects.order_by('id'):
+        clave = (fila.fecha, fila.producto_id, fila.cliente_id, fila.usuario_id)
+        primera = primeras.setdefault(clave, fila)
+        if primera is not fila:
+            primera.num_ventas += fila.num_ventas
+            primera.unidades += fila.unidades
+            primera.ingresos += fila.ingresos
+            primera.costo += fila.costo
+            fusionadas[clave] = primera
+            sobrantes.append(fila.id)
+    if not sobrantes:
+        return
+    VentaResumenDiario.objects.bulk_update(
+        fusionadas.values(), ['num_ventas', 'unidades', 'ingresos', 'costo'], batch_size=500
+    )
+    VentaResumenDiario.objects.filter(id__in=sobrantes).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0023_ventadetalle_cantidad_entregada'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(fusionar_duplicados, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='ventaresumendiario',
+            constraint=models.UniqueConstraint(models.F('fecha'), django.db.models.functions.comparison.Coalesce('producto', models.Value(0), output_field=models.BigIntegerField()), django.db.models.functions.comparison.Coalesce('cliente', models.Value(0), output_field=models.BigIntegerField()), django.db.models.functions.comparison.Coalesce('usuario', models.Value(0), output_field=models.BigIntegerField()), name='resumen_diario_clave_unica'),
+        ),
+    ]
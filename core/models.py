@@ -1,8 +1,12 @@
 # core/models.py
 
-from django.db import models, transaction
+from django.db import models
+from django.db.models.functions import Coalesce
 from django.conf import settings
 from django.core.exceptions import ValidationError
+from django.utils import timezone
+
+from core.transacciones import atomic_escritura
 
 # --- Modelos ---
 
@@ -23,6 +27,8 @@ class Producto(models.Model):
     categoria = models.ForeignKey(Categoria, on_delete=models.SET_NULL, null=True, blank=True)
     descripcion = models.TextField(blank=True)
     stock_actual = models.PositiveIntegerField(default=0)
+    # Suma de las reservas vigentes (ReservaStock); solo la cambia core.services.inventario.ajustar_reservado
+    stock_reservado = models.PositiveIntegerField(default=0, editable=False)
     stock_minimo = models.PositiveIntegerField(default=5, help_text="Umbral para alertas de stock bajo")
     precio_venta = models.DecimalField(max_digits=10, decimal_places=2)
     costo_unitario = models.DecimalField(max_digits=10, decimal_places=2, default=0)
@@ -31,6 +37,52 @@ class Producto(models.Model):
     peso_kg = models.DecimalField(max_digits=6, decimal_places=2, default=0, help_text="Peso en kilogramos")
     volumen_m3 = models.DecimalField(max_digits=6, decimal_places=3, default=0, help_text="Volumen en metros cúbicos")
 
+    # Calculado por la base de datos en cada escritura (incluidos update() y F()).
+    # deficit >= 0 equivale a stock_actual <= stock_minimo.
+    deficit = models.GeneratedField(
+        expression=models.F('stock_minimo') - models.F('stock_actual'),
+        output_field=models.IntegerField(),
+        db_persist=True,
+        help_text="Unidades faltantes para llegar al stock mínimo"
+    )
+    stock_disponible = models.GeneratedField(
+        expression=models.F('stock_actual') - models.F('stock_reservado'),
+        output_field=models.IntegerField(),
+        db_persist=True,
+        help_text="Stock menos las unidades reservadas por cotizaciones y borradores"
+    )
+
+    # Sugerencias calculadas por el comando calcular_puntos_reorden
+    demanda_diaria_pronostico = models.DecimalField(max_digits=10, decimal_places=3, null=True, blank=True, help_text="Demanda diaria pronosticada")
+    punto_reorden_sugerido = models.PositiveIntegerField(null=True, blank=True, help_text="Stock al que conviene volver a pedir")
+    cantidad_pedido_sugerida = models.PositiveIntegerField(null=True, blank=True, help_text="Unidades sugeridas por pedido")
+    pronostico_actualizado = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-deficit', 'id'], name='producto_deficit_idx'),
+        ]
+
+    CAMPOS_BUSQUEDA = ('nombre', 'sku', 'descripcion')
+    _texto_indexado = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Para reindexar la búsqueda solo si cambia el texto (ver core.signals)
+        self._texto_indexado = self.texto_busqueda()
+
+    def save(self, *args, **kwargs):
+        # Un formulario con una instancia leída antes no debe pisar las reservas hechas entretanto
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                campo.name for campo in self._meta.concrete_fields
+                if not campo.primary_key and not campo.generated and campo.name != 'stock_reservado'
+            ]
+        super().save(*args, **kwargs)
+
+    def texto_busqueda(self):
+        return tuple(self.__dict__.get(campo) for campo in self.CAMPOS_BUSQUEDA)
+
     def __str__(self):
         return f"{self.nombre} ({self.sku})"
 
@@ -87,6 +139,12 @@ class Venta(models.Model):
     usuario = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.PROTECT, help_text="Usuario que realizó la venta")
     estado = models.CharField(max_length=30, choices=ESTADO_CHOICES, default='COMPLETADA')
     monto_total = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False)
+    # Generado por el punto de venta al vender sin conexión: la sincronización no registra dos veces la misma venta
+    uuid_cliente = models.UUIDField(null=True, blank=True, unique=True, editable=False)
+    sucursal = models.ForeignKey(
+        'Sucursal', on_delete=models.PROTECT, null=True, blank=True, related_name='ventas',
+        help_text="Sucursal de la que sale la mercancía; sin sucursal solo cambia el stock global"
+    )
     
     # Campos para domicilios
     requiere_domicilio = models.BooleanField(default=False, help_text="Indica si requiere entrega a domicilio")
@@ -111,6 +169,13 @@ class Venta(models.Model):
     
     _estado_anterior = None
 
+    class Meta:
+        indexes = [
+            # Paginación por cursor del listado de ventas, con y sin filtro de estado
+            models.Index(fields=['-fecha', '-id'], name='venta_fecha_id_idx'),
+            models.Index(fields=['estado', '-fecha', '-id'], name='venta_estado_fecha_id_idx'),
+        ]
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self._estado_anterior = self.estado
@@ -126,21 +191,36 @@ class Venta(models.Model):
         return None
 
     def save(self, *args, **kwargs):
+        from core.services.inventario import registrar_movimientos
+        from core.services.resumen_ventas import registrar_venta
+        from core.services.reservas import ESTADOS_CON_RESERVA, liberar_venta, reservar
+
+        es_nueva = self.pk is None
         # Ajustes de stock solo cuando cambia estado respecto a COMPLETADA
         if self.pk is not None:
-            with transaction.atomic():
+            with atomic_escritura():
+                reservaba = self._estado_anterior in ESTADOS_CON_RESERVA
+                reserva = self.estado in ESTADOS_CON_RESERVA
+                if reservaba and not reserva:
+                    liberar_venta(self)
+                lineas = self.detalles.values_list('producto_id', 'cantidad')
                 if self.estado == 'COMPLETADA' and self._estado_anterior != 'COMPLETADA':
-                    for detalle in self.detalles.all():
-                        if detalle.producto.stock_actual < detalle.cantidad:
-                            raise ValidationError(f"No hay stock suficiente para el producto: {detalle.producto.nombre}")
-                        detalle.producto.stock_actual -= detalle.cantidad
-                        detalle.producto.save()
+                    registrar_movimientos(
+                        'VENTA', [(producto_id, -cantidad) for producto_id, cantidad in lineas],
+                        respetar_reservas=True, venta=self, sucursal_id=self.sucursal_id
+                    )
                 elif self.estado != 'COMPLETADA' and self._estado_anterior == 'COMPLETADA':
-                    for detalle in self.detalles.all():
-                        detalle.producto.stock_actual += detalle.cantidad
-                        detalle.producto.save()
+                    registrar_movimientos('VENTA_REVERTIDA', lineas, venta=self, sucursal_id=self.sucursal_id)
+                if reserva and not reservaba:
+                    reservar(self.detalles.all())
 
         super().save(*args, **kwargs)
+
+        # Mantener el resumen diario cuando la venta entra o sale de COMPLETADA
+        if self.estado == 'COMPLETADA' and (es_nueva or self._estado_anterior != 'COMPLETADA'):
+            registrar_venta(self, 1)
+        elif not es_nueva and self.estado != 'COMPLETADA' and self._estado_anterior == 'COMPLETADA':
+            registrar_venta(self, -1)
         self._estado_anterior = self.estado
     
     @property
@@ -161,45 +241,42 @@ class Venta(models.Model):
         Retorna la cantidad total entregada de un producto específico
         según las notas de entrega aplicadas.
         """
-        from django.db.models import Sum
-        total = self.notas_entrega.filter(
-            descuento_inventario_aplicado=True,
-            detalles_entrega__producto=producto
-        ).aggregate(
-            total=Sum('detalles_entrega__cantidad_entregada')
-        )['total']
-        return total or 0
+        entregada = self.detalles.filter(producto=producto).values_list('cantidad_entregada', flat=True).first()
+        return entregada or 0
     
     def cantidad_pendiente_producto(self, producto):
         """
         Retorna la cantidad pendiente de entregar de un producto específico.
         """
         try:
-            detalle_venta = self.detalles.get(producto=producto)
-            cantidad_total = detalle_venta.cantidad
-            cantidad_entregada = self.cantidad_entregada_producto(producto)
-            return cantidad_total - cantidad_entregada
+            return self.detalles.get(producto=producto).cantidad_pendiente
         except VentaDetalle.DoesNotExist:
             return 0
     
+    def pendientes_por_producto(self):
+        """{producto_id: cantidad pendiente de entregar} de todas las líneas, en una consulta."""
+        return {
+            producto_id: cantidad - entregada
+            for producto_id, cantidad, entregada in self.detalles.values_list('producto_id', 'cantidad', 'cantidad_entregada')
+        }
+    
     @property
     def resumen_entregas(self):
         """
         Retorna un resumen de entregas por producto.
         Formato: lista de diccionarios con info de cada producto.
+        Una sola consulta: lo entregado viene de VentaDetalle.cantidad_entregada.
         """
         resumen = []
-        for detalle in self.detalles.all():
-            producto = detalle.producto
+        for detalle in self.detalles.select_related('producto'):
             cantidad_total = detalle.cantidad
-            cantidad_entregada = self.cantidad_entregada_producto(producto)
-            cantidad_pendiente = cantidad_total - cantidad_entregada
+            cantidad_entregada = detalle.cantidad_entregada
             
             resumen.append({
-                'producto': producto,
+                'producto': detalle.producto,
                 'cantidad_total': cantidad_total,
                 'cantidad_entregada': cantidad_entregada,
-                'cantidad_pendiente': cantidad_pendiente,
+                'cantidad_pendiente': detalle.cantidad_pendiente,
                 'porcentaje_entregado': (cantidad_entregada / cantidad_total * 100) if cantidad_total > 0 else 0
             })
         
@@ -210,12 +287,7 @@ class Venta(models.Model):
         """Indica si todos los productos de la venta han sido entregados completamente"""
         if not self.tiene_notas_entrega:
             return False
-        
-        for item in self.resumen_entregas:
-            if item['cantidad_pendiente'] > 0:
-                return False
-        
-        return True
+        return not self.detalles.filter(cantidad_entregada__lt=models.F('cantidad')).exists()
 
     @property
     def peso_total_kg(self):
@@ -237,37 +309,124 @@ class VentaDetalle(models.Model):
     producto = models.ForeignKey(Producto, on_delete=models.PROTECT)
     cantidad = models.PositiveIntegerField()
     precio_unitario_venta = models.DecimalField(max_digits=10, decimal_places=2, help_text="Precio al momento de la venta")
+    # Mantenida por NotaEntregaVenta con core.services.entregas
+    cantidad_entregada = models.PositiveIntegerField(
+        default=0, editable=False, help_text="Unidades ya entregadas con notas de entrega aplicadas"
+    )
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Valores persistidos, para aplicar solo la diferencia en el resumen diario
+        if self.pk is not None:
+            valores = self.__dict__
+            self._valores_anteriores = (valores.get('producto_id'), valores.get('cantidad'), valores.get('precio_unitario_venta'))
+        else:
+            self._valores_anteriores = None
+
+    @atomic_escritura()
     def save(self, *args, **kwargs):
+        from core.services.inventario import registrar_movimientos
+        from core.services.resumen_ventas import registrar_cambio_detalle
+        from core.services.reservas import ESTADOS_CON_RESERVA, reservar
+
         if not self.precio_unitario_venta:
             self.precio_unitario_venta = self.producto.precio_venta
         
         # Si la venta está COMPLETADA y estamos creando el detalle, descontar stock
         es_nuevo = self.pk is None
+        # Una instancia leída antes no debe pisar las entregas registradas entretanto
+        if not es_nuevo and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                campo.name for campo in self._meta.concrete_fields
+                if not campo.primary_key and campo.name != 'cantidad_entregada'
+            ]
         super().save(*args, **kwargs)
         
         if es_nuevo and self.venta.estado == 'COMPLETADA':
-            if self.producto.stock_actual < self.cantidad:
-                raise ValidationError(f"No hay stock suficiente para {self.producto.nombre}")
-            self.producto.stock_actual -= self.cantidad
-            self.producto.save()
+            registrar_movimientos(
+                'VENTA', [(self.producto_id, -self.cantidad)], respetar_reservas=True,
+                venta=self.venta, sucursal_id=self.venta.sucursal_id
+            )
         
-        # Recalcular total de la venta
-        venta = self.venta
-        total = sum(d.cantidad * d.precio_unitario_venta for d in venta.detalles.all())
-        venta.monto_total = total
-        venta.save()
+        if self.venta.estado == 'COMPLETADA':
+            registrar_cambio_detalle(self, self._valores_anteriores)
+        elif self.venta.estado in ESTADOS_CON_RESERVA:
+            reservar([self])
+        
+        # Total de la venta: solo la diferencia de esta línea (las ventas nuevas
+        # completas se crean con core.services.ventas.VentaService)
+        anterior = self._valores_anteriores
+        delta = self.subtotal - ((anterior[1] or 0) * (anterior[2] or 0) if anterior else 0)
+        if delta:
+            Venta.objects.filter(pk=self.venta_id).update(monto_total=models.F('monto_total') + delta)
+            self.venta.monto_total += delta
+        self._valores_anteriores = (self.producto_id, self.cantidad, self.precio_unitario_venta)
 
     @property
     def subtotal(self):
         return self.cantidad * self.precio_unitario_venta
 
+    @property
+    def cantidad_pendiente(self):
+        return self.cantidad - self.cantidad_entregada
+
+    @property
+    def cantidad_sin_reserva(self):
+        """Unidades de una línea en COTIZACION o BORRADOR que no se pudieron apartar por falta de stock."""
+        from core.services.reservas import ESTADOS_CON_RESERVA
+
+        if self.venta.estado not in ESTADOS_CON_RESERVA:
+            return 0
+        reserva = getattr(self, 'reserva', None)
+        return self.cantidad - (reserva.cantidad if reserva else 0)
+
     def __str__(self):
         return f"{self.cantidad} x {self.producto.nombre}"
 
 
+class VentaResumenDiario(models.Model):
+    """
+    Acumulado diario de ventas COMPLETADAS, mantenido de forma incremental.
+
+    Las filas con producto se agregan por (fecha, producto, cliente, usuario) y
+    cuentan líneas de venta. Las filas sin producto son el total por venta de
+    cada (fecha, cliente, usuario) y son las que se usan para contar ventas y montos.
+    """
+    fecha = models.DateField()
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    cliente = models.ForeignKey(Cliente, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    usuario = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    num_ventas = models.IntegerField(default=0)
+    unidades = models.IntegerField(default=0)
+    ingresos = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    costo = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name = "Resumen Diario de Ventas"
+        verbose_name_plural = "Resúmenes Diarios de Ventas"
+        indexes = [
+            models.Index(fields=['fecha', 'producto']),
+            models.Index(fields=['fecha', 'cliente']),
+            models.Index(fields=['fecha', 'usuario']),
+        ]
+        constraints = [
+            # Una fila por clave; los NULL cuentan como 0 para que dos totales sin cliente choquen
+            models.UniqueConstraint(
+                'fecha',
+                Coalesce('producto', models.Value(0), output_field=models.BigIntegerField()),
+                Coalesce('cliente', models.Value(0), output_field=models.BigIntegerField()),
+                Coalesce('usuario', models.Value(0), output_field=models.BigIntegerField()),
+                name='resumen_diario_clave_unica',
+            ),
+        ]
+
+    def __str__(self):
+        return f"Resumen {self.fecha} - Producto #{self.producto_id} - Cliente #{self.cliente_id}"
+
+
 class PedidoProveedor(models.Model):
     ESTADO_CHOICES = [
+        ('BORRADOR', 'Borrador'),
         ('PENDIENTE', 'Pendiente'),
         ('RECIBIDO', 'Recibido'),
         ('CANCELADO', 'Cancelado'),
@@ -278,8 +437,19 @@ class PedidoProveedor(models.Model):
     fecha_pedido = models.DateTimeField(auto_now_add=True)
     estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default='PENDIENTE')
     costo_total = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False)
+    sucursal = models.ForeignKey(
+        'Sucursal', on_delete=models.PROTECT, null=True, blank=True, related_name='pedidos',
+        help_text="Sucursal que recibe la mercancía; sin sucursal solo cambia el stock global"
+    )
     _estado_anterior = None
 
+    class Meta:
+        indexes = [
+            # Paginación por cursor del listado de pedidos, con y sin filtro de estado
+            models.Index(fields=['-fecha_pedido', '-id'], name='pedido_fecha_id_idx'),
+            models.Index(fields=['estado', '-fecha_pedido', '-id'], name='pedido_estado_fecha_id_idx'),
+        ]
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self._estado_anterior = self.estado
@@ -288,28 +458,50 @@ class PedidoProveedor(models.Model):
         return f"Pedido a {self.proveedor.nombre} - {self.fecha_pedido.strftime('%d/%m/%Y')}"
 
     def save(self, *args, **kwargs):
+        from core.services.inventario import registrar_movimientos
+        from core.services.pedidos import registrar_recepcion
+
         if self.pk is not None:
-            with transaction.atomic():
+            with atomic_escritura():
                 if self.estado == 'RECIBIDO' and self._estado_anterior != 'RECIBIDO':
-                    for detalle in self.detalles_pedido.all():
-                        detalle.producto.stock_actual += detalle.cantidad
-                        detalle.producto.save()
+                    registrar_recepcion([self])
                 elif self.estado != 'RECIBIDO' and self._estado_anterior == 'RECIBIDO':
-                    for detalle in self.detalles_pedido.all():
-                        if detalle.producto.stock_actual >= detalle.cantidad:
-                            detalle.producto.stock_actual -= detalle.cantidad
-                            detalle.producto.save()
+                    lineas = list(self.detalles_pedido.values_list('producto_id', 'cantidad'))
+                    # Solo se retira lo que aún hay en stock de cada producto (y en la sucursal)
+                    producto_ids = {producto_id for producto_id, _ in lineas}
+                    stock = dict(
+                        Producto.objects.select_for_update().filter(id__in=producto_ids)
+                        .values_list('id', 'stock_actual')
+                    )
+                    if self.sucursal_id:
+                        en_sucursal = dict(
+                            StockSucursal.objects.select_for_update()
+                            .filter(sucursal_id=self.sucursal_id, producto_id__in=producto_ids)
+                            .values_list('producto_id', 'cantidad')
+                        )
+                        stock = {producto_id: min(total, en_sucursal.get(producto_id, 0)) for producto_id, total in stock.items()}
+                    retiros = []
+                    for producto_id, cantidad in lineas:
+                        if stock[producto_id] >= cantidad:
+                            stock[producto_id] -= cantidad
+                            retiros.append((producto_id, -cantidad))
+                    registrar_movimientos('RECEPCION_REVERTIDA', retiros, pedido=self, sucursal_id=self.sucursal_id)
         super().save(*args, **kwargs)
         self._estado_anterior = self.estado
 
     @property
     def total_pagado(self):
+        # Anotado por core.services.cuentas_por_pagar.con_saldos(); si no, una consulta
+        if 'pagado' in self.__dict__:
+            return self.pagado
         from django.db.models import Sum
         total = self.pagos.aggregate(s=Sum('monto')).get('s') if hasattr(self, 'pagos') else None
         return total or 0
 
     @property
     def saldo_pendiente(self):
+        if 'saldo' in self.__dict__:
+            return self.saldo
         return (self.costo_total or 0) - self.total_pagado
 
 
@@ -319,14 +511,18 @@ class PedidoDetalle(models.Model):
     cantidad = models.PositiveIntegerField()
     costo_unitario_compra = models.DecimalField(max_digits=10, decimal_places=2)
 
+    @atomic_escritura()
     def save(self, *args, **kwargs):
+        from core.services.inventario import registrar_movimientos
+
         # Si el pedido está RECIBIDO y estamos creando el detalle, incrementar stock
         es_nuevo = self.pk is None
         super().save(*args, **kwargs)
         
         if es_nuevo and self.pedido.estado == 'RECIBIDO':
-            self.producto.stock_actual += self.cantidad
-            self.producto.save()
+            registrar_movimientos(
+                'RECEPCION', [(self.producto_id, self.cantidad)], pedido=self.pedido, sucursal_id=self.pedido.sucursal_id
+            )
         
         # Recalcular total del pedido
         pedido = self.pedido
@@ -562,19 +758,21 @@ class NotaEntregaVenta(models.Model):
         Aplica el descuento de inventario según los detalles de esta nota.
         Solo se ejecuta si no se ha aplicado previamente.
         """
+        from core.services.entregas import registrar_entrega
+        from core.services.inventario import registrar_movimientos
+        from core.services.reservas import consumir
+
         if self.descuento_inventario_aplicado:
             return False
         
-        with transaction.atomic():
-            for detalle in self.detalles_entrega.all():
-                producto = detalle.producto
-                if producto.stock_actual < detalle.cantidad_entregada:
-                    raise ValidationError(
-                        f"No hay stock suficiente de {producto.nombre}. "
-                        f"Stock actual: {producto.stock_actual}, Solicitado: {detalle.cantidad_entregada}"
-                    )
-                producto.stock_actual -= detalle.cantidad_entregada
-                producto.save()
+        with atomic_escritura():
+            lineas = list(self.detalles_entrega.values_list('producto_id', 'cantidad_entregada'))
+            # Lo entregado de un borrador deja de estar reservado
+            consumir(self.venta_id, lineas)
+            registrar_movimientos('ENTREGA', [
+                (producto_id, -cantidad) for producto_id, cantidad in lineas
+            ], nota_entrega=self, sucursal_id=self.venta.sucursal_id)
+            registrar_entrega(self.venta_id, lineas)
             
             self.descuento_inventario_aplicado = True
             self.save()
@@ -586,14 +784,18 @@ class NotaEntregaVenta(models.Model):
         Revierte el descuento de inventario (devuelve el stock).
         Útil si se cancela o corrige una nota de entrega.
         """
+        from core.services.entregas import registrar_entrega
+        from core.services.inventario import registrar_movimientos
+
         if not self.descuento_inventario_aplicado:
             return False
         
-        with transaction.atomic():
-            for detalle in self.detalles_entrega.all():
-                producto = detalle.producto
-                producto.stock_actual += detalle.cantidad_entregada
-                producto.save()
+        with atomic_escritura():
+            lineas = list(self.detalles_entrega.values_list('producto_id', 'cantidad_entregada'))
+            registrar_movimientos(
+                'ENTREGA_REVERTIDA', lineas, nota_entrega=self, sucursal_id=self.venta.sucursal_id
+            )
+            registrar_entrega(self.venta_id, lineas, signo=-1)
             
             self.descuento_inventario_aplicado = False
             self.save()
@@ -638,16 +840,12 @@ class DetalleNotaEntrega(models.Model):
                 f"El producto {self.producto.nombre} no está en esta venta"
             )
         
-        # Calcular cuánto se ha entregado previamente
-        cantidad_ya_entregada = DetalleNotaEntrega.objects.filter(
-            nota_entrega__venta=venta,
-            producto=self.producto,
-            nota_entrega__descuento_inventario_aplicado=True
-        ).exclude(
-            id=self.id  # Excluir esta misma instancia si es una edición
-        ).aggregate(
-            total=models.Sum('cantidad_entregada')
-        )['total'] or 0
+        # Lo entregado previamente, sin esta misma línea si es una edición de una nota ya aplicada
+        cantidad_ya_entregada = detalle_venta.cantidad_entregada
+        if self.pk and self.nota_entrega.descuento_inventario_aplicado:
+            cantidad_ya_entregada -= DetalleNotaEntrega.objects.filter(pk=self.pk, producto=self.producto).values_list(
+                'cantidad_entregada', flat=True
+            ).first() or 0
         
         cantidad_pendiente = detalle_venta.cantidad - cantidad_ya_entregada
         
@@ -661,3 +859,110 @@ class DetalleNotaEntrega(models.Model):
     def save(self, *args, **kwargs):
         self.full_clean()
         super().save(*args, **kwargs)
+
+
+# === MÓDULO DE INVENTARIO ===
+
+class InventarioMovimiento(models.Model):
+    """
+    Registro de solo inserción de cada cambio de stock.
+    Se escribe únicamente desde core.services.inventario junto con el UPDATE
+    de Producto.stock_actual, de modo que el stock a cualquier fecha es el
+    stock actual menos los movimientos posteriores.
+    """
+    TIPO_CHOICES = [
+        ('VENTA', 'Venta completada'),
+        ('VENTA_REVERTIDA', 'Venta revertida'),
+        ('RECEPCION', 'Recepción de pedido'),
+        ('RECEPCION_REVERTIDA', 'Recepción revertida'),
+        ('ENTREGA', 'Nota de entrega'),
+        ('ENTREGA_REVERTIDA', 'Nota de entrega revertida'),
+        ('AJUSTE', 'Ajuste'),
+    ]
+
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE, related_name='movimientos')
+    cantidad = models.IntegerField(help_text="Unidades que entran (+) o salen (-)")
+    tipo = models.CharField(max_length=20, choices=TIPO_CHOICES)
+    fecha = models.DateTimeField(default=timezone.now)
+    venta = models.ForeignKey(Venta, on_delete=models.SET_NULL, null=True, blank=True, related_name='movimientos_inventario')
+    pedido = models.ForeignKey(PedidoProveedor, on_delete=models.SET_NULL, null=True, blank=True, related_name='movimientos_inventario')
+    nota_entrega = models.ForeignKey(NotaEntregaVenta, on_delete=models.SET_NULL, null=True, blank=True, related_name='movimientos_inventario')
+    sucursal = models.ForeignKey(Sucursal, on_delete=models.SET_NULL, null=True, blank=True, related_name='movimientos_inventario')
+
+    class Meta:
+        verbose_name = "Movimiento de Inventario"
+        verbose_name_plural = "Movimientos de Inventario"
+        indexes = [
+            models.Index(fields=['producto', 'fecha']),
+            models.Index(fields=['fecha']),
+        ]
+
+    def __str__(self):
+        return f"{self.get_tipo_display()}: {self.cantidad:+d} x producto #{self.producto_id}"
+
+
+class StockSucursal(models.Model):
+    """
+    Unidades de un producto en una sucursal. Se mueve desde
+    core.services.inventario junto con Producto.stock_actual, que sigue
+    siendo el total de la empresa, con los movimientos que traen sucursal.
+    """
+    sucursal = models.ForeignKey(Sucursal, on_delete=models.CASCADE, related_name='stock')
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE, related_name='stock_sucursales')
+    cantidad = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Stock por Sucursal"
+        verbose_name_plural = "Stock por Sucursal"
+        constraints = [
+            models.UniqueConstraint(fields=['sucursal', 'producto'], name='stock_sucursal_unico'),
+        ]
+        indexes = [
+            # Índice cubriente: la disponibilidad de una sucursal se lee sin tocar la tabla
+            models.Index(fields=['sucursal', 'producto', 'cantidad'], name='stock_sucursal_cantidad_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.cantidad} x producto #{self.producto_id} en sucursal #{self.sucursal_id}"
+
+
+class ReservaStock(models.Model):
+    """
+    Unidades apartadas por una línea de una venta en COTIZACION o BORRADOR
+    hasta `expira`. Se crean y liberan desde core.services.reservas, que
+    mantiene Producto.stock_reservado con la suma de las vigentes.
+    """
+    detalle = models.OneToOneField(VentaDetalle, on_delete=models.CASCADE, related_name='reserva')
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE, related_name='reservas')
+    cantidad = models.PositiveIntegerField()
+    expira = models.DateTimeField(db_index=True)
+
+    class Meta:
+        verbose_name = "Reserva de Stock"
+        verbose_name_plural = "Reservas de Stock"
+
+    def __str__(self):
+        return f"{self.cantidad} x producto #{self.producto_id} hasta {self.expira:%d/%m/%Y %H:%M}"
+
+
+class ClaveIdempotencia(models.Model):
+    """
+    Clave que el punto de venta envía con cada venta para que un reintento
+    del mismo envío devuelva el resultado original en lugar de crear otra
+    venta (ver core.services.idempotencia).
+    """
+    usuario = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    clave = models.CharField(max_length=64)
+    venta = models.ForeignKey(Venta, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    respuesta = models.JSONField(null=True, blank=True, help_text="Respuesta original, para repetirla en los reintentos")
+    creada = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        verbose_name = "Clave de Idempotencia"
+        verbose_name_plural = "Claves de Idempotencia"
+        constraints = [
+            models.UniqueConstraint(fields=['usuario', 'clave'], name='clave_idempotencia_unica'),
+        ]
+
+    def __str__(self):
+        return f"{self.clave} ({self.usuario_id})"
@@ -0,0 +1,99 @@
+"""
+Paginación por cursor (keyset) para listados ordenados por (-fecha, -id).
+
+En lugar de OFFSET, cada página se pide a partir de la fecha e id de la
+última (o primera) fila de la página anterior, de modo que con un índice
+compuesto (fecha, id) cualquier página cuesta lo mismo que la primera.
+"""
+import base64
+import json
+from dataclasses import dataclass
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+TAMANO_PAGINA = 50
+
+
+@dataclass
+class PaginaKeyset:
+    object_list: list
+    cursor_siguiente: str = None
+    cursor_anterior: str = None
+
+    @property
+    def has_next(self):
+        return self.cursor_siguiente is not None
+
+    @property
+    def has_previous(self):
+        return self.cursor_anterior is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def codificar_cursor(fecha, pk):
+    datos = json.dumps([fecha.isoformat(), pk]).encode()
+    return base64.urlsafe_b64encode(datos).decode().rstrip('=')
+
+
+def decodificar_cursor(cursor):
+    """Devuelve (fecha, id) o None si el cursor no es válido."""
+    try:
+        datos = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        fecha, pk = json.loads(datos)
+        fecha = parse_datetime(fecha)
+        if fecha is None:
+            return None
+        return fecha, int(pk)
+    except (ValueError, TypeError):
+        return None
+
+
+def paginar_keyset(queryset, campo_fecha, despues=None, antes=None, tamano=TAMANO_PAGINA):
+    """
+    Devuelve una PaginaKeyset del queryset ordenado por (-campo_fecha, -id).
+    `despues` pide la página siguiente a un cursor y `antes` la anterior;
+    sin cursor (o con uno inválido) se devuelve la primera página.
+    """
+    posicion = decodificar_cursor(despues) if despues else None
+    hacia_atras = False
+    if posicion is None and antes:
+        posicion = decodificar_cursor(antes)
+        hacia_atras = posicion is not None
+
+    if posicion is None:
+        filas = list(queryset.order_by(f'-{campo_fecha}', '-id')[:tamano + 1])
+        hay_mas, filas = len(filas) > tamano, filas[:tamano]
+        return _pagina(filas, campo_fecha, siguiente=hay_mas, anterior=False)
+
+    fecha, pk = posicion
+    if hacia_atras:
+        # La condición sobre la fecha sola permite recorrer el índice por rango
+        filas = list(queryset.filter(
+            Q(**{f'{campo_fecha}__gte': fecha}) & (Q(**{f'{campo_fecha}__gt': fecha}) | Q(id__gt=pk))
+        ).order_by(campo_fecha, 'id')[:tamano + 1])
+        hay_mas, filas = len(filas) > tamano, filas[:tamano]
+        filas.reverse()
+        return _pagina(filas, campo_fecha, siguiente=True, anterior=hay_mas)
+
+    filas = list(queryset.filter(
+        Q(**{f'{campo_fecha}__lte': fecha}) & (Q(**{f'{campo_fecha}__lt': fecha}) | Q(id__lt=pk))
+    ).order_by(f'-{campo_fecha}', '-id')[:tamano + 1])
+    hay_mas, filas = len(filas) > tamano, filas[:tamano]
+    return _pagina(filas, campo_fecha, siguiente=hay_mas, anterior=True)
+
+
+def _pagina(filas, campo_fecha, siguiente, anterior):
+    if not filas:
+        return PaginaKeyset(filas)
+    primera, ultima = filas[0], filas[-1]
+    return PaginaKeyset(
+        filas,
+        cursor_siguiente=codificar_cursor(getattr(ultima, campo_fecha), ultima.pk) if siguiente else None,
+        cursor_anterior=codificar_cursor(getattr(primera, campo_fecha), primera.pk) if anterior else None,
+    )
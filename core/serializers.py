@@ -0,0 +1,64 @@
+# core/serializers.py
+
+from rest_framework import serializers
+
+from .models import Cliente, Producto, Proveedor, Sucursal, Repartidor
+
+
+class CamposDinamicosMixin:
+    """
+    Permite pedir solo algunos campos con `?fields=id,nombre,sku`.
+    Los nombres desconocidos se ignoran.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        campos = request.query_params.get('fields') if request else None
+        if campos:
+            pedidos = {campo.strip() for campo in campos.split(',') if campo.strip()}
+            for campo in set(self.fields) - pedidos:
+                self.fields.pop(campo)
+
+
+class ClienteSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
+    class Meta:
+        model = Cliente
+        fields = ['id', 'nombre', 'telefono', 'email', 'razon_social', 'direccion']
+
+
+class ProductoSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
+    categoria_nombre = serializers.CharField(source='categoria.nombre', read_only=True, default=None)
+
+    class Meta:
+        model = Producto
+        fields = [
+            'id', 'nombre', 'sku', 'categoria', 'categoria_nombre', 'descripcion',
+            'stock_actual', 'stock_minimo', 'deficit', 'precio_venta', 'costo_unitario',
+            'punto_reorden_sugerido', 'cantidad_pedido_sugerida',
+        ]
+
+
+class ProveedorSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
+    class Meta:
+        model = Proveedor
+        fields = ['id', 'nombre', 'contacto', 'razon_social', 'direccion', 'telefono', 'email']
+
+
+class SucursalSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
+    class Meta:
+        model = Sucursal
+        fields = [
+            'id', 'nombre', 'codigo', 'direccion', 'ciudad', 'departamento', 'latitud', 'longitud',
+            'telefono', 'email', 'activa', 'es_principal', 'radio_cobertura_km',
+            'horario_apertura', 'horario_cierre',
+        ]
+
+
+class RepartidorSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
+    class Meta:
+        model = Repartidor
+        fields = [
+            'id', 'nombre', 'telefono', 'documento', 'estado', 'fecha_ingreso',
+            'capacidad_maxima_kg', 'capacidad_maxima_m3',
+        ]
@@ -0,0 +1,173 @@
+"""
+Series temporales de ventas y ganancias.
+
+Se calculan sobre el resumen diario (VentaResumenDiario), que ya está agregado
+por día local, producto, cliente y usuario: la base de datos solo suma por
+(fecha, grupo) y NumPy agrupa los días en semanas o meses, rellena los periodos
+sin ventas y calcula medias móviles y tasas de crecimiento. El resultado es un
+payload columnar (una lista por métrica).
+"""
+from datetime import timedelta
+
+import numpy as np
+from django.db.models import Sum
+
+from core.models import VentaResumenDiario
+
+INTERVALOS = ('dia', 'semana', 'mes')
+
+AGRUPACIONES = {
+    'categoria': ('producto__categoria_id', 'producto__categoria__nombre'),
+    'usuario': ('usuario_id', 'usuario__username'),
+}
+
+METRICAS = (
+    'ingresos', 'ganancia', 'unidades', 'ventas', 'ingresos_media_movil',
+    'ganancia_media_movil', 'crecimiento_ingresos', 'crecimiento_ganancia',
+)
+
+
+def _indice_periodos(desde, hasta, intervalo):
+    """Todos los periodos del rango (relleno de huecos) como datetime64."""
+    if intervalo == 'mes':
+        return np.arange(np.datetime64(desde, 'M'), np.datetime64(hasta, 'M') + 1)
+    if intervalo == 'semana':
+        inicio = desde - timedelta(days=desde.weekday())
+        return np.arange(np.datetime64(inicio, 'D'), np.datetime64(hasta, 'D') + 1, 7)
+    return np.arange(np.datetime64(desde, 'D'), np.datetime64(hasta, 'D') + 1)
+
+
+def _posiciones(fechas, intervalo, inicio):
+    """Posición de cada fecha dentro del índice denso de periodos."""
+    dias = np.array(fechas, dtype='datetime64[D]')
+    if intervalo == 'mes':
+        return (dias.astype('datetime64[M]') - inicio).astype(np.int64)
+    delta = (dias - inicio).astype(np.int64)
+    return delta // 7 if intervalo == 'semana' else delta
+
+
+def media_movil(valores, ventana):
+    """Media móvil hacia atrás; los primeros puntos usan la ventana parcial disponible."""
+    acumulado = np.cumsum(np.concatenate([np.zeros(valores.shape[:-1] + (1,)), valores], axis=-1), axis=-1)
+    n = valores.shape[-1]
+    fin = np.arange(1, n + 1)
+    inicio = np.maximum(fin - ventana, 0)
+    return (acumulado[..., fin] - acumulado[..., inicio]) / (fin - inicio)
+
+
+def tasa_crecimiento(valores):
+    """Variación porcentual respecto al periodo anterior (NaN si el anterior es 0)."""
+    anterior = valores[..., :-1]
+    actual = valores[..., 1:]
+    tasa = np.full(anterior.shape, np.nan)
+    np.divide((actual - anterior) * 100, anterior, out=tasa, where=anterior != 0)
+    relleno = np.full(valores.shape[:-1] + (1,), np.nan)
+    return np.concatenate([relleno, tasa], axis=-1)
+
+
+def _columna(valores, decimales=2):
+    """Convierte un array a listas JSON, con None en lugar de NaN."""
+    redondeado = np.round(valores.astype(float), decimales)
+    return np.where(np.isnan(redondeado), None, redondeado).tolist()
+
+
+def _acumular_por_periodo(filas, n_columnas, intervalo, inicio, n_periodos, indice_grupo=None):
+    """
+    Suma las filas (fecha, [grupo], valores...) en una matriz densa
+    (columna, grupo * periodo) usando bincount.
+    """
+    tamano = max(len(indice_grupo or ()), 1) * n_periodos
+    if not filas:
+        return np.zeros((n_columnas, tamano))
+    columnas = list(zip(*filas))
+    pos = _posiciones(columnas[0], intervalo, inicio)
+    if indice_grupo is not None:
+        pos = np.array([indice_grupo[g] for g in columnas[1]]) * n_periodos + pos
+    return np.array([
+        np.bincount(pos, weights=np.array(valores, dtype=float), minlength=tamano)
+        for valores in columnas[-n_columnas:]
+    ])
+
+
+def serie_ventas(desde, hasta, intervalo='dia', categoria_id=None, usuario_id=None, agrupar_por=None, ventana=7):
+    """
+    Serie de ingresos, ganancia, unidades y número de ventas COMPLETADAS
+    entre `desde` y `hasta` (fechas inclusive).
+
+    La ganancia es ingresos - costo del resumen (costo unitario del producto al
+    registrar la venta). El número de ventas solo se incluye si no se filtra ni
+    agrupa por categoría, porque una venta puede tener productos de varias categorías.
+    """
+    if intervalo not in INTERVALOS:
+        raise ValueError(f"Intervalo no válido: {intervalo}")
+    if agrupar_por is not None and agrupar_por not in AGRUPACIONES:
+        raise ValueError(f"Agrupación no válida: {agrupar_por}")
+
+    resumen = VentaResumenDiario.objects.filter(fecha__gte=desde, fecha__lte=hasta)
+    if usuario_id:
+        resumen = resumen.filter(usuario_id=usuario_id)
+    por_categoria = bool(categoria_id) or agrupar_por == 'categoria'
+    lineas = resumen.filter(producto__isnull=False)
+    if categoria_id:
+        lineas = lineas.filter(producto__categoria_id=categoria_id)
+
+    campo_grupo, campo_nombre = AGRUPACIONES[agrupar_por] if agrupar_por else (None, None)
+    claves = ['fecha'] + ([campo_grupo] if campo_grupo else [])
+
+    periodos = _indice_periodos(desde, hasta, intervalo)
+    inicio = periodos[0]
+    n_periodos = len(periodos)
+
+    indice_grupo = None
+    grupos = []
+    if campo_grupo:
+        grupos = list(lineas.values_list(campo_grupo, campo_nombre).distinct().order_by(campo_nombre))
+        indice_grupo = {grupo_id: i for i, (grupo_id, _) in enumerate(grupos)}
+
+    # Unidades, ingresos y costo por (día, grupo); la base de datos devuelve O(días) filas
+    filas = list(
+        lineas.values_list(*claves)
+        .annotate(total_unidades=Sum('unidades'), total_ingresos=Sum('ingresos'), total_costo=Sum('costo'))
+        .order_by()
+    )
+    unidades, ingresos, costo = _acumular_por_periodo(filas, 3, intervalo, inicio, n_periodos, indice_grupo)
+    ganancia = ingresos - costo
+
+    ventas = None
+    if not por_categoria:
+        # Las filas sin producto son los totales por venta
+        conteos = list(
+            resumen.filter(producto__isnull=True).values_list(*claves)
+            .annotate(total=Sum('num_ventas')).order_by()
+        )
+        if indice_grupo is not None:
+            conteos = [fila for fila in conteos if fila[1] in indice_grupo]
+        ventas, = _acumular_por_periodo(conteos, 1, intervalo, inicio, n_periodos, indice_grupo)
+
+    forma = (max(len(grupos), 1), n_periodos)
+    ingresos, ganancia, unidades = (arr.reshape(forma) for arr in (ingresos, ganancia, unidades))
+
+    resultado = {
+        'intervalo': intervalo,
+        'desde': desde.isoformat(),
+        'hasta': hasta.isoformat(),
+        'periodos': np.datetime_as_string(periodos.astype('datetime64[D]')).tolist(),
+        'ingresos': _columna(ingresos),
+        'ganancia': _columna(ganancia),
+        'unidades': _columna(unidades, 0),
+        'ventas': None if ventas is None else _columna(ventas.reshape(forma), 0),
+        'ingresos_media_movil': _columna(media_movil(ingresos, ventana)),
+        'ganancia_media_movil': _columna(media_movil(ganancia, ventana)),
+        'crecimiento_ingresos': _columna(tasa_crecimiento(ingresos)),
+        'crecimiento_ganancia': _columna(tasa_crecimiento(ganancia)),
+    }
+
+    if campo_grupo:
+        resultado['agrupar_por'] = agrupar_por
+        resultado['grupos'] = [{'id': grupo_id, 'nombre': nombre} for grupo_id, nombre in grupos]
+    else:
+        # Sin agrupación cada métrica es una sola serie
+        for clave in METRICAS:
+            if resultado[clave] is not None:
+                resultado[clave] = resultado[clave][0]
+    return resultado
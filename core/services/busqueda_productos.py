@@ -0,0 +1,132 @@
+"""
+Búsqueda de productos con índice de texto completo.
+
+- SQLite: tabla virtual FTS5 `core_producto_fts` con tokenizador trigram,
+  ordenada por bm25 (nombre pesa más que SKU y este más que descripción).
+- PostgreSQL: índices GIN trigram sobre las columnas, ordenado por similitud.
+
+La consulta se busca como una frase, que con trigramas equivale a
+`icontains` sobre nombre, SKU o descripción (los mismos resultados que
+core.busquedas). Los textos de menos de 3 caracteres no tienen trigramas y
+se resuelven con icontains.
+
+Los filtros del queryset del llamador (p. ej. la categoría del listado) se
+aplican dentro de la búsqueda, antes de ordenar y cortar en el límite: así
+no se pierden coincidencias de la categoría que en todo el catálogo quedarían
+por debajo del límite.
+
+El índice FTS5 se mantiene desde core.signals al guardar o borrar productos
+(formularios, importador de Excel, admin). Las escrituras masivas que no
+disparan señales deben llamar a reconstruir_indice().
+"""
+from django.db import connection
+
+from core.busquedas import aplicar_busqueda
+
+MIN_CARACTERES = 3
+LIMITE_RESULTADOS = 500
+
+# Pesos bm25 por columna: nombre, sku, descripcion
+_BM25 = "bm25(core_producto_fts, 10.0, 5.0, 1.0)"
+
+
+def usa_indice(texto):
+    return connection.vendor in ('sqlite', 'postgresql') and len(texto) >= MIN_CARACTERES
+
+
+def _frase_fts(texto):
+    return '"' + texto.replace('"', '""') + '"'
+
+
+def buscar_ids(texto, limite=LIMITE_RESULTADOS, con_stock=False, queryset=None):
+    """
+    IDs de los productos que contienen `texto` (solo los de `queryset`, si se
+    da), del más al menos relevante.
+    """
+    texto = texto.strip()
+    if connection.vendor == 'postgresql':
+        return _buscar_ids_postgres(texto, limite, con_stock, queryset)
+
+    filtros, params = [], [_frase_fts(texto)]
+    if con_stock:
+        filtros.append(" AND core_producto.stock_disponible > 0")
+    if queryset is not None:
+        subconsulta, subparams = queryset.order_by().values('id').query.sql_with_params()
+        filtros.append(f" AND core_producto_fts.rowid IN ({subconsulta})")
+        params.extend(subparams)
+    sql = (
+        "SELECT core_producto_fts.rowid FROM core_producto_fts{join}"
+        " WHERE core_producto_fts MATCH %s{filtros} ORDER BY {bm25}, core_producto_fts.rowid LIMIT %s"
+    ).format(
+        join=" JOIN core_producto ON core_producto.id = core_producto_fts.rowid" if con_stock else "",
+        filtros=''.join(filtros),
+        bm25=_BM25,
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [*params, limite])
+        return [fila[0] for fila in cursor.fetchall()]
+
+
+def _buscar_ids_postgres(texto, limite, con_stock, queryset):
+    from django.contrib.postgres.search import TrigramSimilarity
+    from django.db.models.functions import Greatest
+
+    from core.models import Producto
+
+    productos = aplicar_busqueda(Producto.objects.all() if queryset is None else queryset, texto, 'producto')
+    if con_stock:
+        productos = productos.filter(stock_disponible__gt=0)
+    return list(
+        productos.annotate(
+            relevancia=Greatest(TrigramSimilarity('nombre', texto), TrigramSimilarity('sku', texto))
+        ).order_by('-relevancia', 'id').values_list('id', flat=True)[:limite]
+    )
+
+
+def buscar_productos(queryset, texto, limite=LIMITE_RESULTADOS, con_stock=False):
+    """
+    Lista de productos del queryset que coinciden con `texto`, ordenados por
+    relevancia. Los filtros del queryset y `con_stock` (solo productos con
+    stock disponible) se aplican antes de cortar en `limite`.
+    """
+    texto = texto.strip()
+    if not usa_indice(texto):
+        productos = aplicar_busqueda(queryset, texto, 'producto')
+        if con_stock:
+            productos = productos.filter(stock_disponible__gt=0)
+        return list(productos.order_by('nombre', 'id')[:limite])
+
+    ids = buscar_ids(texto, limite, con_stock, queryset)
+    posicion = {pk: i for i, pk in enumerate(ids)}
+    return sorted(queryset.filter(id__in=ids), key=lambda producto: posicion[producto.id])
+
+
+def indexar_producto(producto):
+    """Inserta o reemplaza el producto en el índice FTS5."""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("DELETE FROM core_producto_fts WHERE rowid = %s", [producto.pk])
+        cursor.execute(
+            "INSERT INTO core_producto_fts(rowid, nombre, sku, descripcion) VALUES (%s, %s, %s, %s)",
+            [producto.pk, producto.nombre, producto.sku, producto.descripcion],
+        )
+
+
+def desindexar_producto(producto_id):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("DELETE FROM core_producto_fts WHERE rowid = %s", [producto_id])
+
+
+def reconstruir_indice():
+    """Vuelve a generar el índice FTS5 completo desde core_producto."""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("DELETE FROM core_producto_fts")
+        cursor.execute(
+            "INSERT INTO core_producto_fts(rowid, nombre, sku, descripcion) "
+            "SELECT id, nombre, sku, descripcion FROM core_producto"
+        )
@@ -0,0 +1,51 @@
+"""
+Saldos de los pedidos a proveedores.
+
+PedidoProveedor.total_pagado suma los pagos con una consulta por pedido (y
+saldo_pendiente la repite). con_saldos() anota ambos valores con una
+subconsulta sobre PagoProveedor, de modo que un listado de N pedidos los trae
+en la misma consulta; las propiedades del modelo usan la anotación cuando
+existe.
+"""
+from decimal import Decimal
+
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from core.models import PagoProveedor, PedidoProveedor
+
+_MONTO = DecimalField(max_digits=14, decimal_places=2)
+
+
+def con_saldos(pedidos):
+    """Anota `pagado` (suma de sus pagos) y `saldo` (costo_total - pagado) a cada pedido."""
+    pagos = (
+        PagoProveedor.objects.filter(pedido=OuterRef('pk')).order_by()
+        .values('pedido').annotate(total=Sum('monto')).values('total')
+    )
+    return pedidos.annotate(
+        pagado=Coalesce(Subquery(pagos, output_field=_MONTO), Value(Decimal('0')), output_field=_MONTO),
+    ).annotate(saldo=F('costo_total') - F('pagado'))
+
+
+def cuentas_por_pagar(proveedor_id=None):
+    """
+    Pedidos no cancelados con saldo pendiente, agrupados por proveedor, en una
+    sola consulta. Devuelve (proveedores, total): una lista de dicts con
+    proveedor, pedidos y saldo, y la suma de todos los saldos.
+    """
+    pedidos = con_saldos(
+        PedidoProveedor.objects.exclude(estado='CANCELADO').select_related('proveedor')
+    ).filter(saldo__gt=0).order_by('proveedor__nombre', 'fecha_pedido', 'id')
+    if proveedor_id:
+        pedidos = pedidos.filter(proveedor_id=proveedor_id)
+
+    proveedores = {}
+    for pedido in pedidos:
+        grupo = proveedores.setdefault(
+            pedido.proveedor_id, {'proveedor': pedido.proveedor, 'pedidos': [], 'saldo': Decimal('0')}
+        )
+        grupo['pedidos'].append(pedido)
+        grupo['saldo'] += pedido.saldo
+    grupos = list(proveedores.values())
+    return grupos, sum((grupo['saldo'] for grupo in grupos), Decimal('0'))
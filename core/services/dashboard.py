@@ -0,0 +1,196 @@
+"""
+Widgets del dashboard con caché por widget.
+
+Cada widget se calcula por separado, se guarda en el caché configurado en
+DASHBOARD_CACHE_ALIAS y se invalida desde core.signals cuando se escribe
+alguno de los modelos de los que depende.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from core.models import (
+    Cliente, PedidoDetalle, PedidoProveedor, Producto, Proveedor,
+    Venta, VentaDetalle, VentaResumenDiario
+)
+from core.services.ganancias import ganancias_ventas_completadas
+
+
+def _cache():
+    return caches[getattr(settings, 'DASHBOARD_CACHE_ALIAS', 'default')]
+
+
+def _hoy():
+    return timezone.now().date()
+
+
+# --- Cálculo de cada widget ---
+
+def widget_conteos():
+    return {
+        'total_productos': Producto.objects.count(),
+        'total_clientes': Cliente.objects.count(),
+        'total_proveedores': Proveedor.objects.count(),
+    }
+
+
+def widget_ventas_hoy():
+    # Filas sin producto del resumen diario = totales por venta
+    ventas_hoy = VentaResumenDiario.objects.filter(producto__isnull=True, fecha=_hoy()).aggregate(
+        count=Sum('num_ventas'), total=Sum('ingresos')
+    )
+    return {
+        'ventas_hoy_count': ventas_hoy['count'] or 0,
+        'ventas_hoy_total': ventas_hoy['total'] or Decimal('0'),
+    }
+
+
+def widget_ventas_mes():
+    inicio_mes = _hoy().replace(day=1)
+    ventas_mes = VentaResumenDiario.objects.filter(producto__isnull=True, fecha__gte=inicio_mes).aggregate(
+        count=Sum('num_ventas'), total=Sum('ingresos')
+    )
+    ventas_mes_total = ventas_mes['total'] or Decimal('0')
+    ventas_mes_count = ventas_mes['count'] or 0
+
+    ticket_promedio = Decimal('0')
+    if ventas_mes_count > 0:
+        ticket_promedio = ventas_mes_total / ventas_mes_count
+
+    return {
+        'ventas_mes_total': ventas_mes_total,
+        'ventas_mes_count': ventas_mes_count,
+        # Ganancias estimadas (diferencia entre precio venta y último costo de compra)
+        'ganancias_mes': ganancias_ventas_completadas(inicio_mes),
+        'ticket_promedio': ticket_promedio,
+    }
+
+
+def widget_productos_mas_vendidos():
+    hace_30_dias = _hoy() - timedelta(days=30)
+    productos = VentaResumenDiario.objects.filter(
+        fecha__gte=hace_30_dias,
+        producto__isnull=False
+    ).values(
+        'producto__nombre', 'producto__sku'
+    ).annotate(
+        total_vendido=Sum('unidades'),
+        ingresos=Sum('ingresos')
+    ).order_by('-total_vendido')[:5]
+    return {'productos_mas_vendidos': list(productos)}
+
+
+def widget_clientes_activos():
+    hace_30_dias = _hoy() - timedelta(days=30)
+    clientes = VentaResumenDiario.objects.filter(
+        fecha__gte=hace_30_dias,
+        producto__isnull=True
+    ).values(
+        'cliente__nombre'
+    ).annotate(
+        total_compras=Sum('num_ventas'),
+        total_gastado=Sum('ingresos')
+    ).order_by('-total_gastado')[:5]
+    return {'clientes_activos': list(clientes)}
+
+
+def productos_stock_bajo():
+    """Productos en o bajo su stock mínimo, del más al menos crítico (usa producto_deficit_idx)."""
+    return Producto.objects.filter(deficit__gte=0).order_by('-deficit', 'id')
+
+
+def widget_stock_bajo():
+    stock_bajo = productos_stock_bajo()
+    return {
+        'productos_stock_bajo': stock_bajo.count(),
+        'productos_alerta': list(stock_bajo.values('id', 'nombre', 'sku', 'stock_actual', 'stock_minimo', 'deficit')[:5]),
+    }
+
+
+def widget_pedidos_pendientes():
+    pendientes = PedidoProveedor.objects.filter(estado='PENDIENTE')
+    resumen = pendientes.aggregate(cantidad=Count('id'), total=Sum('costo_total'))
+    return {
+        'pedidos_pendientes': resumen['cantidad'],
+        # Inversión en inventario (pedidos pendientes)
+        'inversion_pendiente': resumen['total'] or Decimal('0'),
+        'pedidos_alerta': list(pendientes.values('id', 'proveedor__nombre', 'fecha_pedido', 'costo_total')[:5]),
+    }
+
+
+def widget_ventas_recientes():
+    ventas = Venta.objects.select_related('cliente').order_by('-fecha')[:5]
+    return {
+        'ventas_recientes': [{
+            'id': venta.id,
+            'cliente': venta.cliente.nombre if venta.cliente else None,
+            'fecha': venta.fecha,
+            'monto_total': venta.monto_total,
+            'estado': venta.estado,
+            'estado_display': venta.get_estado_display(),
+        } for venta in ventas]
+    }
+
+
+# Widget -> (función de cálculo, modelos cuya escritura lo invalida)
+WIDGETS = {
+    'conteos': (widget_conteos, (Producto, Cliente, Proveedor)),
+    'ventas_hoy': (widget_ventas_hoy, (Venta, VentaDetalle)),
+    'ventas_mes': (widget_ventas_mes, (Venta, VentaDetalle, PedidoProveedor, PedidoDetalle)),
+    'productos_mas_vendidos': (widget_productos_mas_vendidos, (Venta, VentaDetalle, Producto)),
+    'clientes_activos': (widget_clientes_activos, (Venta, VentaDetalle, Cliente)),
+    'stock_bajo': (widget_stock_bajo, (Producto,)),
+    'pedidos_pendientes': (widget_pedidos_pendientes, (PedidoProveedor, PedidoDetalle, Proveedor)),
+    'ventas_recientes': (widget_ventas_recientes, (Venta, VentaDetalle, Cliente)),
+}
+
+
+def clave_widget(nombre, fecha=None):
+    return f"dashboard:{nombre}:{(fecha or _hoy()).isoformat()}"
+
+
+def obtener_widget(nombre):
+    """Devuelve los datos del widget desde caché, calculándolos si no están."""
+    calcular, _ = WIDGETS[nombre]
+    timeout = getattr(settings, 'DASHBOARD_CACHE_TIMEOUT', 300)
+    return _cache().get_or_set(clave_widget(nombre), calcular, timeout)
+
+
+def clave_modificacion(nombre):
+    return f"dashboard:modificado:{nombre}"
+
+
+def ultima_modificacion(nombre):
+    """
+    Momento de la última invalidación del widget, usado para ETag/Last-Modified.
+    Nunca es anterior al inicio del día, porque los widgets dependen de la fecha.
+    """
+    cache = _cache()
+    marca = cache.get(clave_modificacion(nombre))
+    if marca is None:
+        marca = timezone.now()
+        cache.add(clave_modificacion(nombre), marca, None)
+    inicio_dia = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    return max(marca, inicio_dia)
+
+
+def modelos_observados():
+    return {modelo for _, modelos in WIDGETS.values() for modelo in modelos}
+
+
+def invalidar_widgets(*modelos):
+    """Elimina del caché los widgets que dependen de alguno de los modelos dados."""
+    nombres = [
+        nombre for nombre, (_, dependencias) in WIDGETS.items()
+        if any(modelo in dependencias for modelo in modelos)
+    ]
+    if nombres:
+        cache = _cache()
+        cache.delete_many([clave_widget(nombre) for nombre in nombres])
+        ahora = timezone.now()
+        cache.set_many({clave_modificacion(nombre): ahora for nombre in nombres}, None)
+    return nombres
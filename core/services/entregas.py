@@ -0,0 +1,71 @@
+"""
+Unidades entregadas de cada línea de venta.
+
+VentaDetalle.cantidad_entregada guarda lo que ya salió con notas de entrega
+aplicadas, de modo que el resumen de entregas de una venta (y lo pendiente que
+muestran la creación de notas, su listado y el admin) se lee con una consulta
+sin importar cuántas líneas tenga.
+
+NotaEntregaVenta lo mantiene con registrar_entrega() dentro de la misma
+transacción que mueve el stock: un solo UPDATE ... SET cantidad_entregada =
+cantidad_entregada + CASE ..., sin leer el valor antes. La columna es
+PositiveIntegerField, así que la base de datos rechaza una reversión que la
+dejaría negativa.
+
+entregado_por_producto() calcula lo mismo desde las notas con una consulta
+agrupada; recalcular() la usa para reconstruir el contador (p. ej. tras borrar
+notas ya aplicadas, que no pasan por la reversión).
+"""
+from collections import defaultdict
+
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+
+from core.models import DetalleNotaEntrega, VentaDetalle
+from core.transacciones import atomic_escritura
+
+
+def registrar_entrega(venta_id, lineas, signo=1):
+    """
+    Suma (signo=1) o resta (signo=-1) las unidades de `lineas`, pares
+    (producto_id, cantidad), a las líneas de la venta. Devuelve las filas
+    actualizadas.
+    """
+    deltas = defaultdict(int)
+    for producto_id, cantidad in lineas:
+        deltas[producto_id] += signo * cantidad
+    deltas = {producto_id: delta for producto_id, delta in deltas.items() if delta}
+    if not deltas:
+        return 0
+    return VentaDetalle.objects.filter(venta_id=venta_id, producto_id__in=deltas).update(
+        cantidad_entregada=F('cantidad_entregada') + Case(
+            *[When(producto_id=producto_id, then=Value(delta)) for producto_id, delta in deltas.items()],
+            default=Value(0), output_field=IntegerField(),
+        )
+    )
+
+
+def entregado_por_producto(venta_ids=None):
+    """{(venta_id, producto_id): unidades} entregadas con notas aplicadas, en una consulta agrupada."""
+    filas = DetalleNotaEntrega.objects.filter(nota_entrega__descuento_inventario_aplicado=True)
+    if venta_ids is not None:
+        filas = filas.filter(nota_entrega__venta_id__in=venta_ids)
+    filas = filas.order_by().values_list('nota_entrega__venta_id', 'producto_id').annotate(total=Sum('cantidad_entregada'))
+    return {(venta_id, producto_id): total for venta_id, producto_id, total in filas}
+
+
+@atomic_escritura()
+def recalcular(venta_ids=None):
+    """Reconstruye cantidad_entregada desde las notas. Devuelve cuántas líneas cambiaron."""
+    entregado = entregado_por_producto(venta_ids)
+    detalles = VentaDetalle.objects.select_for_update().only('id', 'venta_id', 'producto_id', 'cantidad_entregada')
+    if venta_ids is not None:
+        detalles = detalles.filter(venta_id__in=venta_ids)
+
+    cambiados = []
+    for detalle in detalles:
+        valor = entregado.get((detalle.venta_id, detalle.producto_id), 0)
+        if detalle.cantidad_entregada != valor:
+            detalle.cantidad_entregada = valor
+            cambiados.append(detalle)
+    VentaDetalle.objects.bulk_update(cambiados, ['cantidad_entregada'], batch_size=500)
+    return len(cambiados)
@@ -0,0 +1,73 @@
+"""
+Cálculo de ganancias estimadas sobre los detalles de venta.
+
+Replica en SQL la regla histórica del dashboard:
+- Se toma el último costo de compra del producto (PedidoDetalle más reciente).
+- Si la ganancia con ese costo es positiva, se usa tal cual.
+- Si el costo supera al precio, se asume un margen del 30%.
+- Si el producto nunca se ha comprado, se asume un margen del 40%.
+"""
+from decimal import Decimal
+
+from django.db.models import Case, DecimalField, ExpressionWrapper, F, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+
+from core.models import PedidoDetalle, VentaDetalle
+
+MARGEN_COSTO_INVALIDO = Decimal('0.3')
+MARGEN_SIN_COSTO = Decimal('0.4')
+
+_MONTO = DecimalField(max_digits=14, decimal_places=2)
+
+
+def ultimo_costo_compra(producto_ref='producto'):
+    """Subquery con el costo unitario de la compra más reciente del producto."""
+    return Subquery(
+        PedidoDetalle.objects.filter(
+            producto=OuterRef(producto_ref)
+        ).order_by('-pedido__fecha_pedido', '-id').values('costo_unitario_compra')[:1],
+        output_field=DecimalField(max_digits=10, decimal_places=2)
+    )
+
+
+def anotar_ganancia(detalles):
+    """
+    Anota cada VentaDetalle del queryset con `ingreso`, `ultimo_costo`
+    y `ganancia_estimada`, todo resuelto en una sola consulta.
+    """
+    ingreso = ExpressionWrapper(F('cantidad') * F('precio_unitario_venta'), output_field=_MONTO)
+    return detalles.annotate(
+        ingreso=ingreso,
+        ultimo_costo=ultimo_costo_compra(),
+    ).annotate(
+        ganancia_estimada=Case(
+            When(ultimo_costo__isnull=True, then=F('ingreso') * Value(MARGEN_SIN_COSTO)),
+            When(
+                ingreso__gt=F('ultimo_costo') * F('cantidad'),
+                then=F('ingreso') - F('ultimo_costo') * F('cantidad')
+            ),
+            default=F('ingreso') * Value(MARGEN_COSTO_INVALIDO),
+            output_field=_MONTO,
+        )
+    )
+
+
+def calcular_ganancias(detalles=None):
+    """Suma la ganancia estimada de los detalles indicados en una consulta."""
+    if detalles is None:
+        detalles = VentaDetalle.objects.all()
+    total = anotar_ganancia(detalles).aggregate(
+        total=Coalesce(Sum('ganancia_estimada'), Value(Decimal('0')), output_field=_MONTO)
+    )['total']
+    return total or Decimal('0')
+
+
+def ganancias_ventas_completadas(desde, hasta=None):
+    """Ganancia estimada de las ventas COMPLETADAS con fecha desde `desde` (inclusive)."""
+    detalles = VentaDetalle.objects.filter(
+        venta__fecha__date__gte=desde,
+        venta__estado='COMPLETADA'
+    )
+    if hasta is not None:
+        detalles = detalles.filter(venta__fecha__date__lte=hasta)
+    return calcular_ganancias(detalles)
@@ -0,0 +1,61 @@
+"""
+Claves de idempotencia para las ventas del punto de venta.
+
+El cliente manda una clave por envío lógico: el formulario de nueva venta la
+genera al mostrarse y la API la recibe en el encabezado Idempotency-Key.
+
+- La primera petición registra la clave en ClaveIdempotencia ((usuario,
+  clave) es único en la base de datos) en la misma transacción que crea la
+  venta; un reintento con la misma clave recibe el resultado guardado sin
+  volver a crear la venta ni descontar stock.
+- Si la operación falla, la clave se deshace con la transacción y el
+  reintento se procesa de nuevo.
+- Dos envíos simultáneos con la misma clave se ordenan en el índice único:
+  el segundo espera a que termine el primero y devuelve su resultado.
+
+Las claves vencen a las IDEMPOTENCIA_HORAS y purgar_claves_vencidas() las
+borra con un solo DELETE (comando purgar_claves_idempotencia).
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from core.models import ClaveIdempotencia
+from core.transacciones import atomic_escritura
+
+MAX_LONGITUD = 64
+
+
+def clave_valida(clave):
+    return bool(clave) and len(clave) <= MAX_LONGITUD
+
+
+def buscar(usuario, clave):
+    """Registro de un envío anterior con esta clave, o None."""
+    return ClaveIdempotencia.objects.select_related('venta').filter(usuario=usuario, clave=clave).first()
+
+
+def ejecutar_una_vez(usuario, clave, operacion):
+    """
+    Ejecuta operacion(), que devuelve (venta, respuesta), una sola vez por
+    (usuario, clave). Devuelve (registro, repetida); si `repetida` es True la
+    operación no se ejecutó y el registro trae la venta y la respuesta originales.
+    """
+    with atomic_escritura():
+        try:
+            with transaction.atomic():
+                registro = ClaveIdempotencia.objects.create(usuario=usuario, clave=clave)
+        except IntegrityError:
+            return buscar(usuario, clave), True
+        registro.venta, registro.respuesta = operacion()
+        registro.save(update_fields=['venta', 'respuesta'])
+    return registro, False
+
+
+def purgar_claves_vencidas(ahora=None):
+    """Borra las claves con más de IDEMPOTENCIA_HORAS. Devuelve cuántas borró."""
+    limite = (ahora or timezone.now()) - timedelta(hours=getattr(settings, 'IDEMPOTENCIA_HORAS', 24))
+    borradas, _ = ClaveIdempotencia.objects.filter(creada__lt=limite).delete()
+    return borradas
@@ -0,0 +1,208 @@
+"""
+Índice en memoria para el autocompletado de productos del punto de venta.
+
+Cada proceso guarda id, nombre, SKU, precio y stock disponible (descontadas
+las reservas) de todos los productos y
+una lista ordenada de claves normalizadas (SKU, nombre completo y cada
+palabra del nombre), de modo que buscar por prefijo es una bisección y no
+toca la base de datos.
+
+- Se construye la primera vez que se usa.
+- core.signals lo parchea al confirmarse cada guardado o borrado de un
+  producto y anota el cambio en el caché compartido (INDICE_PRODUCTOS_CACHE_ALIAS)
+  bajo un contador de versión.
+- Antes de cada búsqueda el proceso compara su versión con la del caché y
+  recarga solo los productos cambiados; si faltan cambios en el caché (o son
+  demasiados) reconstruye el índice completo.
+
+Las escrituras masivas que no disparan señales deben llamar a invalidar_indice().
+"""
+import bisect
+import threading
+import unicodedata
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import caches
+
+from core.models import Producto
+
+CLAVE_VERSION = 'indice_productos:version'
+# Más cambios pendientes que estos se resuelven reconstruyendo el índice
+MAX_CAMBIOS_PENDIENTES = 200
+TIMEOUT_CAMBIOS = 3600
+
+ProductoIndexado = namedtuple('ProductoIndexado', 'id nombre sku precio stock')
+
+_CAMPOS = ('id', 'nombre', 'sku', 'precio_venta', 'stock_disponible')
+
+
+def _cache():
+    return caches[getattr(settings, 'INDICE_PRODUCTOS_CACHE_ALIAS', 'default')]
+
+
+def clave_cambio(version):
+    return f"indice_productos:cambio:{version}"
+
+
+def normalizar(texto):
+    """Minúsculas y sin acentos, para que 'LÁPIZ' y 'lapiz' coincidan."""
+    texto = unicodedata.normalize('NFKD', texto or '')
+    return ''.join(c for c in texto if not unicodedata.combining(c)).casefold().strip()
+
+
+def _claves(producto):
+    nombre = normalizar(producto.nombre)
+    claves = {normalizar(producto.sku), nombre, *nombre.split()}
+    claves.discard('')
+    return claves
+
+
+class IndicePrefijos:
+    """Productos por id y pares (clave, id) ordenados para buscar por prefijo."""
+
+    def __init__(self):
+        self.productos = {}
+        self.claves = []
+        self.version = None
+        self._lock = threading.RLock()
+
+    def cargar(self, productos, version):
+        productos = {producto.id: producto for producto in productos}
+        claves = sorted((clave, producto.id) for producto in productos.values() for clave in _claves(producto))
+        with self._lock:
+            self.productos, self.claves, self.version = productos, claves, version
+
+    def poner(self, producto):
+        with self._lock:
+            self.quitar(producto.id)
+            self.productos[producto.id] = producto
+            for clave in _claves(producto):
+                bisect.insort(self.claves, (clave, producto.id))
+
+    def quitar(self, producto_id):
+        with self._lock:
+            anterior = self.productos.pop(producto_id, None)
+            if anterior is None:
+                return
+            for clave in _claves(anterior):
+                i = bisect.bisect_left(self.claves, (clave, producto_id))
+                if i < len(self.claves) and self.claves[i] == (clave, producto_id):
+                    del self.claves[i]
+
+    def buscar(self, texto, limite=10, con_stock=False):
+        """
+        Productos con alguna clave que empieza por `texto`, en orden de clave
+        (una coincidencia exacta de SKU o nombre queda primero).
+        """
+        prefijo = normalizar(texto)
+        if not prefijo:
+            return []
+        resultados = {}
+        with self._lock:
+            i = bisect.bisect_left(self.claves, (prefijo,))
+            while i < len(self.claves) and len(resultados) < limite:
+                clave, producto_id = self.claves[i]
+                if not clave.startswith(prefijo):
+                    break
+                producto = self.productos[producto_id]
+                if not con_stock or producto.stock > 0:
+                    resultados.setdefault(producto_id, producto)
+                i += 1
+        return list(resultados.values())
+
+
+_indice = IndicePrefijos()
+
+
+def _leer(queryset):
+    return [ProductoIndexado(*fila) for fila in queryset.values_list(*_CAMPOS)]
+
+
+def reconstruir(version=None):
+    if version is None:
+        version = _cache().get(CLAVE_VERSION, 0)
+    # La versión se lee antes que los productos: un cambio concurrente se vuelve a aplicar después
+    _indice.cargar(_leer(Producto.objects.order_by()), version)
+
+
+def sincronizar():
+    """Pone el índice del proceso al día con los cambios anotados por otros procesos."""
+    remota = _cache().get(CLAVE_VERSION, 0)
+    local = _indice.version
+    if local == remota:
+        return
+    if local is None or remota < local or remota - local > MAX_CAMBIOS_PENDIENTES:
+        reconstruir(remota)
+        return
+
+    claves = [clave_cambio(version) for version in range(local + 1, remota + 1)]
+    cambios = _cache().get_many(claves)
+    if len(cambios) < len(claves):
+        reconstruir(remota)
+        return
+
+    ids = set(cambios.values())
+    vigentes = _leer(Producto.objects.filter(id__in=ids))
+    with _indice._lock:
+        for producto in vigentes:
+            _indice.poner(producto)
+        for producto_id in ids - {producto.id for producto in vigentes}:
+            _indice.quitar(producto_id)
+        _indice.version = remota
+
+
+def buscar(texto, limite=10, con_stock=False):
+    sincronizar()
+    return _indice.buscar(texto, limite, con_stock)
+
+
+def _anotar_cambio(producto_id):
+    """Incrementa la versión compartida y devuelve la nueva."""
+    cache = _cache()
+    cache.add(CLAVE_VERSION, 0, None)
+    version = cache.incr(CLAVE_VERSION)
+    cache.set(clave_cambio(version), producto_id, TIMEOUT_CAMBIOS)
+    return version
+
+
+def _aplicar_local(version, cambio):
+    with _indice._lock:
+        if _indice.version is None:
+            # Aún no se construyó: se construirá completo en la primera búsqueda
+            return
+        cambio()
+        # Si otro proceso escribió entremedio, sincronizar() recogerá sus cambios
+        if version == _indice.version + 1:
+            _indice.version = version
+
+
+def producto_guardado(producto):
+    version = _anotar_cambio(producto.pk)
+    # Se relee la fila: la instancia guardada no trae stock_disponible (columna generada)
+    vigente = _leer(Producto.objects.filter(pk=producto.pk))
+    if vigente:
+        _aplicar_local(version, lambda: _indice.poner(vigente[0]))
+    else:
+        _aplicar_local(version, lambda: _indice.quitar(producto.pk))
+
+
+def producto_borrado(producto_id):
+    version = _anotar_cambio(producto_id)
+    _aplicar_local(version, lambda: _indice.quitar(producto_id))
+
+
+def productos_modificados(producto_ids):
+    """Anota cambios hechos sin Producto.save(), como los UPDATE de stock de core.services.inventario."""
+    if len(producto_ids) > MAX_CAMBIOS_PENDIENTES:
+        invalidar_indice()
+        return
+    for producto_id in producto_ids:
+        _anotar_cambio(producto_id)
+
+
+def invalidar_indice():
+    """Obliga a todos los procesos a reconstruir el índice en su próxima búsqueda."""
+    cache = _cache()
+    cache.add(CLAVE_VERSION, 0, None)
+    cache.incr(CLAVE_VERSION, MAX_CAMBIOS_PENDIENTES + 1)
@@ -0,0 +1,347 @@
+"""
+Servicio único de stock.
+
+Todos los cambios de Producto.stock_actual pasan por registrar_movimientos()
+(o aplicar_movimientos() para varios documentos a la vez):
+- se agrupan los movimientos de un documento por producto,
+- se aplican con un solo UPDATE ... SET stock_actual = stock_actual + CASE ...,
+  sin leer el stock antes (no se pierden actualizaciones concurrentes),
+- se guardan en el libro InventarioMovimiento con un solo bulk_create.
+
+El UPDATE es condicional (WHERE stock_actual + delta >= 0) y bloquea las filas
+en orden de id, así que dos terminales que venden las últimas unidades a la
+vez no pueden pasar ambas: la segunda recibe StockInsuficiente con las líneas
+que fallaron. Además stock_actual es PositiveIntegerField y la base de datos
+rechaza (CHECK stock_actual >= 0) cualquier stock negativo. Las ventas
+(respetar_reservas=True) comprueban además stock_disponible, para no vender
+lo que una cotización o un borrador tiene reservado (ver core.services.reservas).
+
+ajustar_reservado() cambia Producto.stock_reservado del mismo modo.
+
+Los movimientos con sucursal mueven también StockSucursal, con un solo UPDATE
+condicional para todas las (sucursal, producto) del lote; las entradas crean
+antes las filas que falten. faltantes_sucursal() compara lo que piden unas
+ventas con el stock de una sucursal en una sola consulta. El stock de una
+sucursal se carga (saldo inicial) o se corrige (conteo físico) con
+ajustar_stock_sucursal(), también como movimientos AJUSTE con sucursal.
+
+Como el UPDATE no pasa por Producto.save(), al confirmarse se envía la señal
+stock_actualizado (ver core.signals).
+"""
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.db.models.lookups import GreaterThanOrEqual
+from django.dispatch import Signal
+from django.utils import timezone
+
+from core.models import InventarioMovimiento, Producto, StockSucursal, VentaDetalle
+from core.transacciones import atomic_escritura
+
+# Argumento: producto_ids
+stock_actualizado = Signal()
+
+INTENTOS = 3
+
+
+def registrar_movimientos(tipo, lineas, fecha=None, respetar_reservas=False, **documento):
+    """
+    Aplica y registra los movimientos de un documento.
+    `lineas` son pares (producto_id, cantidad) con signo; `documento` es
+    venta=, pedido= o nota_entrega= y, si mueve una sucursal, sucursal_id=. Con `respetar_reservas` las salidas no
+    pueden tomar unidades reservadas. Devuelve los movimientos creados.
+    """
+    fecha = fecha or timezone.now()
+    return aplicar_movimientos([
+        InventarioMovimiento(producto_id=producto_id, cantidad=cantidad, tipo=tipo, fecha=fecha, **documento)
+        for producto_id, cantidad in lineas
+    ], respetar_reservas)
+
+
+def aplicar_movimientos(movimientos, respetar_reservas=False):
+    """
+    Como registrar_movimientos para movimientos ya construidos, que pueden
+    ser de varios documentos y tipos: se netean por producto y se aplican
+    con un solo UPDATE agrupado.
+    """
+    movimientos = [movimiento for movimiento in movimientos if movimiento.cantidad]
+    if not movimientos:
+        return []
+
+    deltas = defaultdict(int)
+    por_sucursal = defaultdict(int)
+    for movimiento in movimientos:
+        deltas[movimiento.producto_id] += movimiento.cantidad
+        if movimiento.sucursal_id:
+            por_sucursal[movimiento.sucursal_id, movimiento.producto_id] += movimiento.cantidad
+    deltas = {producto_id: delta for producto_id, delta in deltas.items() if delta}
+    por_sucursal = {clave: delta for clave, delta in por_sucursal.items() if delta}
+
+    with atomic_escritura():
+        if deltas:
+            _actualizar_stock(deltas, disponible='stock_disponible' if respetar_reservas else 'stock_actual')
+        if por_sucursal:
+            _actualizar_stock_sucursal(por_sucursal)
+        InventarioMovimiento.objects.bulk_create(movimientos)
+        _notificar(deltas)
+    return movimientos
+
+
+def ajustar_reservado(deltas):
+    """
+    Suma a Producto.stock_reservado los `deltas` {producto_id: unidades}. Las
+    reservas nuevas (+) solo se aplican si hay stock disponible, si no lanza
+    StockInsuficiente; las liberaciones (-) se aplican siempre.
+    """
+    reservas = {producto_id: delta for producto_id, delta in deltas.items() if delta > 0}
+    liberaciones = {producto_id: delta for producto_id, delta in deltas.items() if delta < 0}
+    with atomic_escritura():
+        if liberaciones:
+            Producto.objects.filter(id__in=liberaciones).update(
+                stock_reservado=F('stock_reservado') + _incremento(liberaciones)
+            )
+        if reservas:
+            _actualizar_stock(reservas, campo='stock_reservado', disponible='stock_disponible', signo=-1)
+        _notificar({**reservas, **liberaciones})
+
+
+def _notificar(deltas):
+    producto_ids = sorted(deltas)
+    if producto_ids:
+        transaction.on_commit(
+            lambda: stock_actualizado.send(sender=InventarioMovimiento, producto_ids=producto_ids)
+        )
+
+
+class StockInsuficiente(ValidationError):
+    """
+    Alguna línea pide más unidades de las disponibles. `faltantes` tiene un
+    dict por producto: producto_id, nombre, disponible y solicitado.
+    """
+
+    def __init__(self, faltantes):
+        self.faltantes = faltantes
+        super().__init__([
+            f"Stock insuficiente para {f['nombre']}. Disponible: {f['disponible']}, Solicitado: {f['solicitado']}"
+            for f in faltantes
+        ], code='stock_insuficiente')
+
+
+class _Faltante(Exception):
+    pass
+
+
+def _incremento(deltas):
+    return Case(
+        *[When(id=producto_id, then=Value(delta)) for producto_id, delta in deltas.items()],
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+
+
+def _actualizar_stock(deltas, campo='stock_actual', disponible='stock_actual', signo=1):
+    """
+    UPDATE condicional de `campo`: solo cambia las filas en que `disponible`
+    (que varía en signo * delta) no queda en negativo. Si alguna no cumple, se
+    deshace el UPDATE y se informa qué productos faltan.
+    """
+    incremento = _incremento(deltas)
+    for _ in range(INTENTOS):
+        try:
+            # Punto de guardado: si falta stock se deshace solo este UPDATE
+            with transaction.atomic():
+                if len(deltas) > 1:
+                    # Bloqueo en orden de id para que dos documentos con los mismos productos no se bloqueen entre sí
+                    list(Producto.objects.select_for_update().filter(id__in=deltas).order_by('id').values_list('id'))
+                actualizados = Producto.objects.filter(
+                    GreaterThanOrEqual(F(disponible) + signo * incremento, 0), id__in=deltas
+                ).update(**{campo: F(campo) + incremento})
+                if actualizados < len(deltas):
+                    raise _Faltante
+            return
+        except _Faltante:
+            faltantes = [
+                {'producto_id': producto_id, 'nombre': nombre, 'disponible': stock, 'solicitado': -signo * deltas[producto_id]}
+                for producto_id, nombre, stock in Producto.objects.filter(id__in=deltas).order_by('id')
+                .values_list('id', 'nombre', disponible)
+                if stock + signo * deltas[producto_id] < 0
+            ]
+            # Sin faltantes al releer: el stock se repuso entremedio y se reintenta
+            if faltantes:
+                raise StockInsuficiente(faltantes)
+    raise ValidationError("No se pudo actualizar el stock, intenta de nuevo.")
+
+
+def _actualizar_stock_sucursal(deltas):
+    """
+    Suma `deltas` {(sucursal_id, producto_id): unidades} a StockSucursal con
+    un solo UPDATE condicional; si alguna salida deja una sucursal en
+    negativo lanza StockInsuficiente (con sucursal_id en cada faltante).
+    """
+    entradas = [clave for clave, delta in deltas.items() if delta > 0]
+    if entradas:
+        StockSucursal.objects.bulk_create(
+            [StockSucursal(sucursal_id=sucursal_id, producto_id=producto_id) for sucursal_id, producto_id in entradas],
+            ignore_conflicts=True,
+        )
+    filas = Q()
+    for sucursal_id, producto_id in deltas:
+        filas |= Q(sucursal_id=sucursal_id, producto_id=producto_id)
+    incremento = Case(
+        *[When(sucursal_id=sucursal_id, producto_id=producto_id, then=Value(delta))
+          for (sucursal_id, producto_id), delta in deltas.items()],
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+    for _ in range(INTENTOS):
+        try:
+            # Punto de guardado: si falta stock se deshace solo este UPDATE
+            with transaction.atomic():
+                actualizados = StockSucursal.objects.filter(
+                    filas, GreaterThanOrEqual(F('cantidad') + incremento, 0)
+                ).update(cantidad=F('cantidad') + incremento)
+                if actualizados < len(deltas):
+                    raise _Faltante
+            return
+        except _Faltante:
+            stock = {
+                (sucursal_id, producto_id): cantidad
+                for sucursal_id, producto_id, cantidad in StockSucursal.objects.filter(filas)
+                .values_list('sucursal_id', 'producto_id', 'cantidad')
+            }
+            faltan = {clave: delta for clave, delta in deltas.items() if stock.get(clave, 0) + delta < 0}
+            # Sin faltantes al releer: el stock se repuso entremedio y se reintenta
+            if faltan:
+                nombres = dict(Producto.objects.filter(id__in={producto_id for _, producto_id in faltan}).values_list('id', 'nombre'))
+                raise StockInsuficiente([
+                    {'producto_id': producto_id, 'sucursal_id': sucursal_id, 'nombre': nombres[producto_id],
+                     'disponible': stock.get((sucursal_id, producto_id), 0), 'solicitado': -delta}
+                    for (sucursal_id, producto_id), delta in sorted(faltan.items())
+                ])
+    raise ValidationError("No se pudo actualizar el stock, intenta de nuevo.")
+
+
+def ajustar_stock_sucursal(sucursal_id, cantidades, asignar=False, fecha=None):
+    """
+    Deja el stock de la sucursal en `cantidades` {producto_id: unidades} y
+    registra la diferencia como AJUSTE con sucursal_id.
+
+    - Sin `asignar` es un conteo físico: la diferencia también cambia el
+      stock global del producto.
+    - Con `asignar` es un saldo inicial: las unidades se toman del stock que
+      aún no está en ninguna sucursal (stock_actual menos lo de todas las
+      sucursales) o vuelven a él, y el stock global no cambia. Si no alcanza
+      lanza StockInsuficiente.
+
+    Devuelve los movimientos creados.
+    """
+    fecha = fecha or timezone.now()
+    with atomic_escritura():
+        actuales = dict(
+            StockSucursal.objects.select_for_update().filter(sucursal_id=sucursal_id, producto_id__in=cantidades)
+            .values_list('producto_id', 'cantidad')
+        )
+        diferencias = {
+            producto_id: cantidad - actuales.get(producto_id, 0)
+            for producto_id, cantidad in cantidades.items()
+            if cantidad != actuales.get(producto_id, 0)
+        }
+        movimientos = [
+            InventarioMovimiento(producto_id=producto_id, cantidad=delta, tipo='AJUSTE', fecha=fecha, sucursal_id=sucursal_id)
+            for producto_id, delta in sorted(diferencias.items())
+        ]
+        if asignar and diferencias:
+            _comprobar_sin_sucursal(diferencias)
+            # Contrapartida sin sucursal: el neto por producto es cero y Producto.stock_actual no se toca
+            movimientos += [
+                InventarioMovimiento(producto_id=producto_id, cantidad=-delta, tipo='AJUSTE', fecha=fecha)
+                for producto_id, delta in sorted(diferencias.items())
+            ]
+        return aplicar_movimientos(movimientos)
+
+
+def stock_sin_sucursal(producto_ids=None):
+    """{producto_id: stock_actual menos lo que tienen todas las sucursales}, en una consulta."""
+    en_sucursales = (
+        StockSucursal.objects.filter(producto=OuterRef('pk')).order_by()
+        .values('producto').annotate(total=Sum('cantidad')).values('total')
+    )
+    productos = Producto.objects.all() if producto_ids is None else Producto.objects.filter(id__in=producto_ids)
+    return dict(
+        productos.annotate(sin_sucursal=F('stock_actual') - Coalesce(Subquery(en_sucursales), 0))
+        .values_list('id', 'sin_sucursal')
+    )
+
+
+def _comprobar_sin_sucursal(diferencias):
+    entradas = {producto_id: delta for producto_id, delta in diferencias.items() if delta > 0}
+    if not entradas:
+        return
+    libres = stock_sin_sucursal(entradas)
+    faltan = {producto_id: delta for producto_id, delta in entradas.items() if libres.get(producto_id, 0) < delta}
+    if faltan:
+        nombres = dict(Producto.objects.filter(id__in=faltan).values_list('id', 'nombre'))
+        raise StockInsuficiente([
+            {'producto_id': producto_id, 'nombre': nombres.get(producto_id, producto_id),
+             'disponible': max(libres.get(producto_id, 0), 0), 'solicitado': delta}
+            for producto_id, delta in sorted(faltan.items())
+        ])
+
+
+def faltantes_sucursal(venta_ids, sucursal_id):
+    """
+    Productos que las ventas `venta_ids` piden y la sucursal no tiene, en una
+    sola consulta: las unidades de sus líneas que aún no salieron de esa
+    sucursal (sin las ya entregadas con notas de entrega ni las de ventas
+    COMPLETADA despachadas desde ella) frente a StockSucursal.
+    Devuelve una lista de dicts producto_id, nombre, disponible y solicitado.
+    """
+    en_sucursal = StockSucursal.objects.filter(sucursal_id=sucursal_id, producto=OuterRef('producto')).values('cantidad')
+    filas = (
+        VentaDetalle.objects.filter(venta_id__in=venta_ids)
+        .exclude(venta__estado='CANCELADA')
+        .exclude(venta__estado='COMPLETADA', venta__sucursal_id=sucursal_id)
+        .values('producto_id', 'producto__nombre')
+        .annotate(
+            solicitado=Sum(F('cantidad') - F('cantidad_entregada')),
+            disponible=Coalesce(Subquery(en_sucursal), 0),
+        )
+        .filter(solicitado__gt=F('disponible'))
+        .order_by('producto_id')
+    )
+    return [
+        {'producto_id': fila['producto_id'], 'nombre': fila['producto__nombre'],
+         'disponible': fila['disponible'], 'solicitado': fila['solicitado']}
+        for fila in filas
+    ]
+
+
+def _fin_del_dia(fecha):
+    if isinstance(fecha, datetime):
+        return fecha
+    return timezone.make_aware(datetime.combine(fecha + timedelta(days=1), time.min))
+
+
+def stock_a_fecha(fecha, producto_ids=None):
+    """
+    Stock de cada producto al final de `fecha` (o en el instante dado si es un
+    datetime): el stock actual menos los movimientos posteriores. Los cambios
+    anteriores a la existencia del libro no se pueden reconstruir.
+    Devuelve {producto_id: stock}.
+    """
+    productos = Producto.objects.all()
+    movimientos = InventarioMovimiento.objects.filter(fecha__gte=_fin_del_dia(fecha))
+    if producto_ids is not None:
+        productos = productos.filter(id__in=producto_ids)
+        movimientos = movimientos.filter(producto_id__in=producto_ids)
+
+    stock = dict(productos.values_list('id', 'stock_actual'))
+    posteriores = movimientos.values_list('producto_id').annotate(total=Sum('cantidad')).order_by()
+    for producto_id, total in posteriores:
+        if producto_id in stock:
+            stock[producto_id] -= total
+    return stock
@@ -0,0 +1,68 @@
+"""
+Recepción de pedidos a proveedores.
+
+Toda entrada de stock por pedidos pasa por registrar_recepcion(): las líneas
+de todos los pedidos se leen con una consulta y se aplican con un solo
+aplicar_movimientos() (neteadas por producto y por sucursal, un UPDATE
+agrupado y un bulk_create del libro). PedidoProveedor.save() la usa al pasar
+un pedido a RECIBIDO y PedidoService.recibir() para recibir muchos pedidos
+(p. ej. un camión con varias órdenes) en una sola transacción.
+"""
+from django.utils import timezone
+
+from core.models import InventarioMovimiento, PedidoDetalle, PedidoProveedor
+from core.services.dashboard import invalidar_widgets
+from core.services.inventario import aplicar_movimientos
+from core.transacciones import atomic_escritura
+
+# Pedidos por llamada a la API de recepción
+MAX_PEDIDOS_POR_LOTE = 500
+
+
+def registrar_recepcion(pedidos, fecha=None):
+    """Suma al stock las líneas de `pedidos` (en su sucursal, si tienen) y devuelve los movimientos."""
+    sucursales = {pedido.pk: pedido.sucursal_id for pedido in pedidos}
+    fecha = fecha or timezone.now()
+    return aplicar_movimientos([
+        InventarioMovimiento(
+            producto_id=producto_id, cantidad=cantidad, tipo='RECEPCION', fecha=fecha,
+            pedido_id=pedido_id, sucursal_id=sucursales[pedido_id],
+        )
+        for pedido_id, producto_id, cantidad in PedidoDetalle.objects.filter(pedido__in=list(sucursales))
+        .order_by('pedido_id', 'id').values_list('pedido_id', 'producto_id', 'cantidad')
+    ])
+
+
+class PedidoService:
+
+    @staticmethod
+    @atomic_escritura()
+    def recibir(pedido_ids):
+        """
+        Marca como RECIBIDO los pedidos `pedido_ids` y suma su mercancía al
+        stock con una sola recepción. Los que no existen, ya estaban
+        recibidos o están cancelados se dejan como estaban.
+
+        Devuelve {pedido_id: None si se recibió, o el motivo}.
+        """
+        pedido_ids = list(dict.fromkeys(pedido_ids))
+        pedidos = PedidoProveedor.objects.select_for_update().in_bulk(pedido_ids)
+        resultados = {}
+        recibidos = []
+        for pedido_id in pedido_ids:
+            pedido = pedidos.get(pedido_id)
+            if pedido is None:
+                resultados[pedido_id] = 'El pedido no existe.'
+            elif pedido.estado == 'RECIBIDO':
+                resultados[pedido_id] = 'El pedido ya estaba recibido.'
+            elif pedido.estado == 'CANCELADO':
+                resultados[pedido_id] = 'El pedido está cancelado.'
+            else:
+                resultados[pedido_id] = None
+                recibidos.append(pedido)
+
+        if recibidos:
+            registrar_recepcion(recibidos)
+            PedidoProveedor.objects.filter(id__in=[pedido.pk for pedido in recibidos]).update(estado='RECIBIDO')
+            invalidar_widgets(PedidoProveedor)
+        return resultados
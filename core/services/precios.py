@@ -0,0 +1,40 @@
+"""
+Precio y stock de varios productos a la vez para el punto de venta.
+
+consultar() lee todos los productos pedidos con una sola consulta y firma()
+resume el resultado en un hash que sirve de ETag. La firma sale de las filas
+leídas de la base de datos, no de un contador en caché: así es la misma en
+todos los procesos y cambia en cuanto cambia un precio, el stock o las
+reservas de alguno de los productos, y una petición condicional recibe 304
+solo si nada de eso cambió.
+"""
+import hashlib
+import json
+
+from core.models import Producto
+
+MAX_PRODUCTOS = 200
+
+
+def consultar(producto_ids):
+    """
+    {id (texto): {precio, stock, stock_actual, stock_reservado}} de los
+    productos que existen; `stock` es lo disponible para vender.
+    """
+    filas = Producto.objects.filter(id__in=set(producto_ids)).order_by('id').values_list(
+        'id', 'precio_venta', 'stock_disponible', 'stock_actual', 'stock_reservado'
+    )
+    return {
+        str(producto_id): {
+            'precio': float(precio),
+            'stock': disponible,
+            'stock_actual': stock_actual,
+            'stock_reservado': reservado,
+        }
+        for producto_id, precio, disponible, stock_actual, reservado in filas
+    }
+
+
+def firma(datos):
+    """Hash de una respuesta de consultar(), para usarlo como ETag."""
+    return hashlib.md5(json.dumps(datos, sort_keys=True).encode()).hexdigest()
@@ -0,0 +1,133 @@
+"""
+Pronóstico de demanda y puntos de reorden sugeridos.
+
+La demanda diaria de todos los productos se carga en una matriz NumPy
+(producto x día) desde el resumen diario de ventas, que se alimenta de
+VentaDetalle. Sobre esa matriz se calculan, sin bucles por producto:
+- factores estacionales por día de la semana,
+- suavizado exponencial simple de la demanda desestacionalizada,
+- stock de seguridad según el nivel de servicio y el tiempo de entrega.
+"""
+import math
+from datetime import timedelta
+from decimal import Decimal
+from statistics import NormalDist
+
+import numpy as np
+from django.db.models import Sum
+from django.utils import timezone
+
+from core.models import Producto, VentaResumenDiario
+
+
+def cargar_demanda(dias, hasta):
+    """
+    Devuelve (ids de producto ordenados, matriz de unidades vendidas por día, fecha inicial).
+    Los productos sin ventas en el periodo quedan con filas en cero.
+    """
+    desde = hasta - timedelta(days=dias - 1)
+    producto_ids = np.fromiter(Producto.objects.order_by('id').values_list('id', flat=True), dtype=np.int64)
+    demanda = np.zeros((len(producto_ids), dias))
+
+    filas = list(
+        VentaResumenDiario.objects.filter(
+            producto__isnull=False, fecha__gte=desde, fecha__lte=hasta
+        ).values_list('producto_id', 'fecha').annotate(total=Sum('unidades')).order_by()
+    )
+    if filas:
+        productos, fechas, totales = zip(*filas)
+        fila = np.searchsorted(producto_ids, np.array(productos, dtype=np.int64))
+        columna = (np.array(fechas, dtype='datetime64[D]') - np.datetime64(desde, 'D')).astype(np.int64)
+        np.add.at(demanda, (fila, columna), np.array(totales, dtype=float))
+    # Las correcciones de ventas pueden dejar días netos negativos
+    return producto_ids, np.clip(demanda, 0, None), desde
+
+
+def factores_estacionales(demanda, desde):
+    """Demanda media de cada día de la semana relativa a la media del producto (producto x 7)."""
+    dia_semana = (np.arange(demanda.shape[1]) + desde.weekday()) % 7
+    indicador = np.eye(7)[dia_semana]
+    media_por_dia = (demanda @ indicador) / indicador.sum(axis=0)
+    media = demanda.mean(axis=1, keepdims=True)
+    factores = np.ones_like(media_por_dia)
+    np.divide(media_por_dia, media, out=factores, where=media > 0)
+    return factores, dia_semana, media
+
+
+def suavizado_exponencial(serie, alfa):
+    """Nivel final del suavizado exponencial simple de cada fila, como un producto matricial."""
+    n = serie.shape[1]
+    pesos = alfa * (1 - alfa) ** np.arange(n - 1, -1, -1)
+    pesos[0] = (1 - alfa) ** (n - 1)
+    return serie @ pesos
+
+
+def pronosticar(demanda, desde, horizonte, alfa=0.3):
+    """
+    Devuelve (demanda diaria, demanda esperada en los próximos `horizonte` días,
+    desviación diaria) para cada fila de la matriz.
+    """
+    factores, dia_semana, media = factores_estacionales(demanda, desde)
+    factor_diario = factores[:, dia_semana]
+    # Los días de la semana sin ventas no aportan información: se usa la media del producto
+    desestacionalizada = np.broadcast_to(media, demanda.shape).copy()
+    np.divide(demanda, factor_diario, out=desestacionalizada, where=factor_diario > 0)
+
+    nivel = suavizado_exponencial(desestacionalizada, alfa)
+    desviacion = desestacionalizada.std(axis=1, ddof=1) if demanda.shape[1] > 1 else np.zeros(len(demanda))
+
+    # Días de la semana del horizonte, empezando el día siguiente al último observado
+    ultimo = (desde.weekday() + demanda.shape[1] - 1) % 7
+    dias_horizonte = np.bincount((np.arange(1, horizonte + 1) + ultimo) % 7, minlength=7)
+    demanda_horizonte = nivel * (factores @ dias_horizonte)
+    return nivel, demanda_horizonte, desviacion
+
+
+def calcular_sugerencias(dias=180, tiempo_entrega=7, nivel_servicio=0.95, dias_cobertura=30, alfa=0.3, hasta=None):
+    """
+    Calcula para todos los productos la demanda diaria pronosticada, el punto
+    de reorden (demanda durante el tiempo de entrega + stock de seguridad) y la
+    cantidad de pedido (demanda de `dias_cobertura` días).
+    """
+    if hasta is None:
+        # El día en curso está incompleto
+        hasta = timezone.localdate() - timedelta(days=1)
+    producto_ids, demanda, desde = cargar_demanda(dias, hasta)
+    nivel, demanda_entrega, desviacion = pronosticar(demanda, desde, tiempo_entrega, alfa)
+
+    z = NormalDist().inv_cdf(nivel_servicio)
+    stock_seguridad = z * desviacion * math.sqrt(tiempo_entrega)
+    # Se redondea antes de ceil para que el ruido de coma flotante no sume una unidad
+    return {
+        'producto_ids': producto_ids,
+        'demanda_diaria': nivel,
+        'punto_reorden': np.ceil(np.round(demanda_entrega + stock_seguridad, 6)).astype(np.int64),
+        'cantidad_pedido': np.ceil(np.round(nivel * dias_cobertura, 6)).astype(np.int64),
+    }
+
+
+def actualizar_puntos_reorden(batch_size=1000, **parametros):
+    """Guarda las sugerencias en Producto con bulk_update y devuelve el número de productos."""
+    sugerencias = calcular_sugerencias(**parametros)
+    ahora = timezone.now()
+    productos = [
+        Producto(
+            pk=producto_id,
+            demanda_diaria_pronostico=Decimal(f"{demanda:.3f}"),
+            punto_reorden_sugerido=punto,
+            cantidad_pedido_sugerida=cantidad,
+            pronostico_actualizado=ahora,
+        )
+        for producto_id, demanda, punto, cantidad in zip(
+            sugerencias['producto_ids'].tolist(),
+            sugerencias['demanda_diaria'].tolist(),
+            sugerencias['punto_reorden'].tolist(),
+            sugerencias['cantidad_pedido'].tolist(),
+        )
+    ]
+    Producto.objects.bulk_update(
+        productos,
+        ['demanda_diaria_pronostico', 'punto_reorden_sugerido', 'cantidad_pedido_sugerida', 'pronostico_actualizado'],
+        batch_size=batch_size,
+    )
+    return len(productos)
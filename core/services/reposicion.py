@@ -0,0 +1,107 @@
+"""
+Generación automática de pedidos de reposición.
+
+generar_pedidos() arma en bloque los pedidos BORRADOR para todo lo que está
+bajo su umbral de reorden, con un número fijo de consultas sin importar
+cuántos productos haya:
+
+- una consulta trae los productos cuyo stock más lo ya pedido (pedidos
+  BORRADOR o PENDIENTE) no supera su umbral: el punto de reorden sugerido
+  (ver core.services.pronostico_demanda) o, si no hay, el stock mínimo,
+- otra, con una función de ventana, trae el proveedor y el costo del último
+  PedidoDetalle de cada uno de esos productos,
+- las líneas se agrupan por proveedor y los pedidos y sus detalles se crean
+  con dos bulk_create, con costo_total ya calculado.
+
+Los productos que nunca se pidieron no tienen proveedor y se informan aparte.
+El personal revisa los borradores y los pasa a PENDIENTE al enviarlos.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db.models import F, IntegerField, OuterRef, Subquery, Sum, Value, Window
+from django.db.models.functions import Coalesce, RowNumber
+
+from core.models import PedidoDetalle, PedidoProveedor, Producto
+from core.services.dashboard import invalidar_widgets
+from core.transacciones import atomic_escritura
+
+# Pedidos que todavía no entraron al stock pero ya cubren parte del faltante
+ESTADOS_EN_CAMINO = ('BORRADOR', 'PENDIENTE')
+
+
+def productos_a_reponer():
+    """
+    Productos bajo su umbral de reorden con las unidades a pedir: la cantidad
+    de pedido sugerida (o el stock mínimo) por encima del umbral, menos el
+    stock y lo que ya está en camino.
+    """
+    en_camino = (
+        PedidoDetalle.objects.filter(producto=OuterRef('pk'), pedido__estado__in=ESTADOS_EN_CAMINO).order_by()
+        .values('producto').annotate(total=Sum('cantidad')).values('total')
+    )
+    return (
+        Producto.objects.annotate(
+            umbral=Coalesce('punto_reorden_sugerido', 'stock_minimo'),
+            en_camino=Coalesce(Subquery(en_camino, output_field=IntegerField()), Value(0)),
+        )
+        .filter(umbral__gte=F('stock_actual') + F('en_camino'))
+        .annotate(a_pedir=(
+            F('umbral') + Coalesce('cantidad_pedido_sugerida', 'stock_minimo') - F('stock_actual') - F('en_camino')
+        ))
+        .filter(a_pedir__gt=0)
+    )
+
+
+def ultimas_compras(productos):
+    """{producto_id: (proveedor_id, costo_unitario_compra)} del último PedidoDetalle de cada producto."""
+    filas = (
+        PedidoDetalle.objects.filter(producto__in=productos)
+        .annotate(fila=Window(
+            RowNumber(), partition_by=[F('producto_id')],
+            order_by=[F('pedido__fecha_pedido').desc(), F('id').desc()],
+        ))
+        .filter(fila=1)
+        .values_list('producto_id', 'pedido__proveedor_id', 'costo_unitario_compra')
+    )
+    return {producto_id: (proveedor_id, costo) for producto_id, proveedor_id, costo in filas}
+
+
+@atomic_escritura()
+def generar_pedidos():
+    """
+    Crea un pedido BORRADOR por proveedor con las líneas de reposición.
+    Devuelve ([(pedido, detalles)], ids de productos sin proveedor conocido).
+    """
+    productos = list(productos_a_reponer().values_list('id', 'a_pedir', 'costo_unitario'))
+    if not productos:
+        return [], []
+    compras = ultimas_compras(productos_a_reponer().values('id'))
+
+    lineas = defaultdict(list)
+    sin_proveedor = []
+    for producto_id, cantidad, costo_producto in productos:
+        if producto_id not in compras:
+            sin_proveedor.append(producto_id)
+            continue
+        proveedor_id, costo = compras[producto_id]
+        lineas[proveedor_id].append(PedidoDetalle(
+            producto_id=producto_id, cantidad=cantidad, costo_unitario_compra=costo or costo_producto,
+        ))
+
+    pedidos = [
+        PedidoProveedor(
+            proveedor_id=proveedor_id, estado='BORRADOR',
+            costo_total=sum((d.cantidad * d.costo_unitario_compra for d in detalles), Decimal('0')),
+        )
+        for proveedor_id, detalles in sorted(lineas.items())
+    ]
+    PedidoProveedor.objects.bulk_create(pedidos)
+    detalles = []
+    for pedido in pedidos:
+        for detalle in lineas[pedido.proveedor_id]:
+            detalle.pedido = pedido
+            detalles.append(detalle)
+    PedidoDetalle.objects.bulk_create(detalles)
+    invalidar_widgets(PedidoProveedor, PedidoDetalle)
+    return [(pedido, lineas[pedido.proveedor_id]) for pedido in pedidos], sin_proveedor
@@ -0,0 +1,134 @@
+"""
+Reservas de stock de cotizaciones y borradores.
+
+Mientras una venta está en COTIZACION o BORRADOR, cada línea aparta sus
+unidades en ReservaStock hasta `expira` (RESERVA_STOCK_HORAS después del
+último cambio de la línea). Producto.stock_reservado lleva la suma de las
+reservas vigentes y se ajusta con un UPDATE ... F() en cada cambio, de modo
+que Producto.stock_disponible (stock_actual - stock_reservado, columna
+generada) nunca se calcula sumando reservas por petición.
+
+- Reservar no falla por falta de stock: se cotiza aunque no haya, y cada
+  línea aparta solo lo disponible (el resto se comprueba al completar la venta).
+- La reserva se libera cuando la venta sale de COTIZACION/BORRADOR (al
+  completarla sus unidades se descuentan del stock), cuando se borra la línea
+  y, en parte, cuando una nota de entrega reparte las unidades reservadas.
+- El comando liberar_reservas_vencidas libera en bloque las reservas
+  vencidas; conviene programarlo cada pocos minutos (cron o similar).
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from core.models import Producto, ReservaStock
+from core.services.inventario import ajustar_reservado
+from core.transacciones import atomic_escritura
+
+ESTADOS_CON_RESERVA = ('COTIZACION', 'BORRADOR')
+
+
+def duracion_reserva():
+    return timedelta(hours=getattr(settings, 'RESERVA_STOCK_HORAS', 24))
+
+
+def reservar(detalles):
+    """
+    Crea o ajusta la reserva de cada línea (VentaDetalle guardado) a su
+    producto y cantidad actuales y renueva su vencimiento. Si no hay stock
+    disponible para toda la línea aparta lo que haya (la reserva queda por
+    debajo de la cantidad, ver VentaDetalle.cantidad_sin_reserva) y devuelve
+    esas líneas como faltantes de StockInsuficiente, sin lanzarla.
+    """
+    detalles = list(detalles)
+    if not detalles:
+        return []
+    expira = timezone.now() + duracion_reserva()
+    with atomic_escritura():
+        actuales = {
+            reserva.detalle_id: reserva
+            for reserva in ReservaStock.objects.select_for_update().filter(detalle__in=[d.pk for d in detalles])
+        }
+        productos = {
+            producto_id: [nombre, max(disponible, 0)]
+            for producto_id, nombre, disponible in Producto.objects.select_for_update().filter(
+                id__in={d.producto_id for d in detalles} | {r.producto_id for r in actuales.values()}
+            ).values_list('id', 'nombre', 'stock_disponible')
+        }
+        # Lo que ya apartaban estas líneas vuelve a repartirse
+        for reserva in actuales.values():
+            productos[reserva.producto_id][1] += reserva.cantidad
+
+        deltas = defaultdict(int)
+        nuevas, cambiadas, faltantes = [], [], []
+        for detalle in detalles:
+            nombre, disponible = productos[detalle.producto_id]
+            apartadas = min(detalle.cantidad, disponible)
+            productos[detalle.producto_id][1] -= apartadas
+            if apartadas < detalle.cantidad:
+                faltantes.append({'producto_id': detalle.producto_id, 'nombre': nombre,
+                                  'disponible': apartadas, 'solicitado': detalle.cantidad})
+            reserva = actuales.get(detalle.pk)
+            deltas[detalle.producto_id] += apartadas
+            if reserva is None:
+                nuevas.append(ReservaStock(
+                    detalle=detalle, producto_id=detalle.producto_id, cantidad=apartadas, expira=expira
+                ))
+            else:
+                deltas[reserva.producto_id] -= reserva.cantidad
+                reserva.producto_id, reserva.cantidad, reserva.expira = detalle.producto_id, apartadas, expira
+                cambiadas.append(reserva)
+
+        ajustar_reservado(deltas)
+        ReservaStock.objects.bulk_create(nuevas)
+        ReservaStock.objects.bulk_update(cambiadas, ['producto', 'cantidad', 'expira'])
+    return faltantes
+
+
+def liberar(reservas):
+    """Borra las reservas del queryset y descuenta sus unidades. Devuelve cuántas liberó."""
+    with atomic_escritura():
+        filas = list(reservas.select_for_update().values_list('id', 'producto_id', 'cantidad'))
+        if not filas:
+            return 0
+        deltas = defaultdict(int)
+        for _, producto_id, cantidad in filas:
+            deltas[producto_id] -= cantidad
+        ReservaStock.objects.filter(id__in=[fila[0] for fila in filas]).delete()
+        ajustar_reservado(deltas)
+    return len(filas)
+
+
+def liberar_venta(venta):
+    return liberar(ReservaStock.objects.filter(detalle__venta=venta))
+
+
+def liberar_vencidas(ahora=None):
+    return liberar(ReservaStock.objects.filter(expira__lte=ahora or timezone.now()))
+
+
+def consumir(venta, lineas):
+    """
+    Descuenta de las reservas de `venta` las unidades entregadas, pares
+    (producto_id, cantidad), para que no se cuenten dos veces.
+    """
+    pendientes = defaultdict(int)
+    for producto_id, cantidad in lineas:
+        pendientes[producto_id] += cantidad
+    with atomic_escritura():
+        reservas = ReservaStock.objects.select_for_update().filter(detalle__venta=venta, producto_id__in=pendientes)
+        deltas = defaultdict(int)
+        agotadas, cambiadas = [], []
+        for reserva in reservas.order_by('id'):
+            usadas = min(reserva.cantidad, pendientes[reserva.producto_id])
+            if not usadas:
+                continue
+            pendientes[reserva.producto_id] -= usadas
+            deltas[reserva.producto_id] -= usadas
+            reserva.cantidad -= usadas
+            (cambiadas if reserva.cantidad else agotadas).append(reserva)
+
+        ReservaStock.objects.filter(id__in=[reserva.id for reserva in agotadas]).delete()
+        ReservaStock.objects.bulk_update(cambiadas, ['cantidad'])
+        ajustar_reservado(deltas)
@@ -0,0 +1,223 @@
+"""
+Mantenimiento del resumen diario de ventas (VentaResumenDiario).
+
+El resumen se actualiza con incrementos F() cada vez que una venta entra o
+sale del estado COMPLETADA, cuando cambia una línea de una venta completada
+y cuando se borra una venta completada o una de sus líneas (core.signals), de modo que el dashboard lee O(días) filas en lugar de recorrer todas las ventas.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from core.models import Producto, Venta, VentaDetalle, VentaResumenDiario
+from core.transacciones import atomic_escritura
+
+_MONTO = DecimalField(max_digits=14, decimal_places=2)
+
+
+def _acumular(fecha, producto_id, cliente_id, usuario_id, num_ventas=0, unidades=0, ingresos=0, costo=0):
+    """Suma los valores indicados a la fila del resumen, creándola si no existe."""
+    if not any([num_ventas, unidades, ingresos, costo]):
+        return
+    fila = VentaResumenDiario.objects.filter(
+        fecha=fecha, producto_id=producto_id, cliente_id=cliente_id, usuario_id=usuario_id
+    )
+    incrementos = dict(
+        num_ventas=F('num_ventas') + num_ventas,
+        unidades=F('unidades') + unidades,
+        ingresos=F('ingresos') + ingresos,
+        costo=F('costo') + costo,
+    )
+    if fila.update(**incrementos):
+        return
+    try:
+        with transaction.atomic():
+            VentaResumenDiario.objects.create(
+                fecha=fecha, producto_id=producto_id, cliente_id=cliente_id, usuario_id=usuario_id,
+                num_ventas=num_ventas, unidades=unidades, ingresos=ingresos, costo=costo,
+            )
+    except IntegrityError:
+        # Otra transacción creó la fila entre el UPDATE y el INSERT: se suma a la suya
+        fila.update(**incrementos)
+
+
+def _acumular_lote(filas):
+    """
+    Como _acumular para muchas filas a la vez: una consulta para leer las
+    existentes, un bulk_update con incrementos F() y un bulk_create (fila a
+    fila con _acumular si otra transacción se adelantó a crear alguna).
+    `filas` es {(fecha, producto_id, cliente_id, usuario_id): (num_ventas, unidades, ingresos, costo)}.
+    """
+    filas = {clave: valores for clave, valores in filas.items() if any(valores)}
+    if not filas:
+        return
+    claves = list(filas)
+    clientes = {clave[2] for clave in claves}
+    por_cliente = Q(cliente_id__in=clientes - {None})
+    if None in clientes:
+        por_cliente |= Q(cliente__isnull=True)
+    # Puede traer filas de más (combinaciones cruzadas); se filtran por clave
+    existentes = {
+        (fila.fecha, fila.producto_id, fila.cliente_id, fila.usuario_id): fila
+        for fila in VentaResumenDiario.objects.filter(
+            por_cliente,
+            fecha__in={clave[0] for clave in claves},
+            usuario_id__in={clave[3] for clave in claves},
+        ).only('id', 'fecha', 'producto_id', 'cliente_id', 'usuario_id')
+    }
+    actualizar, crear = [], []
+    for (fecha, producto_id, cliente_id, usuario_id), (num_ventas, unidades, ingresos, costo) in filas.items():
+        fila = existentes.get((fecha, producto_id, cliente_id, usuario_id))
+        if fila is None:
+            crear.append(VentaResumenDiario(
+                fecha=fecha, producto_id=producto_id, cliente_id=cliente_id, usuario_id=usuario_id,
+                num_ventas=num_ventas, unidades=unidades, ingresos=ingresos, costo=costo,
+            ))
+        else:
+            fila.num_ventas = F('num_ventas') + num_ventas
+            fila.unidades = F('unidades') + unidades
+            fila.ingresos = F('ingresos') + ingresos
+            fila.costo = F('costo') + costo
+            actualizar.append(fila)
+    if actualizar:
+        VentaResumenDiario.objects.bulk_update(actualizar, ['num_ventas', 'unidades', 'ingresos', 'costo'])
+    if crear:
+        try:
+            with transaction.atomic():
+                VentaResumenDiario.objects.bulk_create(crear)
+        except IntegrityError:
+            # Alguna fila la creó otra transacción mientras tanto: se van sumando de una en una
+            for nueva in crear:
+                _acumular(nueva.fecha, nueva.producto_id, nueva.cliente_id, nueva.usuario_id,
+                          nueva.num_ventas, nueva.unidades, nueva.ingresos, nueva.costo)
+
+
+def registrar_venta(venta, signo):
+    """
+    Suma (signo=1) o resta (signo=-1) una venta completa del resumen:
+    una fila por producto y la fila de totales de la venta, con un número
+    de consultas que no depende de las líneas.
+    """
+    registrar_ventas([venta], signo)
+
+
+def registrar_ventas(ventas, signo):
+    """Como registrar_venta para varias ventas, con un número de consultas que no depende de cuántas son."""
+    ventas = {venta.pk: venta for venta in ventas}
+    if not ventas:
+        return
+    filas = defaultdict(lambda: [0, 0, Decimal('0'), Decimal('0')])
+    for venta in ventas.values():
+        # Fila de totales: la venta cuenta aunque no tenga líneas
+        filas[(timezone.localdate(venta.fecha), None, venta.cliente_id, venta.usuario_id)][0] += 1
+    lineas = VentaDetalle.objects.filter(venta_id__in=ventas).values_list(
+        'venta_id', 'producto_id', 'cantidad', 'precio_unitario_venta', 'producto__costo_unitario'
+    )
+    for venta_id, producto_id, cantidad, precio, costo_unitario in lineas:
+        venta = ventas[venta_id]
+        fecha = timezone.localdate(venta.fecha)
+        fila = filas[(fecha, producto_id, venta.cliente_id, venta.usuario_id)]
+        fila[0] += 1
+        fila[1] += cantidad
+        fila[2] += cantidad * precio
+        fila[3] += cantidad * (costo_unitario or 0)
+        filas[(fecha, None, venta.cliente_id, venta.usuario_id)][2] += cantidad * precio
+
+    with atomic_escritura():
+        _acumular_lote({clave: tuple(signo * valor for valor in valores) for clave, valores in filas.items()})
+
+
+def registrar_cambio_detalle(detalle, anterior=None):
+    """
+    Aplica al resumen la diferencia de una línea de una venta COMPLETADA.
+    `anterior` es la tupla (producto_id, cantidad, precio) persistida antes del cambio.
+    """
+    venta = detalle.venta
+    fecha = timezone.localdate(venta.fecha)
+    costo_unitario = detalle.producto.costo_unitario or 0
+
+    with atomic_escritura():
+        ingresos_delta = detalle.subtotal
+        if anterior is None:
+            _acumular(fecha, detalle.producto_id, venta.cliente_id, venta.usuario_id, 1, detalle.cantidad, detalle.subtotal,
+                      detalle.cantidad * costo_unitario)
+        else:
+            producto_id, cantidad, precio = anterior
+            ingreso_anterior = (cantidad or 0) * (precio or 0)
+            ingresos_delta -= ingreso_anterior
+            if producto_id != detalle.producto_id:
+                # La línea cambió de producto: se traslada completa
+                _acumular(fecha, producto_id, venta.cliente_id, venta.usuario_id, -1, -(cantidad or 0), -ingreso_anterior,
+                          -(cantidad or 0) * costo_unitario)
+                _acumular(fecha, detalle.producto_id, venta.cliente_id, venta.usuario_id, 1, detalle.cantidad, detalle.subtotal,
+                          detalle.cantidad * costo_unitario)
+            else:
+                unidades_delta = detalle.cantidad - (cantidad or 0)
+                _acumular(fecha, detalle.producto_id, venta.cliente_id, venta.usuario_id, 0, unidades_delta,
+                          detalle.subtotal - ingreso_anterior, unidades_delta * costo_unitario)
+        _acumular(fecha, None, venta.cliente_id, venta.usuario_id, ingresos=ingresos_delta)
+
+
+def quitar_detalle(detalle):
+    """Resta del resumen una línea de una venta COMPLETADA que se borra, con sus valores persistidos."""
+    venta = detalle.venta
+    producto_id, cantidad, precio = detalle._valores_anteriores or (detalle.producto_id, detalle.cantidad, detalle.precio_unitario_venta)
+    costo_unitario = Producto.objects.filter(pk=producto_id).values_list('costo_unitario', flat=True).first() or 0
+    ingresos = cantidad * precio
+    with atomic_escritura():
+        _acumular(timezone.localdate(venta.fecha), producto_id, venta.cliente_id, venta.usuario_id,
+                  -1, -cantidad, -ingresos, -cantidad * costo_unitario)
+        _acumular(timezone.localdate(venta.fecha), None, venta.cliente_id, venta.usuario_id, ingresos=-ingresos)
+
+
+@atomic_escritura()
+def reconstruir_resumen(batch_size=1000):
+    """Recalcula todo el resumen a partir del histórico de ventas COMPLETADAS."""
+    VentaResumenDiario.objects.all().delete()
+
+    lineas = VentaDetalle.objects.filter(
+        venta__estado='COMPLETADA'
+    ).annotate(
+        dia=TruncDate('venta__fecha')
+    ).values(
+        'dia', 'producto_id', 'venta__cliente_id', 'venta__usuario_id'
+    ).annotate(
+        lineas=Count('id'),
+        total_unidades=Sum('cantidad'),
+        total_ingresos=Sum(ExpressionWrapper(F('cantidad') * F('precio_unitario_venta'), output_field=_MONTO)),
+        total_costo=Sum(ExpressionWrapper(F('cantidad') * F('producto__costo_unitario'), output_field=_MONTO)),
+    ).order_by()
+
+    ventas = Venta.objects.filter(
+        estado='COMPLETADA'
+    ).annotate(
+        dia=TruncDate('fecha')
+    ).values(
+        'dia', 'cliente_id', 'usuario_id'
+    ).annotate(
+        total_ventas=Count('id'),
+        total_ingresos=Sum('monto_total'),
+    ).order_by()
+
+    filas = [
+        VentaResumenDiario(
+            fecha=fila['dia'], producto_id=fila['producto_id'], cliente_id=fila['venta__cliente_id'],
+            usuario_id=fila['venta__usuario_id'],
+            num_ventas=fila['lineas'], unidades=fila['total_unidades'] or 0,
+            ingresos=fila['total_ingresos'] or 0, costo=fila['total_costo'] or 0,
+        )
+        for fila in lineas.iterator()
+    ]
+    filas.extend(
+        VentaResumenDiario(
+            fecha=fila['dia'], producto=None, cliente_id=fila['cliente_id'], usuario_id=fila['usuario_id'],
+            num_ventas=fila['total_ventas'], ingresos=fila['total_ingresos'] or 0,
+        )
+        for fila in ventas.iterator()
+    )
+    VentaResumenDiario.objects.bulk_create(filas, batch_size=batch_size)
+    return len(filas)
@@ -0,0 +1,361 @@
+"""
+Operaciones de ventas en bloque.
+
+Guardar las líneas una a una con VentaDetalle.save() sirve para ediciones
+sueltas, pero en una venta nueva cada línea actualiza el total y la venta.
+VentaService.crear_venta() guarda la venta y todas sus líneas con un número
+fijo de consultas, sin importar cuántas líneas tenga.
+
+Del mismo modo, VentaService.cambiar_estados() cambia el estado de muchas
+ventas (p. ej. el cierre del día) y VentaService.sincronizar() registra las
+ventas que un punto de venta hizo sin conexión, cada lote en una transacción
+y sin pasar por Venta.save() venta a venta.
+"""
+import uuid
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db.models import Case, DateTimeField, Value, When
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from core.models import Cliente, InventarioMovimiento, Producto, ReservaStock, StockSucursal, Venta, VentaDetalle
+from core.services.dashboard import invalidar_widgets
+from core.services.inventario import StockInsuficiente, aplicar_movimientos
+from core.services.reservas import ESTADOS_CON_RESERVA, liberar, reservar
+from core.services.resumen_ventas import registrar_ventas
+from core.transacciones import atomic_escritura
+
+# Ventas por llamada a las APIs de cambio de estado y de sincronización
+MAX_VENTAS_POR_LOTE = 1000
+
+
+def _leer_venta_sin_conexion(datos):
+    """(uuid, fecha, cliente_id, [(producto_id, cantidad, precio)]) de una venta recibida por sincronizar()."""
+    fecha = None
+    if datos.get('fecha'):
+        fecha = parse_datetime(datos['fecha'])
+        if fecha is None:
+            raise ValueError(datos['fecha'])
+        if timezone.is_naive(fecha):
+            fecha = timezone.make_aware(fecha)
+    lineas = [
+        (int(linea['producto']), int(linea['cantidad']),
+         Decimal(str(linea['precio'])) if linea.get('precio') is not None else None)
+        for linea in datos['lineas']
+    ]
+    if not lineas or any(cantidad < 1 for _, cantidad, _ in lineas):
+        raise ValueError('lineas')
+    return uuid.UUID(str(datos['uuid'])), fecha, int(datos['cliente']) if datos.get('cliente') else None, lineas
+
+
+class VentaService:
+
+    @staticmethod
+    @atomic_escritura()
+    def crear_venta(venta, lineas):
+        """
+        Guarda `venta` (sin guardar, con usuario y estado) con sus `lineas`,
+        pares (producto, cantidad) o tríos (producto, cantidad, precio); sin
+        precio se usa el de venta del producto.
+
+        - monto_total se calcula una vez y se escribe al insertar la venta,
+        - las líneas se insertan con un solo bulk_create,
+        - si el estado final es COMPLETADA, el stock de todas las líneas se
+          reserva con un solo UPDATE condicional al pasar la venta a ese
+          estado (lanza StockInsuficiente con las líneas que no alcanzan) y el
+          resumen diario se actualiza en bloque,
+        - en COTIZACION o BORRADOR todas las líneas se reservan juntas, con el
+          stock que haya (una cotización no falla por falta de stock).
+        """
+        detalles = []
+        for linea in lineas:
+            producto, cantidad, precio = (tuple(linea) + (None,))[:3]
+            detalles.append(VentaDetalle(
+                producto=producto, cantidad=cantidad,
+                precio_unitario_venta=precio or producto.precio_venta,
+            ))
+
+        estado = venta.estado
+        venta.monto_total = sum((d.cantidad * d.precio_unitario_venta for d in detalles), Decimal('0'))
+        # En borrador no mueve stock ni resumen y bulk_create no reserva; todo se aplica junto al final
+        venta.estado = 'BORRADOR'
+        venta.save()
+
+        for detalle in detalles:
+            detalle.venta = venta
+        VentaDetalle.objects.bulk_create(detalles)
+
+        if estado != venta.estado:
+            venta.estado = estado
+            venta.save(update_fields=['estado'])
+        if estado in ESTADOS_CON_RESERVA:
+            reservar(detalles)
+        return venta
+
+    @staticmethod
+    @atomic_escritura()
+    def cambiar_estados(venta_ids, estado):
+        """
+        Pasa las ventas `venta_ids` a `estado` en una sola transacción, con el
+        mismo efecto que guardar cada una con Venta.save():
+
+        - el stock que entra o sale se netea por producto entre todas las
+          ventas y se aplica con un solo UPDATE agrupado (y las reservas se
+          liberan o crean en bloque),
+        - el stock disponible (y el de la sucursal de cada venta) se lee una
+          vez y se reparte en orden de id; las ventas que no alcanzan se dejan
+          como estaban y se informan,
+        - el resumen diario se actualiza en bloque.
+
+        Devuelve {venta_id: None si quedó en `estado`, o el motivo del fallo}.
+        """
+        resultados = {}
+        ventas = Venta.objects.select_for_update().in_bulk(venta_ids)
+        for venta_id in venta_ids:
+            if venta_id not in ventas:
+                resultados[venta_id] = 'La venta no existe.'
+        cambian = []
+        for venta in sorted(ventas.values(), key=lambda venta: venta.pk):
+            if venta.estado == estado:
+                resultados[venta.pk] = None
+            else:
+                cambian.append(venta)
+
+        completa = estado == 'COMPLETADA'
+        reserva = estado in ESTADOS_CON_RESERVA
+        lineas = defaultdict(lambda: defaultdict(int))
+        for venta_id, producto_id, cantidad in VentaDetalle.objects.filter(venta__in=cambian).values_list(
+            'venta_id', 'producto_id', 'cantidad'
+        ):
+            lineas[venta_id][producto_id] += cantidad
+        reservado = defaultdict(lambda: defaultdict(int))
+        for venta_id, producto_id, cantidad in ReservaStock.objects.filter(detalle__venta__in=cambian).values_list(
+            'detalle__venta_id', 'producto_id', 'cantidad'
+        ):
+            reservado[venta_id][producto_id] += cantidad
+
+        def libera(venta):
+            """Unidades que vuelven a estar disponibles si la venta cambia."""
+            unidades = defaultdict(int)
+            if venta.estado == 'COMPLETADA':
+                for producto_id, cantidad in lineas[venta.pk].items():
+                    unidades[producto_id] += cantidad
+            if venta.estado in ESTADOS_CON_RESERVA and not reserva:
+                for producto_id, cantidad in reservado[venta.pk].items():
+                    unidades[producto_id] += cantidad
+            return unidades
+
+        def consume(venta):
+            # Pasar a COTIZACION o BORRADOR no falla por stock: reservar() aparta lo que haya
+            return lineas[venta.pk] if completa else {}
+
+        productos = {
+            producto_id: [nombre, disponible]
+            for producto_id, nombre, disponible in Producto.objects.select_for_update().filter(
+                id__in={producto_id for unidades in lineas.values() for producto_id in unidades}
+            ).values_list('id', 'nombre', 'stock_disponible')
+        }
+        # Las ventas con sucursal mueven también su StockSucursal al entrar o salir de COMPLETADA
+        con_sucursal = [venta for venta in cambian if venta.sucursal_id and (completa or venta.estado == 'COMPLETADA')]
+        en_sucursal = defaultdict(int)
+        if con_sucursal:
+            en_sucursal.update({
+                (sucursal_id, producto_id): cantidad
+                for sucursal_id, producto_id, cantidad in StockSucursal.objects.select_for_update().filter(
+                    sucursal_id__in={venta.sucursal_id for venta in con_sucursal},
+                    producto_id__in={producto_id for venta in con_sucursal for producto_id in lineas[venta.pk]},
+                ).values_list('sucursal_id', 'producto_id', 'cantidad')
+            })
+        # Primero lo que solo devuelve stock, después las que consumen en orden de id
+        aplicadas = []
+        for venta in sorted(cambian, key=lambda venta: bool(consume(venta))):
+            liberadas, necesarias = libera(venta), consume(venta)
+            faltantes = [
+                {'producto_id': producto_id, 'nombre': productos[producto_id][0],
+                 'disponible': productos[producto_id][1] + liberadas[producto_id], 'solicitado': cantidad}
+                for producto_id, cantidad in sorted(necesarias.items())
+                if productos[producto_id][1] + liberadas[producto_id] < cantidad
+            ]
+            signo_sucursal = 0
+            if venta.sucursal_id:
+                signo_sucursal = -1 if completa else (1 if venta.estado == 'COMPLETADA' else 0)
+            if signo_sucursal < 0:
+                faltantes.extend(
+                    {'producto_id': producto_id, 'sucursal_id': venta.sucursal_id, 'nombre': productos[producto_id][0],
+                     'disponible': en_sucursal[venta.sucursal_id, producto_id], 'solicitado': cantidad}
+                    for producto_id, cantidad in sorted(lineas[venta.pk].items())
+                    if en_sucursal[venta.sucursal_id, producto_id] < cantidad
+                )
+            if faltantes:
+                resultados[venta.pk] = ' '.join(StockInsuficiente(faltantes).messages)
+                continue
+            for producto_id, cantidad in liberadas.items():
+                productos[producto_id][1] += cantidad
+            for producto_id, cantidad in necesarias.items():
+                productos[producto_id][1] -= cantidad
+            for producto_id, cantidad in lineas[venta.pk].items():
+                en_sucursal[venta.sucursal_id, producto_id] += signo_sucursal * cantidad
+            aplicadas.append(venta)
+            resultados[venta.pk] = None
+
+        if aplicadas:
+            liberar(ReservaStock.objects.filter(
+                detalle__venta__in=[venta for venta in aplicadas if venta.estado in ESTADOS_CON_RESERVA and not reserva]
+            ))
+            ahora = timezone.now()
+            movimientos = []
+            for venta in aplicadas:
+                if venta.estado == 'COMPLETADA':
+                    movimientos.extend(
+                        InventarioMovimiento(
+                            producto_id=producto_id, cantidad=cantidad, tipo='VENTA_REVERTIDA', fecha=ahora,
+                            venta=venta, sucursal_id=venta.sucursal_id,
+                        )
+                        for producto_id, cantidad in lineas[venta.pk].items()
+                    )
+                elif completa:
+                    movimientos.extend(
+                        InventarioMovimiento(
+                            producto_id=producto_id, cantidad=-cantidad, tipo='VENTA', fecha=ahora,
+                            venta=venta, sucursal_id=venta.sucursal_id,
+                        )
+                        for producto_id, cantidad in lineas[venta.pk].items()
+                    )
+            aplicar_movimientos(movimientos, respetar_reservas=True)
+            if reserva:
+                reservar(VentaDetalle.objects.filter(
+                    venta__in=[venta for venta in aplicadas if venta.estado not in ESTADOS_CON_RESERVA]
+                ))
+
+            campos = {'estado': estado}
+            if estado == 'PAGADA_PENDIENTE_ENTREGA':
+                campos['requiere_domicilio'] = True
+            Venta.objects.filter(id__in=[venta.pk for venta in aplicadas]).update(**campos)
+
+            if completa:
+                registrar_ventas(aplicadas, 1)
+            else:
+                registrar_ventas([venta for venta in aplicadas if venta.estado == 'COMPLETADA'], -1)
+            invalidar_widgets(Venta)
+        return resultados
+
+    @staticmethod
+    @atomic_escritura()
+    def sincronizar(usuario, ventas):
+        """
+        Registra como COMPLETADAS las ventas que un punto de venta hizo sin
+        conexión. Cada venta es un dict {"uuid", "fecha" (ISO, opcional),
+        "cliente" (opcional), "lineas": [{"producto", "cantidad", "precio"}]}
+        (precio opcional), con los ids de buscar_productos/get_producto_precio.
+
+        - Las ventas cuyo uuid ya se registró (en la base o antes en el lote)
+          no se vuelven a crear; una copia repetida en el lote recibe el
+          resultado de la primera si esta no se pudo crear,
+        - el stock disponible se lee una vez y se reparte en el orden del
+          lote; las ventas que no alcanzan quedan como conflicto,
+        - ventas, líneas, movimientos y resumen se escriben en bloque, con un
+          número de consultas que no depende del tamaño del lote.
+
+        Devuelve un dict por venta con uuid, resultado (creada, duplicada,
+        conflicto o invalida), venta_id y, si falló, error (y faltantes).
+        """
+        resultados, entradas = [], []
+        for datos in ventas:
+            resultado = {'uuid': None, 'resultado': 'invalida', 'venta_id': None}
+            resultados.append(resultado)
+            try:
+                uuid_cliente, fecha, cliente_id, lineas = _leer_venta_sin_conexion(datos)
+            except (KeyError, TypeError, ValueError, AttributeError, ArithmeticError):
+                resultado['error'] = 'Datos de la venta no válidos.'
+                continue
+            resultado['uuid'] = str(uuid_cliente)
+            entradas.append((resultado, uuid_cliente, fecha, cliente_id, lineas))
+
+        productos = Producto.objects.select_for_update().in_bulk(
+            {producto_id for *_, lineas in entradas for producto_id, _, _ in lineas}
+        )
+        clientes = set(Cliente.objects.filter(
+            id__in={cliente_id for _, _, _, cliente_id, _ in entradas if cliente_id}
+        ).values_list('id', flat=True))
+        registradas = dict(Venta.objects.filter(
+            uuid_cliente__in=[uuid_cliente for _, uuid_cliente, *_ in entradas]
+        ).values_list('uuid_cliente', 'id'))
+        disponible = {producto_id: producto.stock_disponible for producto_id, producto in productos.items()}
+
+        primeras, repetidas, nuevas = {}, [], []
+        for resultado, uuid_cliente, fecha, cliente_id, lineas in entradas:
+            if uuid_cliente in registradas:
+                resultado.update(resultado='duplicada', venta_id=registradas[uuid_cliente])
+                continue
+            if uuid_cliente in primeras:
+                repetidas.append((resultado, primeras[uuid_cliente]))
+                continue
+            primeras[uuid_cliente] = resultado
+            if any(producto_id not in productos for producto_id, _, _ in lineas) or (cliente_id and cliente_id not in clientes):
+                resultado['error'] = 'Producto o cliente inexistente.'
+                continue
+
+            necesarias = defaultdict(int)
+            for producto_id, cantidad, _ in lineas:
+                necesarias[producto_id] += cantidad
+            faltantes = [
+                {'producto_id': producto_id, 'nombre': productos[producto_id].nombre,
+                 'disponible': disponible[producto_id], 'solicitado': cantidad}
+                for producto_id, cantidad in sorted(necesarias.items())
+                if disponible[producto_id] < cantidad
+            ]
+            if faltantes:
+                resultado.update(
+                    resultado='conflicto', error=' '.join(StockInsuficiente(faltantes).messages), faltantes=faltantes
+                )
+                continue
+            for producto_id, cantidad in necesarias.items():
+                disponible[producto_id] -= cantidad
+
+            detalles = [
+                VentaDetalle(
+                    producto_id=producto_id, cantidad=cantidad,
+                    precio_unitario_venta=precio if precio is not None else productos[producto_id].precio_venta,
+                )
+                for producto_id, cantidad, precio in lineas
+            ]
+            venta = Venta(
+                usuario=usuario, cliente_id=cliente_id, estado='COMPLETADA', uuid_cliente=uuid_cliente,
+                monto_total=sum((detalle.subtotal for detalle in detalles), Decimal('0')),
+            )
+            nuevas.append((resultado, venta, fecha, detalles))
+
+        if nuevas:
+            Venta.objects.bulk_create([venta for _, venta, _, _ in nuevas])
+            # fecha es auto_now_add: la hora real de la venta se escribe después, en un solo UPDATE
+            con_fecha = [(venta, fecha) for _, venta, fecha, _ in nuevas if fecha]
+            if con_fecha:
+                Venta.objects.filter(id__in=[venta.pk for venta, _ in con_fecha]).update(fecha=Case(
+                    *[When(id=venta.pk, then=Value(fecha)) for venta, fecha in con_fecha],
+                    output_field=DateTimeField(),
+                ))
+                for venta, fecha in con_fecha:
+                    venta.fecha = fecha
+
+            movimientos = []
+            for resultado, venta, _, detalles in nuevas:
+                resultado.update(resultado='creada', venta_id=venta.pk)
+                for detalle in detalles:
+                    detalle.venta = venta
+                    movimientos.append(InventarioMovimiento(
+                        producto_id=detalle.producto_id, cantidad=-detalle.cantidad, tipo='VENTA',
+                        fecha=venta.fecha, venta=venta,
+                    ))
+            VentaDetalle.objects.bulk_create([detalle for *_, detalles in nuevas for detalle in detalles])
+            aplicar_movimientos(movimientos, respetar_reservas=True)
+            registrar_ventas([venta for _, venta, _, _ in nuevas], 1)
+            invalidar_widgets(Venta, VentaDetalle)
+
+        for resultado, primera in repetidas:
+            if primera['resultado'] == 'creada':
+                resultado.update(resultado='duplicada', venta_id=primera['venta_id'])
+            else:
+                # La primera copia no se registró: la repetida corre su misma suerte
+                resultado.update({clave: valor for clave, valor in primera.items() if clave != 'uuid'})
+        return resultados
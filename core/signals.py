@@ -0,0 +1,88 @@
+"""
+Señales de la app core.
+
+- Invalidan los widgets del dashboard cuando se escriben los modelos de los
+  que dependen (ver core.services.dashboard.WIDGETS).
+- Mantienen el índice de búsqueda de productos (core.services.busqueda_productos)
+  y, al confirmarse la transacción, el índice en memoria del autocompletado
+  (core.services.indice_productos).
+- Propagan los cambios de stock hechos con UPDATE por core.services.inventario,
+  que no pasan por Producto.save().
+- Liberan la reserva de stock de las líneas de venta que se borran.
+- Restan del resumen diario (core.services.resumen_ventas) las ventas
+  COMPLETADA que se borran y las líneas que se borran de ellas.
+"""
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save, pre_delete
+
+from core.models import Producto, ReservaStock, Venta, VentaDetalle
+from core.services.busqueda_productos import desindexar_producto, indexar_producto
+from core.services.dashboard import invalidar_widgets, modelos_observados
+from core.services import indice_productos
+from core.services.inventario import stock_actualizado
+from core.services.reservas import liberar
+from core.services.resumen_ventas import quitar_detalle, registrar_venta
+
+
+def invalidar_dashboard(sender, **kwargs):
+    invalidar_widgets(sender)
+
+
+for modelo in modelos_observados():
+    post_save.connect(invalidar_dashboard, sender=modelo, dispatch_uid=f'dashboard_save_{modelo.__name__}')
+    post_delete.connect(invalidar_dashboard, sender=modelo, dispatch_uid=f'dashboard_delete_{modelo.__name__}')
+
+
+def indexar_producto_guardado(sender, instance, created, **kwargs):
+    texto = instance.texto_busqueda()
+    if created or texto != instance._texto_indexado:
+        indexar_producto(instance)
+        instance._texto_indexado = texto
+    transaction.on_commit(lambda: indice_productos.producto_guardado(instance))
+
+
+def desindexar_producto_borrado(sender, instance, **kwargs):
+    desindexar_producto(instance.pk)
+    producto_id = instance.pk
+    transaction.on_commit(lambda: indice_productos.producto_borrado(producto_id))
+
+
+post_save.connect(indexar_producto_guardado, sender=Producto, dispatch_uid='busqueda_producto_save')
+post_delete.connect(desindexar_producto_borrado, sender=Producto, dispatch_uid='busqueda_producto_delete')
+
+
+def stock_actualizado_en_bloque(sender, producto_ids, **kwargs):
+    invalidar_widgets(Producto)
+    indice_productos.productos_modificados(producto_ids)
+
+
+stock_actualizado.connect(stock_actualizado_en_bloque, dispatch_uid='inventario_stock_actualizado')
+
+
+def liberar_reserva_detalle(sender, instance, **kwargs):
+    # Antes de borrar: la reserva se borra en cascada sin descontar stock_reservado
+    liberar(ReservaStock.objects.filter(detalle=instance))
+
+
+pre_delete.connect(liberar_reserva_detalle, sender=VentaDetalle, dispatch_uid='reserva_detalle_delete')
+
+
+def quitar_venta_del_resumen(sender, instance, **kwargs):
+    # Antes de borrar, mientras sus líneas siguen en la base de datos
+    if instance.estado == 'COMPLETADA':
+        registrar_venta(instance, -1)
+
+
+def _borrado_con_su_venta(origin):
+    return isinstance(origin, Venta) or (isinstance(origin, QuerySet) and origin.model is Venta)
+
+
+def quitar_detalle_del_resumen(sender, instance, origin=None, **kwargs):
+    # Si se borra toda la venta, quitar_venta_del_resumen ya resta sus líneas
+    if not _borrado_con_su_venta(origin) and instance.venta.estado == 'COMPLETADA':
+        quitar_detalle(instance)
+
+
+pre_delete.connect(quitar_venta_del_resumen, sender=Venta, dispatch_uid='resumen_venta_delete')
+pre_delete.connect(quitar_detalle_del_resumen, sender=VentaDetalle, dispatch_uid='resumen_detalle_delete')
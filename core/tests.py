@@ -1,15 +1,47 @@
 # core/tests.py
 
-from django.test import TestCase, Client
+from django.test import TestCase, TransactionTestCase, Client, override_settings
 from django.contrib.auth.models import User
 from django.urls import reverse
 from django.core.exceptions import ValidationError
+from django.utils import timezone
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import F, QuerySet
+from django.test.utils import CaptureQueriesContext
+from django.db import IntegrityError, connection, transaction
+from django.core.management import CommandError, call_command
+from datetime import date, timedelta
 from decimal import Decimal
+from io import StringIO
+import json
+import threading
+import uuid
+from unittest import mock
+import numpy as np
 from .models import (
     Categoria, Producto, Cliente, Proveedor, 
     Venta, VentaDetalle, 
-    PedidoProveedor, PedidoDetalle, PagoProveedor
+    PedidoProveedor, PedidoDetalle, PagoProveedor, VentaResumenDiario, InventarioMovimiento, ReservaStock,
+    ClaveIdempotencia, Sucursal, Repartidor, StockSucursal, NotaEntregaVenta, DetalleNotaEntrega
 )
+from .services.ganancias import ganancias_ventas_completadas
+from .services.resumen_ventas import _acumular, reconstruir_resumen
+from .services.dashboard import invalidar_widgets
+from .services.analitica import serie_ventas
+from .services.pronostico_demanda import pronosticar
+from .paginacion import paginar_keyset
+from .services.busqueda_productos import buscar_ids, buscar_productos
+from .services import indice_productos
+from .forms import DetalleNotaEntregaFormSet, VentaDetalleFormSet
+from .services.inventario import StockInsuficiente, faltantes_sucursal, registrar_movimientos, stock_a_fecha
+from .services.ventas import VentaService
+from .services.cuentas_por_pagar import con_saldos, cuentas_por_pagar
+from .services.reposicion import generar_pedidos
+from .services.pedidos import PedidoService
+from .services.entregas import entregado_por_producto, recalcular
+from .services.reservas import liberar_vencidas
+from .transacciones import atomic_escritura
 
 
 class ProductoModelTest(TestCase):
@@ -389,10 +421,213 @@ class PedidoViewTest(TestCase):
         self.assertEqual(response.status_code, 200)
 
 
+class CuentasPorPagarTest(TestCase):
+    """Tests para los saldos anotados de pedidos a proveedores."""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='tesoreria', password='12345')
+        self.client = Client()
+        self.client.login(username='tesoreria', password='12345')
+        self.proveedores = [Proveedor.objects.create(nombre=f"Proveedor {letra}") for letra in "AB"]
+    
+    def _pedidos(self, n):
+        for i in range(n):
+            pedido = PedidoProveedor.objects.create(proveedor=self.proveedores[i % 2])
+            PedidoProveedor.objects.filter(pk=pedido.pk).update(costo_total=Decimal('100.00'))
+            for monto in ('30.00', '20.00'):
+                PagoProveedor.objects.create(pedido=pedido, monto=Decimal(monto), usuario=self.user)
+    
+    def _consultas_listado(self):
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.client.get(reverse('pedido_list'))
+        self.assertEqual({pedido.saldo_pendiente for pedido in response.context['pedidos']}, {Decimal('50.00')})
+        return len(consultas.captured_queries)
+    
+    def test_listado_no_consulta_pagos_por_pedido(self):
+        self._pedidos(2)
+        consultas_2 = self._consultas_listado()
+        self._pedidos(10)
+        self.assertEqual(self._consultas_listado(), consultas_2)
+    
+    def test_propiedades_usan_la_anotacion(self):
+        self._pedidos(1)
+        pedido = con_saldos(PedidoProveedor.objects.all()).get()
+        with self.assertNumQueries(0):
+            self.assertEqual(pedido.total_pagado, Decimal('50.00'))
+            self.assertEqual(pedido.saldo_pendiente, Decimal('50.00'))
+        # Sin anotación se consulta como antes
+        self.assertEqual(PedidoProveedor.objects.get().saldo_pendiente, Decimal('50.00'))
+    
+    def test_reporte_agrupa_por_proveedor_en_una_consulta(self):
+        self._pedidos(4)
+        pagado = PedidoProveedor.objects.filter(proveedor=self.proveedores[1]).first()
+        PagoProveedor.objects.create(pedido=pagado, monto=Decimal('50.00'), usuario=self.user)
+        cancelado = PedidoProveedor.objects.filter(proveedor=self.proveedores[0]).first()
+        PedidoProveedor.objects.filter(pk=cancelado.pk).update(estado='CANCELADO')
+        
+        with self.assertNumQueries(1):
+            proveedores, total = cuentas_por_pagar()
+        self.assertEqual(
+            [(grupo['proveedor'].nombre, len(grupo['pedidos']), grupo['saldo']) for grupo in proveedores],
+            [("Proveedor A", 1, Decimal('50.00')), ("Proveedor B", 1, Decimal('50.00'))]
+        )
+        self.assertEqual(total, Decimal('100.00'))
+        
+        response = self.client.get(reverse('pedido_cuentas_por_pagar'), {'proveedor': self.proveedores[0].id})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['total'], Decimal('50.00'))
+
+
+class RecepcionPedidosTest(TestCase):
+    """Tests para la recepción de pedidos en lote."""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='almacen', password='12345')
+        self.client = Client()
+        self.client.login(username='almacen', password='12345')
+        self.proveedor = Proveedor.objects.create(nombre="Distribuidora")
+        self.productos = [
+            Producto.objects.create(
+                nombre=f"Caja {i}", sku=f"CAJ{i:03d}", stock_actual=10,
+                precio_venta=Decimal('4.00'), costo_unitario=Decimal('2.00')
+            )
+            for i in range(3)
+        ]
+    
+    def _pedidos(self, n):
+        pedidos = []
+        for _ in range(n):
+            pedido = PedidoProveedor.objects.create(proveedor=self.proveedor)
+            for producto in self.productos:
+                PedidoDetalle.objects.create(pedido=pedido, producto=producto, cantidad=2, costo_unitario_compra=Decimal('2.00'))
+            pedidos.append(pedido)
+        return pedidos
+    
+    def _recibir(self, pedidos):
+        with CaptureQueriesContext(connection) as consultas:
+            resultados = PedidoService.recibir([pedido.id for pedido in pedidos])
+        self.assertTrue(all(error is None for error in resultados.values()))
+        return consultas.captured_queries
+    
+    def test_lote_netea_en_un_update(self):
+        consultas_5 = self._recibir(self._pedidos(5))
+        consultas_40 = self._recibir(self._pedidos(40))
+        self.assertEqual(len(consultas_5), len(consultas_40))
+        self.assertEqual(len([q for q in consultas_40 if q['sql'].startswith('UPDATE "core_producto"')]), 1)
+        self.assertEqual(set(Producto.objects.values_list('stock_actual', flat=True)), {100})
+        self.assertEqual(InventarioMovimiento.objects.filter(tipo='RECEPCION').count(), 135)
+        self.assertEqual(PedidoProveedor.objects.filter(estado='RECIBIDO').count(), 45)
+    
+    def test_informa_los_pedidos_que_no_se_reciben(self):
+        recibido, cancelado, pendiente = self._pedidos(3)
+        PedidoService.recibir([recibido.id])
+        PedidoProveedor.objects.filter(pk=cancelado.pk).update(estado='CANCELADO')
+        
+        resultados = PedidoService.recibir([recibido.id, cancelado.id, pendiente.id, 9999])
+        self.assertEqual(resultados, {
+            recibido.id: 'El pedido ya estaba recibido.',
+            cancelado.id: 'El pedido está cancelado.',
+            pendiente.id: None,
+            9999: 'El pedido no existe.',
+        })
+        self.assertEqual(set(Producto.objects.values_list('stock_actual', flat=True)), {14})
+    
+    def test_vista_y_api_suman_el_stock_una_vez(self):
+        pedido, otro = self._pedidos(2)
+        url = reverse('pedido_cambiar_estado', args=[pedido.id])
+        self.client.post(url, {'estado': 'RECIBIDO'})
+        self.client.post(url, {'estado': 'RECIBIDO'})
+        self.assertEqual(set(Producto.objects.values_list('stock_actual', flat=True)), {12})
+        
+        response = self.client.post(
+            reverse('api_pedidos_recibir'), json.dumps({'pedidos': [pedido.id, otro.id]}), content_type='application/json'
+        )
+        self.assertEqual((response.json()['recibidos'], response.json()['fallidos']), (1, 1))
+        self.assertEqual(set(Producto.objects.values_list('stock_actual', flat=True)), {14})
+        response = self.client.post(reverse('api_pedidos_recibir'), json.dumps({'pedidos': 'x'}), content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+
+class ReposicionAutomaticaTest(TestCase):
+    """Tests para la generación de pedidos de reposición."""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='compras', password='12345')
+        self.client = Client()
+        self.client.login(username='compras', password='12345')
+        self.proveedores = [Proveedor.objects.create(nombre=f"Mayorista {i}") for i in range(2)]
+    
+    def _producto(self, sku, stock, minimo=10, **kwargs):
+        producto = Producto.objects.create(
+            nombre=sku, sku=sku, stock_minimo=minimo, precio_venta=Decimal('5.00'), costo_unitario=Decimal('2.00'), **kwargs
+        )
+        Producto.objects.filter(pk=producto.pk).update(stock_actual=stock)
+        return producto
+    
+    def _compra(self, proveedor, producto, costo, hace_dias):
+        pedido = PedidoProveedor.objects.create(proveedor=proveedor, estado='CANCELADO')
+        PedidoProveedor.objects.filter(pk=pedido.pk).update(fecha_pedido=timezone.now() - timedelta(days=hace_dias))
+        PedidoDetalle.objects.create(pedido=pedido, producto=producto, cantidad=1, costo_unitario_compra=Decimal(costo))
+    
+    def test_agrupa_por_ultimo_proveedor(self):
+        tinta = self._producto('TINTA', stock=3)
+        papel = self._producto('PAPEL', stock=1, punto_reorden_sugerido=20, cantidad_pedido_sugerida=50)
+        sobrado = self._producto('SOBRADO', stock=40)
+        nuevo = self._producto('NUEVO', stock=0)
+        self._compra(self.proveedores[0], tinta, '1.50', hace_dias=30)
+        self._compra(self.proveedores[1], tinta, '1.80', hace_dias=2)
+        self._compra(self.proveedores[0], papel, '0.40', hace_dias=5)
+        self._compra(self.proveedores[0], sobrado, '3.00', hace_dias=5)
+        
+        creados, sin_proveedor = generar_pedidos()
+        self.assertEqual(sin_proveedor, [nuevo.id])
+        lineas = {
+            detalle.producto.sku: (pedido.proveedor_id, detalle.cantidad, detalle.costo_unitario_compra)
+            for pedido in PedidoProveedor.objects.filter(estado='BORRADOR')
+            for detalle in pedido.detalles_pedido.select_related('producto')
+        }
+        # Tinta: umbral 10 + mínimo 10 - stock 3; papel: umbral 20 + sugerido 50 - stock 1
+        self.assertEqual(lineas, {
+            'TINTA': (self.proveedores[1].id, 17, Decimal('1.80')),
+            'PAPEL': (self.proveedores[0].id, 69, Decimal('0.40')),
+        })
+        self.assertEqual(
+            PedidoProveedor.objects.get(estado='BORRADOR', proveedor=self.proveedores[0]).costo_total, Decimal('27.60')
+        )
+        # Lo ya pedido en borrador cubre el faltante: la siguiente corrida no repite
+        self.assertEqual(generar_pedidos()[0], [])
+    
+    def test_consultas_constantes(self):
+        def correr(n, prefijo):
+            for i in range(n):
+                producto = self._producto(f'{prefijo}{i}', stock=0)
+                self._compra(self.proveedores[i % 2], producto, '1.00', hace_dias=1)
+            with CaptureQueriesContext(connection) as consultas:
+                creados, _ = generar_pedidos()
+            self.assertEqual(sum(len(detalles) for _, detalles in creados), n)
+            return len(consultas.captured_queries)
+        
+        self.assertEqual(correr(4, 'A'), correr(40, 'B'))
+    
+    def test_comando_y_api(self):
+        producto = self._producto('CINTA', stock=2)
+        self._compra(self.proveedores[0], producto, '1.00', hace_dias=1)
+        out = StringIO()
+        call_command('generar_pedidos_reposicion', stdout=out)
+        self.assertIn('Pedidos borrador creados: 1 (1 líneas)', out.getvalue())
+        
+        Producto.objects.filter(pk=producto.pk).update(stock_minimo=40)
+        response = self.client.post(reverse('api_pedidos_generar_reposicion'))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['pedidos'][0]['lineas'], 1)
+        self.assertEqual(self.client.get(reverse('api_pedidos_generar_reposicion')).status_code, 405)
+
+
 class DashboardViewTest(TestCase):
     """Tests para el dashboard."""
     
     def setUp(self):
+        caches[settings.DASHBOARD_CACHE_ALIAS].clear()
         self.user = User.objects.create_user(username='admin', password='12345')
         self.client = Client()
         self.client.login(username='admin', password='12345')
@@ -556,3 +791,1579 @@ class IntegrationTest(TestCase):
         pedido.refresh_from_db()
         self.assertEqual(pedido.total_pagado, Decimal('1200.00'))
         self.assertEqual(pedido.saldo_pendiente, Decimal('0.00'))
+
+
+class GananciasTest(TestCase):
+    """Tests para el cálculo de ganancias del dashboard."""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='analista', password='12345')
+        self.proveedor = Proveedor.objects.create(nombre="Proveedor Costos")
+        self.con_costo = Producto.objects.create(
+            nombre="Silla", sku="SIL001", stock_actual=100,
+            precio_venta=Decimal('50.00'), costo_unitario=Decimal('30.00')
+        )
+        self.costo_alto = Producto.objects.create(
+            nombre="Mesa", sku="MES001", stock_actual=100,
+            precio_venta=Decimal('80.00'), costo_unitario=Decimal('90.00')
+        )
+        self.sin_compras = Producto.objects.create(
+            nombre="Lámpara", sku="LAM001", stock_actual=100,
+            precio_venta=Decimal('20.00'), costo_unitario=Decimal('10.00')
+        )
+        
+        pedido_antiguo = PedidoProveedor.objects.create(proveedor=self.proveedor)
+        PedidoDetalle.objects.create(
+            pedido=pedido_antiguo, producto=self.con_costo,
+            cantidad=10, costo_unitario_compra=Decimal('45.00')
+        )
+        pedido_reciente = PedidoProveedor.objects.create(proveedor=self.proveedor)
+        PedidoDetalle.objects.create(
+            pedido=pedido_reciente, producto=self.con_costo,
+            cantidad=10, costo_unitario_compra=Decimal('30.00')
+        )
+        PedidoDetalle.objects.create(
+            pedido=pedido_reciente, producto=self.costo_alto,
+            cantidad=10, costo_unitario_compra=Decimal('90.00')
+        )
+        # Garantizar que el segundo pedido es el más reciente
+        PedidoProveedor.objects.filter(pk=pedido_antiguo.pk).update(
+            fecha_pedido=timezone.now() - timedelta(days=10)
+        )
+        
+        self.venta = Venta.objects.create(usuario=self.user, estado='COMPLETADA')
+        VentaDetalle.objects.create(venta=self.venta, producto=self.con_costo, cantidad=2, precio_unitario_venta=Decimal('50.00'))
+        VentaDetalle.objects.create(venta=self.venta, producto=self.costo_alto, cantidad=1, precio_unitario_venta=Decimal('80.00'))
+        VentaDetalle.objects.create(venta=self.venta, producto=self.sin_compras, cantidad=3, precio_unitario_venta=Decimal('20.00'))
+    
+    def test_ganancias_aplica_reglas_de_costo(self):
+        """Usa el último costo de compra y los márgenes de respaldo del 30% y 40%."""
+        # Silla: 100 - 60 = 40 | Mesa: 80 * 0.3 = 24 | Lámpara: 60 * 0.4 = 24
+        total = ganancias_ventas_completadas(timezone.now().date().replace(day=1))
+        self.assertEqual(total, Decimal('88.00'))
+    
+    def test_ganancias_en_una_sola_consulta(self):
+        """El cálculo no depende del número de líneas de venta."""
+        for _ in range(5):
+            VentaDetalle.objects.create(venta=self.venta, producto=self.con_costo, cantidad=1, precio_unitario_venta=Decimal('50.00'))
+        with self.assertNumQueries(1):
+            ganancias_ventas_completadas(timezone.now().date().replace(day=1))
+
+
+class ResumenVentasDiarioTest(TestCase):
+    """Tests para el resumen diario de ventas que alimenta el dashboard."""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='resumen', password='12345')
+        self.cliente = Cliente.objects.create(nombre="Cliente Resumen")
+        self.producto = Producto.objects.create(
+            nombre="Cuaderno", sku="CUA001", stock_actual=100,
+            precio_venta=Decimal('10.00'), costo_unitario=Decimal('6.00')
+        )
+    
+    def _crear_venta(self, estado, cantidad):
+        venta = Venta.objects.create(cliente=self.cliente, usuario=self.user, estado=estado)
+        VentaDetalle.objects.create(
+            venta=venta, producto=self.producto,
+            cantidad=cantidad, precio_unitario_venta=Decimal('10.00')
+        )
+        return venta
+    
+    def _resumen(self):
+        return sorted(
+            VentaResumenDiario.objects.values_list(
+                'fecha', 'producto_id', 'cliente_id', 'usuario_id', 'num_ventas', 'unidades', 'ingresos', 'costo'
+            ).exclude(num_ventas=0, unidades=0, ingresos=0),
+            key=lambda fila: (fila[1] or 0)
+        )
+    
+    def test_venta_completada_actualiza_resumen(self):
+        """Una venta completada suma unidades, ingresos y costo del día."""
+        self._crear_venta('COMPLETADA', 3)
+        fila_producto = VentaResumenDiario.objects.get(producto=self.producto)
+        fila_venta = VentaResumenDiario.objects.get(producto__isnull=True)
+        self.assertEqual(fila_producto.unidades, 3)
+        self.assertEqual(fila_producto.ingresos, Decimal('30.00'))
+        self.assertEqual(fila_producto.costo, Decimal('18.00'))
+        self.assertEqual(fila_venta.num_ventas, 1)
+        self.assertEqual(fila_venta.ingresos, Decimal('30.00'))
+    
+    def test_cambios_de_estado_revierten_resumen(self):
+        """Cancelar una venta completada la descuenta del resumen y completarla la suma."""
+        venta = self._crear_venta('BORRADOR', 2)
+        self.assertFalse(VentaResumenDiario.objects.exclude(num_ventas=0).exists())
+        
+        venta.estado = 'COMPLETADA'
+        venta.save()
+        self.assertEqual(VentaResumenDiario.objects.get(producto__isnull=True).num_ventas, 1)
+        
+        venta.estado = 'CANCELADA'
+        venta.save()
+        fila_venta = VentaResumenDiario.objects.get(producto__isnull=True)
+        self.assertEqual(fila_venta.num_ventas, 0)
+        self.assertEqual(fila_venta.ingresos, Decimal('0'))
+    
+    def test_borrar_ventas_o_lineas_completadas_las_resta(self):
+        """Borrar una línea o una venta COMPLETADA la quita del resumen (una sola vez)."""
+        venta = self._crear_venta('COMPLETADA', 3)
+        otra = VentaDetalle.objects.create(
+            venta=venta, producto=self.producto, cantidad=2, precio_unitario_venta=Decimal('10.00')
+        )
+        self._crear_venta('COMPLETADA', 4)
+        
+        otra.delete()
+        fila_producto = VentaResumenDiario.objects.get(producto=self.producto)
+        self.assertEqual((fila_producto.num_ventas, fila_producto.unidades, fila_producto.costo), (2, 7, Decimal('42.00')))
+        self.assertEqual(VentaResumenDiario.objects.get(producto__isnull=True).ingresos, Decimal('70.00'))
+        
+        venta.delete()
+        Venta.objects.filter(estado='COMPLETADA').delete()
+        self.assertEqual(self._resumen(), [])
+    
+    def test_una_clave_una_fila(self):
+        """El resumen no admite dos filas con la misma clave, tampoco con cliente o usuario vacíos."""
+        VentaResumenDiario.objects.create(fecha=date(2026, 1, 5), num_ventas=1)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            VentaResumenDiario.objects.create(fecha=date(2026, 1, 5), num_ventas=1)
+    
+    def test_alta_adelantada_por_otra_transaccion_se_suma(self):
+        """Si otra transacción crea la fila después de buscarla, el INSERT choca y los valores se suman a esa fila."""
+        hoy = timezone.localdate()
+        VentaResumenDiario.objects.create(fecha=hoy, producto=self.producto, cliente=self.cliente, usuario=self.user,
+                                          num_ventas=1, unidades=1)
+        VentaResumenDiario.objects.create(fecha=hoy, cliente=self.cliente, usuario=self.user, num_ventas=1)
+        update, only = QuerySet.update, QuerySet.only
+        
+        # La fila aún no existía cuando se buscó: el primer UPDATE no toca nada y la lectura del lote viene vacía
+        with mock.patch.object(QuerySet, 'update', autospec=True) as actualizar:
+            actualizar.side_effect = lambda qs, **kw: 0 if actualizar.call_count == 1 else update(qs, **kw)
+            _acumular(hoy, self.producto.id, self.cliente.id, self.user.id, 1, 3)
+        with mock.patch.object(QuerySet, 'only', autospec=True) as leer:
+            leer.side_effect = lambda qs, *campos: qs.none() if leer.call_count == 1 else only(qs, *campos)
+            self._crear_venta('COMPLETADA', 2)
+        
+        fila_producto = VentaResumenDiario.objects.get(producto=self.producto)
+        fila_venta = VentaResumenDiario.objects.get(producto__isnull=True)
+        self.assertEqual((fila_producto.num_ventas, fila_producto.unidades), (3, 6))
+        self.assertEqual((fila_venta.num_ventas, fila_venta.ingresos), (2, Decimal('20.00')))
+    
+    def test_reconstruccion_coincide_con_incremental(self):
+        """El comando de reconstrucción produce el mismo resumen que el mantenimiento incremental."""
+        self._crear_venta('COMPLETADA', 2)
+        self._crear_venta('COMPLETADA', 4)
+        self._crear_venta('COTIZACION', 7)
+        incremental = self._resumen()
+        
+        reconstruir_resumen()
+        self.assertEqual(self._resumen(), incremental)
+
+
+class DashboardCacheTest(TestCase):
+    """Tests para el caché de widgets del dashboard."""
+    
+    def setUp(self):
+        caches[settings.DASHBOARD_CACHE_ALIAS].clear()
+        self.user = User.objects.create_user(username='cache', password='12345')
+        self.client = Client()
+        self.client.login(username='cache', password='12345')
+        Producto.objects.create(
+            nombre="Regla", sku="REG001", stock_actual=1, stock_minimo=5,
+            precio_venta=Decimal('3.00'), costo_unitario=Decimal('1.00')
+        )
+    
+    def test_recarga_del_widget_no_consulta_la_base(self):
+        """La segunda carga de un panel solo consulta sesión y usuario."""
+        self.client.get(reverse('api_dashboard_conteos'))
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('api_dashboard_conteos'))
+        self.assertEqual(response.json()['total_productos'], 1)
+    
+    def test_escritura_invalida_widgets_dependientes(self):
+        """Guardar un modelo invalida solo los widgets que dependen de él."""
+        self.client.get(reverse('api_dashboard_conteos'))
+        self.client.get(reverse('api_dashboard_stock_bajo'))
+        Producto.objects.create(
+            nombre="Compás", sku="COM001", stock_actual=0, stock_minimo=5,
+            precio_venta=Decimal('8.00'), costo_unitario=Decimal('4.00')
+        )
+        self.assertEqual(self.client.get(reverse('api_dashboard_conteos')).json()['total_productos'], 2)
+        self.assertEqual(self.client.get(reverse('api_dashboard_stock_bajo')).json()['productos_stock_bajo'], 2)
+    
+    def test_widget_responde_304_sin_cambios(self):
+        """Los paneles admiten GET condicional con ETag."""
+        response = self.client.get(reverse('api_dashboard_stock_bajo'))
+        etag = response['ETag']
+        response = self.client.get(reverse('api_dashboard_stock_bajo'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        
+        invalidar_widgets(Producto)
+        response = self.client.get(reverse('api_dashboard_stock_bajo'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+    
+    def test_dashboard_renderiza_estructura_sin_consultar_widgets(self):
+        """La página del dashboard se sirve sin calcular los paneles."""
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('dashboard'))
+        self.assertContains(response, reverse('api_dashboard_ventas_mes'))
+    
+    def test_invalidar_widgets_por_modelo(self):
+        """Cada modelo invalida el conjunto de widgets declarado."""
+        self.assertEqual(invalidar_widgets(Proveedor), ['conteos', 'pedidos_pendientes'])
+
+
+class AnaliticaVentasTest(TestCase):
+    """Tests para la serie temporal de ventas y ganancias."""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='analitica', password='12345')
+        self.client = Client()
+        self.client.login(username='analitica', password='12345')
+        self.categoria = Categoria.objects.create(nombre="Papelería")
+        self.producto = Producto.objects.create(
+            nombre="Lápiz", sku="LAP001", stock_actual=100, categoria=self.categoria,
+            precio_venta=Decimal('10.00'), costo_unitario=Decimal('6.00')
+        )
+        self.hoy = timezone.localdate()
+        # Hace dos días: 2 unidades; hoy: 3 unidades; ayer sin ventas
+        self._venta(self.hoy - timedelta(days=2), 2)
+        self._venta(self.hoy, 3)
+        # Las fechas se movieron con update(): se reconstruye el resumen diario
+        reconstruir_resumen()
+    
+    def _venta(self, fecha, cantidad):
+        venta = Venta.objects.create(usuario=self.user, estado='COMPLETADA')
+        VentaDetalle.objects.create(venta=venta, producto=self.producto, cantidad=cantidad, precio_unitario_venta=Decimal('10.00'))
+        Venta.objects.filter(pk=venta.pk).update(
+            fecha=timezone.make_aware(timezone.datetime.combine(fecha, timezone.datetime.min.time())) + timedelta(hours=12)
+        )
+    
+    def test_serie_diaria_rellena_huecos(self):
+        """Los días sin ventas aparecen con cero y el crecimiento compara con el periodo anterior."""
+        response = self.client.get(reverse('api_analitica_ventas'), {
+            'desde': (self.hoy - timedelta(days=2)).isoformat(), 'hasta': self.hoy.isoformat(), 'ventana': 2,
+        })
+        self.assertEqual(response.status_code, 200)
+        datos = response.json()
+        self.assertEqual(len(datos['periodos']), 3)
+        self.assertEqual(datos['ingresos'], [20.0, 0.0, 30.0])
+        self.assertEqual(datos['unidades'], [2, 0, 3])
+        self.assertEqual(datos['ventas'], [1, 0, 1])
+        # Ganancia = ingresos - costo unitario (6.00) de las unidades vendidas
+        self.assertEqual(datos['ganancia'], [8.0, 0.0, 12.0])
+        self.assertEqual(datos['ingresos_media_movil'], [20.0, 10.0, 15.0])
+        self.assertEqual(datos['crecimiento_ingresos'], [None, -100.0, None])
+    
+    def test_serie_mensual_agrupada_por_categoria(self):
+        """La agrupación devuelve una serie por grupo."""
+        response = self.client.get(reverse('api_analitica_ventas'), {
+            'desde': self.hoy.isoformat(), 'hasta': self.hoy.isoformat(),
+            'intervalo': 'mes', 'agrupar': 'categoria',
+        })
+        datos = response.json()
+        self.assertEqual(datos['grupos'], [{'id': self.categoria.id, 'nombre': 'Papelería'}])
+        self.assertEqual(datos['unidades'], [[3]])
+        self.assertIsNone(datos['ventas'])
+    
+    def test_serie_por_usuario_en_pocas_consultas(self):
+        """El número de consultas no depende del número de días ni de ventas."""
+        otro = User.objects.create_user(username='otro', password='12345')
+        venta = Venta.objects.create(usuario=otro, estado='COMPLETADA')
+        VentaDetalle.objects.create(venta=venta, producto=self.producto, cantidad=1, precio_unitario_venta=Decimal('10.00'))
+        
+        with self.assertNumQueries(3):
+            datos = serie_ventas(self.hoy - timedelta(days=365), self.hoy, intervalo='semana', agrupar_por='usuario')
+        self.assertEqual([grupo['nombre'] for grupo in datos['grupos']], ['analitica', 'otro'])
+        self.assertEqual([sum(serie) for serie in datos['unidades']], [5, 1])
+        self.assertEqual([sum(serie) for serie in datos['ventas']], [2, 1])
+    
+    def test_parametros_invalidos(self):
+        response = self.client.get(reverse('api_analitica_ventas'), {'intervalo': 'hora'})
+        self.assertEqual(response.status_code, 400)
+
+
+class StockBajoTest(TestCase):
+    """Tests para el déficit de stock mantenido por la base de datos."""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='inventario', password='12345')
+        self.client = Client()
+        self.client.login(username='inventario', password='12345')
+        self.proveedor = Proveedor.objects.create(nombre="Proveedor Stock")
+        self.producto = Producto.objects.create(
+            nombre="Grapadora", sku="GRA001", stock_actual=10, stock_minimo=5,
+            precio_venta=Decimal('15.00'), costo_unitario=Decimal('9.00')
+        )
+    
+    def _deficit(self):
+        return Producto.objects.values_list('deficit', flat=True).get(pk=self.producto.pk)
+    
+    def test_deficit_sigue_cambios_de_stock(self):
+        """Ventas, pedidos recibidos y update() con F() actualizan el déficit."""
+        self.assertEqual(self._deficit(), -5)
+        
+        venta = Venta.objects.create(usuario=self.user, estado='COMPLETADA')
+        VentaDetalle.objects.create(venta=venta, producto=self.producto, cantidad=7, precio_unitario_venta=Decimal('15.00'))
+        self.assertEqual(self._deficit(), 2)
+        
+        pedido = PedidoProveedor.objects.create(proveedor=self.proveedor)
+        PedidoDetalle.objects.create(pedido=pedido, producto=self.producto, cantidad=4, costo_unitario_compra=Decimal('9.00'))
+        pedido.estado = 'RECIBIDO'
+        pedido.save()
+        self.assertEqual(self._deficit(), -2)
+        
+        Producto.objects.filter(pk=self.producto.pk).update(stock_minimo=F('stock_minimo') + 10)
+        self.assertEqual(self._deficit(), 8)
+    
+    def test_api_ordena_por_severidad_y_pagina(self):
+        Producto.objects.create(
+            nombre="Tijeras", sku="TIJ001", stock_actual=0, stock_minimo=8,
+            precio_venta=Decimal('6.00'), costo_unitario=Decimal('3.00')
+        )
+        Producto.objects.create(
+            nombre="Cinta", sku="CIN001", stock_actual=2, stock_minimo=4,
+            precio_venta=Decimal('3.00'), costo_unitario=Decimal('1.00')
+        )
+        
+        response = self.client.get(reverse('api_productos_stock_bajo'), {'page_size': 1})
+        datos = response.json()
+        self.assertEqual(datos['count'], 2)
+        self.assertEqual(datos['num_pages'], 2)
+        self.assertEqual(datos['productos'][0]['sku'], 'TIJ001')
+        self.assertEqual(datos['productos'][0]['deficit'], 8)
+        
+        datos = self.client.get(reverse('api_productos_stock_bajo'), {'page_size': 1, 'page': 2}).json()
+        self.assertEqual(datos['productos'][0]['sku'], 'CIN001')
+        self.assertFalse(datos['has_next'])
+
+
+class PronosticoDemandaTest(TestCase):
+    """Tests para el pronóstico de demanda y los puntos de reorden sugeridos."""
+    
+    def test_pronostico_con_estacionalidad_semanal(self):
+        """La demanda constante y la concentrada en un día de la semana se proyectan correctamente."""
+        demanda = np.zeros((2, 28))
+        demanda[0] = 2
+        demanda[1, ::7] = 7  # solo los lunes
+        nivel, demanda_horizonte, desviacion = pronosticar(demanda, date(2026, 1, 5), 7)
+        np.testing.assert_allclose(nivel, [2.0, 1.0])
+        np.testing.assert_allclose(demanda_horizonte, [14.0, 7.0])
+        np.testing.assert_allclose(desviacion, [0.0, 0.0], atol=1e-9)
+    
+    def test_comando_guarda_sugerencias(self):
+        user = User.objects.create_user(username='planificador', password='12345')
+        producto = Producto.objects.create(
+            nombre="Carpeta", sku="CAR001", stock_actual=500,
+            precio_venta=Decimal('4.00'), costo_unitario=Decimal('2.00')
+        )
+        sin_ventas = Producto.objects.create(
+            nombre="Sobre", sku="SOB001", stock_actual=50,
+            precio_venta=Decimal('1.00'), costo_unitario=Decimal('0.50')
+        )
+        hoy = timezone.localdate()
+        for dias_atras in range(1, 29):
+            venta = Venta.objects.create(usuario=user, estado='COMPLETADA')
+            VentaDetalle.objects.create(venta=venta, producto=producto, cantidad=3, precio_unitario_venta=Decimal('4.00'))
+            Venta.objects.filter(pk=venta.pk).update(fecha=timezone.now() - timedelta(days=dias_atras))
+        reconstruir_resumen()
+        
+        call_command('calcular_puntos_reorden', dias=28, tiempo_entrega=5, cobertura=10, stdout=StringIO())
+        
+        producto.refresh_from_db()
+        self.assertEqual(producto.demanda_diaria_pronostico, Decimal('3.000'))
+        self.assertEqual(producto.punto_reorden_sugerido, 15)
+        self.assertEqual(producto.cantidad_pedido_sugerida, 30)
+        self.assertIsNotNone(producto.pronostico_actualizado)
+        sin_ventas.refresh_from_db()
+        self.assertEqual(sin_ventas.punto_reorden_sugerido, 0)
+
+
+class ListadosPaginadosTest(TestCase):
+    """Tests para la paginación por cursor de ventas y pedidos."""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='listados', password='12345')
+        self.client = Client()
+        self.client.login(username='listados', password='12345')
+        ahora = timezone.now()
+        self.ventas = []
+        for i in range(7):
+            venta = Venta.objects.create(usuario=self.user, estado='PENDIENTE' if i % 2 else 'COMPLETADA')
+            self.ventas.append(venta)
+        # Dos ventas con la misma fecha para probar el desempate por id
+        for i, venta in enumerate(self.ventas):
+            Venta.objects.filter(pk=venta.pk).update(fecha=ahora - timedelta(hours=i // 2))
+    
+    def test_recorre_todas_las_ventas_sin_repetir(self):
+        esperadas = list(Venta.objects.order_by('-fecha', '-id').values_list('id', flat=True))
+        vistas = []
+        pagina = paginar_keyset(Venta.objects.all(), 'fecha', tamano=3)
+        paginas = [pagina]
+        while pagina.has_next:
+            pagina = paginar_keyset(Venta.objects.all(), 'fecha', despues=pagina.cursor_siguiente, tamano=3)
+            paginas.append(pagina)
+        for p in paginas:
+            vistas.extend(venta.id for venta in p)
+        self.assertEqual(vistas, esperadas)
+        self.assertEqual(len(paginas), 3)
+        
+        anterior = paginar_keyset(Venta.objects.all(), 'fecha', antes=paginas[2].cursor_anterior, tamano=3)
+        self.assertEqual([v.id for v in anterior], [v.id for v in paginas[1]])
+        self.assertTrue(anterior.has_previous)
+    
+    def test_listado_conserva_filtros_y_carga_una_pagina(self):
+        response = self.client.get(reverse('venta_list'), {'estado': 'COMPLETADA'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['ventas']), 4)
+        self.assertFalse(response.context['pagina'].has_next)
+        self.assertEqual(response.context['filtros'], 'estado=COMPLETADA')
+        
+        response = self.client.get(reverse('venta_list'), {'despues': 'cursor-invalido'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['ventas']), 7)
+    
+    def test_listado_de_pedidos(self):
+        proveedor = Proveedor.objects.create(nombre="Proveedor Lista")
+        PedidoProveedor.objects.create(proveedor=proveedor)
+        response = self.client.get(reverse('pedido_list'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['pedidos']), 1)
+
+
+class CatalogoApiTest(TestCase):
+    """Tests para la API REST de catálogos."""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='integracion', password='12345')
+        self.client = Client()
+        self.client.login(username='integracion', password='12345')
+        self.categoria = Categoria.objects.create(nombre="Oficina")
+        for i in range(5):
+            Producto.objects.create(
+                nombre=f"Resma {i}", sku=f"RES00{i}", stock_actual=10, categoria=self.categoria,
+                precio_venta=Decimal('12.00'), costo_unitario=Decimal('8.00')
+            )
+        Producto.objects.create(
+            nombre="Borrador", sku="BOR001", stock_actual=10, descripcion="Borrador de goma",
+            precio_venta=Decimal('1.00'), costo_unitario=Decimal('0.50')
+        )
+    
+    def test_requiere_autenticacion(self):
+        self.client.logout()
+        response = self.client.get(reverse('api-productos-list'))
+        self.assertEqual(response.status_code, 403)
+    
+    def test_paginacion_por_cursor_y_campos(self):
+        url = reverse('api-productos-list')
+        datos = self.client.get(url, {'page_size': 4, 'fields': 'id,sku,categoria_nombre'}).json()
+        self.assertEqual(len(datos['results']), 4)
+        self.assertEqual(set(datos['results'][0]), {'id', 'sku', 'categoria_nombre'})
+        self.assertEqual(datos['results'][0]['sku'], 'BOR001')
+        self.assertIsNotNone(datos['next'])
+        
+        siguiente = self.client.get(datos['next']).json()
+        self.assertEqual(len(siguiente['results']), 2)
+        self.assertEqual(siguiente['results'][-1]['categoria_nombre'], 'Oficina')
+        self.assertIsNone(siguiente['next'])
+    
+    def test_busqueda_igual_que_listado_html(self):
+        """`search` y `categoria` filtran igual que producto_list."""
+        api = self.client.get(reverse('api-productos-list'), {'search': 'goma'}).json()
+        html = self.client.get(reverse('producto_list'), {'search': 'goma'})
+        self.assertEqual([p['sku'] for p in api['results']], [p.sku for p in html.context['productos']])
+        
+        api = self.client.get(reverse('api-productos-list'), {'categoria': self.categoria.id}).json()
+        self.assertEqual(len(api['results']), 5)
+    
+    def test_filtro_con_valor_invalido_responde_400(self):
+        response = self.client.get(reverse('api-productos-list'), {'categoria': 'abc'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('categoria', response.json())
+        self.assertEqual(self.client.get(reverse('api-sucursales-list'), {'activa': 'quizas'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('api-repartidores-list'), {'estado': 'VOLANDO'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('api-sucursales-list'), {'activa': 'true'}).status_code, 200)
+    
+    def test_etag_devuelve_304(self):
+        url = reverse('api-clientes-list')
+        Cliente.objects.create(nombre="Cliente API")
+        response = self.client.get(url)
+        self.assertTrue(response.has_header('ETag'))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        
+        Cliente.objects.create(nombre="Otro Cliente")
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+
+
+class BusquedaProductosTest(TestCase):
+    """Tests para el índice de texto completo de productos."""
+    
+    def setUp(self):
+        indice_productos.invalidar_indice()
+        self.user = User.objects.create_user(username='buscador', password='12345')
+        self.client = Client()
+        self.client.login(username='buscador', password='12345')
+        self.lapiz = Producto.objects.create(
+            nombre="Lápiz amarillo", sku="LAP001", stock_actual=10, descripcion="Lápiz de grafito",
+            precio_venta=Decimal('5.00'), costo_unitario=Decimal('2.00')
+        )
+        self.estuche = Producto.objects.create(
+            nombre="Estuche escolar", sku="EST001", stock_actual=0, descripcion="Incluye un lápiz",
+            precio_venta=Decimal('40.00'), costo_unitario=Decimal('20.00')
+        )
+        self.goma = Producto.objects.create(
+            nombre="Goma blanca", sku="GOM001", stock_actual=10,
+            precio_venta=Decimal('3.00'), costo_unitario=Decimal('1.00')
+        )
+    
+    def test_coincidencia_en_nombre_pesa_mas_que_en_descripcion(self):
+        self.assertEqual(buscar_ids('lápiz'), [self.lapiz.id, self.estuche.id])
+        self.assertEqual(buscar_ids('LÁPIZ'), [self.lapiz.id, self.estuche.id])
+        self.assertEqual(buscar_ids('lápiz', con_stock=True), [self.lapiz.id])
+        self.assertEqual(buscar_ids('gom001'), [self.goma.id])
+    
+    def test_indice_sigue_guardados_y_borrados(self):
+        self.goma.nombre = "Borrador blanco"
+        self.goma.save()
+        self.assertEqual(buscar_ids('goma'), [])
+        self.assertEqual(buscar_ids('borrador'), [self.goma.id])
+        
+        nuevo = Producto.objects.create(
+            nombre="Borrador de tinta", sku="BOR002", stock_actual=5,
+            precio_venta=Decimal('6.00'), costo_unitario=Decimal('3.00')
+        )
+        self.assertEqual(set(buscar_ids('borrador')), {self.goma.id, nuevo.id})
+        
+        nuevo.delete()
+        self.assertEqual(buscar_ids('borrador'), [self.goma.id])
+    
+    def test_filtros_del_queryset_se_aplican_antes_del_limite(self):
+        escolar = Categoria.objects.create(nombre="Escolar")
+        self.estuche.categoria = escolar
+        self.estuche.save()
+        # El lápiz es más relevante, pero no es de la categoría
+        productos = buscar_productos(Producto.objects.filter(categoria=escolar), 'lápiz', limite=1)
+        self.assertEqual([p.id for p in productos], [self.estuche.id])
+        self.assertEqual(buscar_ids('lápiz', limite=1), [self.lapiz.id])
+        
+        response = self.client.get(reverse('producto_list'), {'search': 'lápiz', 'categoria': escolar.id})
+        self.assertEqual([p.id for p in response.context['productos']], [self.estuche.id])
+    
+    def test_textos_cortos_usan_icontains(self):
+        productos = buscar_productos(Producto.objects.all(), 'la')
+        self.assertEqual([p.id for p in productos], [self.estuche.id, self.goma.id, self.lapiz.id])
+    
+    def test_vistas_usan_el_indice(self):
+        response = self.client.get(reverse('producto_list'), {'search': 'lápiz'})
+        self.assertEqual([p.id for p in response.context['productos']], [self.lapiz.id, self.estuche.id])
+        self.assertIsNone(response.context['limite_resultados'])
+        
+        response = self.client.get(reverse('buscar_productos'), {'q': 'lápiz'})
+        self.assertEqual([p['sku'] for p in response.json()['productos']], ['LAP001'])
+
+
+class IndiceProductosTest(TestCase):
+    """Tests para el índice en memoria del autocompletado del punto de venta."""
+    
+    def setUp(self):
+        self.regla = Producto.objects.create(
+            nombre="Regla metálica", sku="REG001", stock_actual=4,
+            precio_venta=Decimal('15.00'), costo_unitario=Decimal('9.00')
+        )
+        self.registro = Producto.objects.create(
+            nombre="Libro de registro", sku="LIB001", stock_actual=0,
+            precio_venta=Decimal('60.00'), costo_unitario=Decimal('35.00')
+        )
+        indice_productos.invalidar_indice()
+        indice_productos.buscar('')
+    
+    def test_busqueda_por_prefijo_sin_consultas(self):
+        with self.assertNumQueries(0):
+            self.assertEqual([p.sku for p in indice_productos.buscar('re')], ['REG001', 'LIB001'])
+            self.assertEqual([p.sku for p in indice_productos.buscar('METÁL')], ['REG001'])
+            self.assertEqual([p.sku for p in indice_productos.buscar('re', con_stock=True)], ['REG001'])
+            self.assertEqual(indice_productos.buscar('etalica'), [])
+    
+    def test_senales_parchean_el_indice(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            nuevo = Producto.objects.create(
+                nombre="Resaltador", sku="RES001", stock_actual=8,
+                precio_venta=Decimal('12.00'), costo_unitario=Decimal('6.00')
+            )
+            self.regla.nombre = "Escuadra"
+            self.regla.save()
+        with self.assertNumQueries(0):
+            self.assertEqual([p.sku for p in indice_productos.buscar('re')], ['REG001', 'LIB001', 'RES001'])
+            self.assertEqual(indice_productos.buscar('regla'), [])
+            self.assertEqual(indice_productos.buscar('resal')[0].precio, Decimal('12.00'))
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            nuevo.delete()
+        self.assertEqual(indice_productos.buscar('resal'), [])
+    
+    def test_cambios_de_otro_proceso(self):
+        """Un cambio anotado por otro proceso se recarga solo para ese producto."""
+        Producto.objects.filter(id=self.registro.id).update(stock_actual=3)
+        indice_productos._anotar_cambio(self.registro.id)
+        with self.assertNumQueries(1):
+            resultados = indice_productos.buscar('libro', con_stock=True)
+        self.assertEqual([p.stock for p in resultados], [3])
+        
+        # Si el registro del cambio ya no está en el caché, se reconstruye
+        Producto.objects.filter(id=self.regla.id).delete()
+        version = indice_productos._anotar_cambio(self.regla.id)
+        caches[settings.INDICE_PRODUCTOS_CACHE_ALIAS].delete(indice_productos.clave_cambio(version))
+        self.assertEqual(indice_productos.buscar('regla'), [])
+    
+    def test_vista_de_autocompletado(self):
+        response = self.client.get(reverse('buscar_productos'), {'q': 'reg'})
+        self.assertEqual(response.status_code, 302)
+        User.objects.create_user(username='cajero', password='12345')
+        self.client.login(username='cajero', password='12345')
+        response = self.client.get(reverse('buscar_productos'), {'q': 'reg'})
+        self.assertEqual(response.json()['productos'], [
+            {'id': self.regla.id, 'nombre': "Regla metálica", 'sku': 'REG001', 'precio': 15.0, 'stock': 4}
+        ])
+
+    
+    def test_check_avisa_si_el_cache_no_se_comparte(self):
+        from core.checks import indice_productos_con_cache_compartido
+        with override_settings(DEBUG=False):
+            self.assertEqual([e.id for e in indice_productos_con_cache_compartido(None)], ['core.W001'])
+        redis = dict(settings.CACHES, dashboard={'BACKEND': 'django.core.cache.backends.redis.RedisCache'})
+        with override_settings(DEBUG=False, CACHES=redis):
+            self.assertEqual(indice_productos_con_cache_compartido(None), [])
+
+class SelectorProductosTest(TestCase):
+    """Tests para el selector de productos por búsqueda de los formsets de detalle."""
+    
+    def setUp(self):
+        indice_productos.invalidar_indice()
+        self.user = User.objects.create_user(username='cajero', password='12345')
+        self.client = Client()
+        self.client.login(username='cajero', password='12345')
+        self.productos = [
+            Producto.objects.create(
+                nombre=f"Cuaderno {i}", sku=f"CUA00{i}", stock_actual=10,
+                precio_venta=Decimal('30.00'), costo_unitario=Decimal('15.00')
+            )
+            for i in range(3)
+        ]
+        self.agotado = Producto.objects.create(
+            nombre="Cuaderno agotado", sku="CUA999", stock_actual=0,
+            precio_venta=Decimal('30.00'), costo_unitario=Decimal('15.00')
+        )
+    
+    def _datos(self, prefijo, productos, campo_cantidad='cantidad', **extra):
+        datos = {
+            f'{prefijo}-TOTAL_FORMS': str(len(productos)),
+            f'{prefijo}-INITIAL_FORMS': '0',
+            f'{prefijo}-MIN_NUM_FORMS': '1',
+            f'{prefijo}-MAX_NUM_FORMS': '1000',
+        }
+        for i, producto in enumerate(productos):
+            datos[f'{prefijo}-{i}-producto'] = str(producto.id)
+            datos[f'{prefijo}-{i}-{campo_cantidad}'] = '1'
+            for campo, valor in extra.items():
+                datos[f'{prefijo}-{i}-{campo}'] = valor
+        return datos
+    
+    def test_nueva_venta_no_renderiza_el_catalogo(self):
+        response = self.client.get(reverse('nueva_venta'))
+        self.assertContains(response, 'data-buscar-url="/api/buscar-productos/"')
+        self.assertNotContains(response, 'CUA001')
+    
+    def test_formset_valida_con_una_consulta(self):
+        datos = self._datos('detalles', self.productos, precio_unitario_venta='30.00')
+        formset = VentaDetalleFormSet(datos)
+        with self.assertNumQueries(1):
+            self.assertTrue(formset.is_valid())
+        self.assertEqual([f.cleaned_data['producto'] for f in formset.forms], self.productos)
+        # La opción elegida se renderiza sin volver a consultar
+        with self.assertNumQueries(0):
+            html = str(formset.forms[1]['producto'])
+        self.assertIn('Cuaderno 1 (CUA001)', html)
+        self.assertNotIn('CUA002', html)
+        
+        formset = VentaDetalleFormSet(self._datos('detalles', [self.agotado], precio_unitario_venta='30.00'))
+        self.assertFalse(formset.is_valid())
+        self.assertIn('producto', formset.forms[0].errors)
+    
+    def test_nota_de_entrega_solo_acepta_productos_de_la_venta(self):
+        venta = Venta.objects.create(usuario=self.user, estado='PENDIENTE')
+        VentaDetalle.objects.create(
+            venta=venta, producto=self.productos[0], cantidad=2, precio_unitario_venta=Decimal('30.00')
+        )
+        kwargs = {
+            'productos': Producto.objects.filter(id__in=venta.detalles.values('producto')),
+            'form_kwargs': {'venta': venta},
+        }
+        formset = DetalleNotaEntregaFormSet(
+            self._datos('detalles_entrega', self.productos[:2], 'cantidad_entregada'), **kwargs
+        )
+        self.assertFalse(formset.is_valid())
+        self.assertNotIn('producto', formset.forms[0].errors)
+        self.assertIn('producto', formset.forms[1].errors)
+        self.assertIn(f'?venta={venta.id}', str(formset.forms[0]['producto']))
+    
+    def test_endpoint_de_busqueda(self):
+        url = reverse('buscar_productos')
+        skus = [p['sku'] for p in self.client.get(url, {'q': 'cuaderno'}).json()['productos']]
+        self.assertNotIn('CUA999', skus)
+        skus = [p['sku'] for p in self.client.get(url, {'q': 'cuaderno', 'con_stock': 0}).json()['productos']]
+        self.assertIn('CUA999', skus)
+        
+        venta = Venta.objects.create(usuario=self.user, estado='PENDIENTE')
+        VentaDetalle.objects.create(
+            venta=venta, producto=self.productos[2], cantidad=1, precio_unitario_venta=Decimal('30.00')
+        )
+        skus = [p['sku'] for p in self.client.get(url, {'q': 'cuaderno', 'venta': venta.id}).json()['productos']]
+        self.assertEqual(skus, ['CUA002'])
+
+
+class InventarioMovimientoTest(TestCase):
+    """Tests para el libro de movimientos y el servicio de stock."""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='almacen', password='12345')
+        self.client = Client()
+        self.client.login(username='almacen', password='12345')
+        self.proveedor = Proveedor.objects.create(nombre="Proveedor Inventario")
+        self.productos = [
+            Producto.objects.create(
+                nombre=f"Carpeta {i}", sku=f"CAR00{i}", stock_actual=10,
+                precio_venta=Decimal('8.00'), costo_unitario=Decimal('4.00')
+            )
+            for i in range(3)
+        ]
+    
+    def _stock(self):
+        return list(Producto.objects.order_by('id').values_list('stock_actual', flat=True))
+    
+    def test_un_update_y_un_insert_por_documento(self):
+        with CaptureQueriesContext(connection) as consultas:
+            registrar_movimientos('AJUSTE', [
+                (self.productos[0].id, -3), (self.productos[1].id, 5), (self.productos[0].id, -1),
+            ])
+        sentencias = [q['sql'].split()[0] for q in consultas.captured_queries]
+        self.assertEqual(sentencias.count('UPDATE'), 1)
+        self.assertEqual(sentencias.count('INSERT'), 1)
+        self.assertEqual(self._stock(), [6, 15, 10])
+        self.assertEqual(InventarioMovimiento.objects.count(), 3)
+    
+    def test_stock_insuficiente_no_aplica_ninguna_linea(self):
+        with self.assertRaises(StockInsuficiente) as error:
+            registrar_movimientos('AJUSTE', [
+                (self.productos[0].id, -4), (self.productos[1].id, -11), (self.productos[2].id, -12),
+            ])
+        self.assertEqual(
+            [(f['producto_id'], f['disponible'], f['solicitado']) for f in error.exception.faltantes],
+            [(self.productos[1].id, 10, 11), (self.productos[2].id, 10, 12)]
+        )
+        self.assertIn('Stock insuficiente para Carpeta 1. Disponible: 10, Solicitado: 11', error.exception.messages)
+        self.assertEqual(self._stock(), [10, 10, 10])
+        self.assertFalse(InventarioMovimiento.objects.exists())
+    
+    def test_documentos_registran_movimientos(self):
+        venta = Venta.objects.create(usuario=self.user, estado='BORRADOR')
+        for producto in self.productos:
+            VentaDetalle.objects.create(venta=venta, producto=producto, cantidad=2, precio_unitario_venta=Decimal('8.00'))
+        venta.estado = 'COMPLETADA'
+        venta.save()
+        self.assertEqual(self._stock(), [8, 8, 8])
+        self.assertEqual(venta.movimientos_inventario.filter(tipo='VENTA').count(), 3)
+        
+        pedido = PedidoProveedor.objects.create(proveedor=self.proveedor, estado='PENDIENTE')
+        PedidoDetalle.objects.create(pedido=pedido, producto=self.productos[0], cantidad=5, costo_unitario_compra=Decimal('4.00'))
+        pedido.estado = 'RECIBIDO'
+        pedido.save()
+        self.assertEqual(self._stock(), [13, 8, 8])
+        
+        # Una venta completada sin stock no deja detalle ni movimiento
+        otra = Venta.objects.create(usuario=self.user, estado='COMPLETADA')
+        with self.assertRaises(ValidationError):
+            VentaDetalle.objects.create(venta=otra, producto=self.productos[1], cantidad=9, precio_unitario_venta=Decimal('8.00'))
+        self.assertFalse(otra.detalles.exists())
+        self.assertEqual(self._stock(), [13, 8, 8])
+    
+    def test_vistas_no_cuentan_dos_veces(self):
+        datos = {
+            'estado': 'COMPLETADA', 'prioridad_entrega': 'media',
+            'detalles-TOTAL_FORMS': '1', 'detalles-INITIAL_FORMS': '0',
+            'detalles-MIN_NUM_FORMS': '1', 'detalles-MAX_NUM_FORMS': '1000',
+            'detalles-0-producto': str(self.productos[0].id), 'detalles-0-cantidad': '4',
+            'detalles-0-precio_unitario_venta': '8.00',
+        }
+        response = self.client.post(reverse('nueva_venta'), datos)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self._stock()[0], 6)
+        
+        pedido = PedidoProveedor.objects.create(proveedor=self.proveedor, estado='PENDIENTE')
+        PedidoDetalle.objects.create(pedido=pedido, producto=self.productos[2], cantidad=7, costo_unitario_compra=Decimal('4.00'))
+        self.client.post(reverse('pedido_cambiar_estado', args=[pedido.id]), {'estado': 'RECIBIDO'})
+        self.assertEqual(self._stock()[2], 17)
+    
+    def test_nueva_venta_informa_cada_linea_sin_stock(self):
+        datos = {
+            'estado': 'COMPLETADA', 'prioridad_entrega': 'media',
+            'detalles-TOTAL_FORMS': '3', 'detalles-INITIAL_FORMS': '0',
+            'detalles-MIN_NUM_FORMS': '1', 'detalles-MAX_NUM_FORMS': '1000',
+        }
+        for i, (producto, cantidad) in enumerate(zip(self.productos, (11, 2, 15))):
+            datos[f'detalles-{i}-producto'] = str(producto.id)
+            datos[f'detalles-{i}-cantidad'] = str(cantidad)
+            datos[f'detalles-{i}-precio_unitario_venta'] = '8.00'
+        response = self.client.post(reverse('nueva_venta'), datos)
+        self.assertEqual(response.status_code, 200)
+        errores = [str(m) for m in response.context['messages']]
+        self.assertEqual(errores, [
+            'Stock insuficiente para Carpeta 0. Disponible: 10, Solicitado: 11',
+            'Stock insuficiente para Carpeta 2. Disponible: 10, Solicitado: 15',
+        ])
+        self.assertEqual(self._stock(), [10, 10, 10])
+        self.assertFalse(Venta.objects.exists())
+    
+    def test_stock_a_fecha(self):
+        hoy = timezone.localdate()
+        producto = self.productos[0]
+        hace_tres_dias = timezone.now() - timedelta(days=3)
+        registrar_movimientos('AJUSTE', [(producto.id, -4)], fecha=hace_tres_dias)
+        registrar_movimientos('AJUSTE', [(producto.id, 2)])
+        
+        self.assertEqual(stock_a_fecha(hoy, [producto.id]), {producto.id: 8})
+        self.assertEqual(stock_a_fecha(hoy - timedelta(days=1), [producto.id]), {producto.id: 6})
+        self.assertEqual(stock_a_fecha(hoy - timedelta(days=5), [producto.id]), {producto.id: 10})
+        
+        response = self.client.get(reverse('api_stock_a_fecha'), {
+            'fecha': (hoy - timedelta(days=1)).isoformat(), 'productos': f'{producto.id},{self.productos[1].id}'
+        })
+        self.assertEqual(response.json()['stock'], {str(producto.id): 6, str(self.productos[1].id): 10})
+        self.assertEqual(self.client.get(reverse('api_stock_a_fecha'), {'fecha': 'ayer'}).status_code, 400)
+
+
+class VentaServiceTest(TestCase):
+    """Tests para la creación de ventas en bloque."""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='caja', password='12345')
+        self.productos = [
+            Producto.objects.create(
+                nombre=f"Goma {i}", sku=f"GOM{i:03d}", stock_actual=50,
+                precio_venta=Decimal('3.00'), costo_unitario=Decimal('1.00')
+            )
+            for i in range(100)
+        ]
+    
+    def _crear(self, n):
+        venta = Venta(usuario=self.user, estado='COMPLETADA')
+        with CaptureQueriesContext(connection) as consultas:
+            VentaService.crear_venta(venta, [(producto, 2) for producto in self.productos[:n]])
+        return venta, len(consultas.captured_queries)
+    
+    def test_consultas_constantes_con_el_numero_de_lineas(self):
+        # La primera venta crea las filas del resumen; las siguientes solo las actualizan
+        self._crear(100)
+        _, consultas_5 = self._crear(5)
+        venta, consultas_100 = self._crear(100)
+        self.assertEqual(consultas_5, consultas_100)
+        
+        venta.refresh_from_db()
+        self.assertEqual(venta.monto_total, Decimal('600.00'))
+        self.assertEqual(venta.detalles.count(), 100)
+        self.assertEqual(Producto.objects.get(sku='GOM000').stock_actual, 44)
+        self.assertEqual(Producto.objects.get(sku='GOM099').stock_actual, 46)
+        resumen = VentaResumenDiario.objects.get(producto=self.productos[0])
+        self.assertEqual((resumen.unidades, resumen.ingresos), (6, Decimal('18.00')))
+    
+    def test_stock_insuficiente_no_guarda_la_venta(self):
+        with self.assertRaises(StockInsuficiente):
+            VentaService.crear_venta(
+                Venta(usuario=self.user, estado='COMPLETADA'),
+                [(self.productos[0], 10), (self.productos[1], 51, Decimal('2.50'))]
+            )
+        self.assertFalse(Venta.objects.exists())
+        self.assertEqual(Producto.objects.get(sku='GOM000').stock_actual, 50)
+    
+    def test_editar_una_linea_ajusta_el_total(self):
+        venta = VentaService.crear_venta(
+            Venta(usuario=self.user, estado='BORRADOR'),
+            [(self.productos[0], 2), (self.productos[1], 1, Decimal('5.00'))]
+        )
+        self.assertEqual(venta.monto_total, Decimal('11.00'))
+        
+        detalle = venta.detalles.get(producto=self.productos[0])
+        detalle.cantidad = 5
+        with CaptureQueriesContext(connection) as consultas:
+            detalle.save()
+        venta.refresh_from_db()
+        self.assertEqual(venta.monto_total, Decimal('20.00'))
+        # Sin volver a leer las demás líneas de la venta
+        self.assertFalse(any('core_ventadetalle' in q['sql'] and q['sql'].startswith('SELECT') for q in consultas.captured_queries))
+
+
+class ReservaStockTest(TestCase):
+    """Tests para las reservas de stock de cotizaciones y borradores."""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='vendedor', password='12345')
+        self.client = Client()
+        self.client.login(username='vendedor', password='12345')
+        self.producto = Producto.objects.create(
+            nombre="Pizarrón", sku="PIZ001", stock_actual=10,
+            precio_venta=Decimal('100.00'), costo_unitario=Decimal('60.00')
+        )
+    
+    def _cotizar(self, cantidad):
+        return VentaService.crear_venta(Venta(usuario=self.user, estado='COTIZACION'), [(self.producto, cantidad)])
+    
+    def _stock(self):
+        return Producto.objects.filter(id=self.producto.id).values_list('stock_actual', 'stock_reservado', 'stock_disponible').get()
+    
+    def test_cotizacion_aparta_stock_y_la_venta_no_lo_toma(self):
+        self._cotizar(7)
+        self.assertEqual(self._stock(), (10, 7, 3))
+        
+        venta = Venta.objects.create(usuario=self.user, estado='COMPLETADA')
+        with self.assertRaises(StockInsuficiente) as error:
+            VentaDetalle.objects.create(venta=venta, producto=self.producto, cantidad=4)
+        self.assertIn('Stock insuficiente para Pizarrón. Disponible: 3, Solicitado: 4', error.exception.messages)
+        self.assertEqual(self._stock(), (10, 7, 3))
+        
+        # Selector y API de precio del punto de venta muestran lo disponible
+        respuesta = self.client.get(reverse('get_producto_precio', args=[self.producto.id]))
+        self.assertEqual(respuesta.json()['stock'], 3)
+        respuesta = self.client.get(reverse('buscar_productos'), {'q': 'PIZ'})
+        self.assertEqual(respuesta.json()['productos'][0]['stock'], 3)
+    
+    def test_cotizar_mas_que_el_stock_aparta_lo_que_hay(self):
+        """Una cotización o un borrador se guardan aunque falte stock; la línea queda marcada con lo que no apartó."""
+        self._cotizar(7)
+        cotizacion = self._cotizar(4)
+        self.assertEqual(self._stock(), (10, 10, 0))
+        self.assertEqual(cotizacion.detalles.get().cantidad_sin_reserva, 1)
+        
+        borrador = Venta.objects.create(usuario=self.user, estado='BORRADOR')
+        detalle = VentaDetalle.objects.create(venta=borrador, producto=self.producto, cantidad=2)
+        self.assertEqual(detalle.reserva.cantidad, 0)
+        self.assertEqual(detalle.cantidad_sin_reserva, 2)
+        respuesta = self.client.get(reverse('venta_detail', args=[borrador.id]))
+        self.assertContains(respuesta, '2 sin stock para apartar')
+        
+        # Lo que falta se comprueba al completar
+        cotizacion.estado = 'COMPLETADA'
+        with self.assertRaises(StockInsuficiente):
+            cotizacion.save()
+        self.assertEqual(self._stock(), (10, 10, 0))
+    
+    def test_completar_consume_la_reserva_propia(self):
+        cotizacion = self._cotizar(10)
+        detalle = cotizacion.detalles.get()
+        detalle.cantidad = 8
+        detalle.save()
+        self.assertEqual(self._stock(), (10, 8, 2))
+        
+        cotizacion.estado = 'COMPLETADA'
+        cotizacion.save()
+        self.assertEqual(self._stock(), (2, 0, 2))
+        self.assertFalse(ReservaStock.objects.exists())
+    
+    def test_borrar_linea_o_cancelar_libera(self):
+        borrador = Venta.objects.create(usuario=self.user, estado='BORRADOR')
+        detalle = VentaDetalle.objects.create(venta=borrador, producto=self.producto, cantidad=3)
+        VentaDetalle.objects.create(venta=borrador, producto=self.producto, cantidad=2)
+        self.assertEqual(self._stock(), (10, 5, 5))
+        detalle.delete()
+        self.assertEqual(self._stock(), (10, 2, 8))
+        
+        borrador.estado = 'CANCELADA'
+        borrador.save()
+        self.assertEqual(self._stock(), (10, 0, 10))
+        borrador.estado = 'COTIZACION'
+        borrador.save()
+        self.assertEqual(self._stock(), (10, 2, 8))
+    
+    def test_barrido_libera_vencidas_en_bloque(self):
+        self._cotizar(2)
+        self._cotizar(3)
+        vigente = self._cotizar(1)
+        ReservaStock.objects.exclude(detalle__venta=vigente).update(expira=timezone.now() - timedelta(minutes=1))
+        
+        with CaptureQueriesContext(connection) as consultas:
+            call_command('liberar_reservas_vencidas', stdout=StringIO())
+        self.assertEqual(self._stock(), (10, 1, 9))
+        self.assertEqual(ReservaStock.objects.count(), 1)
+        sentencias = [q['sql'].split()[0] for q in consultas.captured_queries]
+        self.assertEqual((sentencias.count('UPDATE'), sentencias.count('DELETE')), (1, 1))
+        self.assertEqual(liberar_vencidas(), 0)
+
+
+class CambioEstadoLoteTest(TestCase):
+    """Tests para el cambio de estado de muchas ventas en una transacción."""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='cierre', password='12345')
+        self.client = Client()
+        self.client.login(username='cierre', password='12345')
+        self.lapiz = Producto.objects.create(
+            nombre="Lápiz", sku="LAP100", stock_actual=10,
+            precio_venta=Decimal('5.00'), costo_unitario=Decimal('2.00')
+        )
+        self.regla = Producto.objects.create(
+            nombre="Regla", sku="REG100", stock_actual=5,
+            precio_venta=Decimal('8.00'), costo_unitario=Decimal('3.00')
+        )
+    
+    def _venta(self, estado, *lineas):
+        return VentaService.crear_venta(Venta(usuario=self.user, estado=estado), lineas)
+    
+    def _stock(self):
+        return list(Producto.objects.order_by('id').values_list('stock_actual', 'stock_disponible'))
+    
+    def test_netea_stock_y_reporta_cada_venta(self):
+        ventas = [
+            self._venta('PENDIENTE_PAGO', (self.lapiz, 4)),
+            self._venta('PENDIENTE_PAGO', (self.lapiz, 4), (self.regla, 2)),
+            self._venta('PENDIENTE_PAGO', (self.lapiz, 4)),
+            self._venta('BORRADOR', (self.regla, 3)),
+        ]
+        self.assertEqual(self._stock(), [(10, 10), (5, 2)])
+        
+        with CaptureQueriesContext(connection) as consultas:
+            resultados = VentaService.cambiar_estados([venta.id for venta in ventas] + [9999], 'COMPLETADA')
+        self.assertEqual(resultados, {
+            ventas[0].id: None, ventas[1].id: None,
+            ventas[2].id: 'Stock insuficiente para Lápiz. Disponible: 2, Solicitado: 4',
+            ventas[3].id: None, 9999: 'La venta no existe.',
+        })
+        actualizaciones = [q['sql'] for q in consultas.captured_queries if q['sql'].startswith('UPDATE "core_producto"')]
+        # Una para liberar la reserva del borrador y otra para el stock de todas las ventas
+        self.assertEqual(len(actualizaciones), 2)
+        self.assertEqual(self._stock(), [(2, 2), (0, 0)])
+        self.assertEqual(
+            list(Venta.objects.order_by('id').values_list('estado', flat=True)),
+            ['COMPLETADA', 'COMPLETADA', 'PENDIENTE_PAGO', 'COMPLETADA']
+        )
+        self.assertEqual(InventarioMovimiento.objects.filter(tipo='VENTA').count(), 4)
+        totales = VentaResumenDiario.objects.get(producto__isnull=True)
+        self.assertEqual((totales.num_ventas, totales.ingresos), (3, Decimal('80.00')))
+        
+        # Cancelar en bloque devuelve el stock y resta del resumen
+        resultados = VentaService.cambiar_estados([ventas[0].id, ventas[1].id], 'CANCELADA')
+        self.assertEqual(list(resultados.values()), [None, None])
+        self.assertEqual(self._stock(), [(10, 10), (2, 2)])
+        totales.refresh_from_db()
+        self.assertEqual((totales.num_ventas, totales.ingresos), (1, Decimal('24.00')))
+    
+    def test_falta_en_la_sucursal_falla_solo_esa_venta(self):
+        """Si la sucursal de una venta no alcanza, se informa esa venta y el resto del lote se aplica."""
+        norte = Sucursal.objects.create(nombre="Norte", codigo="N1", direccion="Calle 1", latitud=10, longitud=-74)
+        StockSucursal.objects.create(sucursal=norte, producto=self.lapiz, cantidad=3)
+        ventas = [
+            VentaService.crear_venta(Venta(usuario=self.user, estado='PENDIENTE_PAGO', sucursal=norte), [(self.lapiz, 2)]),
+            VentaService.crear_venta(Venta(usuario=self.user, estado='PENDIENTE_PAGO', sucursal=norte), [(self.lapiz, 2)]),
+            self._venta('PENDIENTE_PAGO', (self.lapiz, 2)),
+        ]
+        
+        resultados = VentaService.cambiar_estados([venta.id for venta in ventas], 'COMPLETADA')
+        self.assertEqual(resultados, {
+            ventas[0].id: None,
+            ventas[1].id: 'Stock insuficiente para Lápiz. Disponible: 1, Solicitado: 2',
+            ventas[2].id: None,
+        })
+        self.assertEqual(StockSucursal.objects.get(sucursal=norte, producto=self.lapiz).cantidad, 1)
+        self.assertEqual(self._stock()[0], (6, 6))
+        
+        # Al revertir una venta completada la sucursal recupera sus unidades y la pendiente ya cabe
+        self.assertEqual(VentaService.cambiar_estados([ventas[0].id], 'CANCELADA'), {ventas[0].id: None})
+        self.assertEqual(VentaService.cambiar_estados([ventas[1].id], 'COMPLETADA'), {ventas[1].id: None})
+        self.assertEqual(StockSucursal.objects.get(sucursal=norte, producto=self.lapiz).cantidad, 1)
+    
+    def test_api_cambio_estado(self):
+        venta = self._venta('PENDIENTE_PAGO', (self.regla, 2))
+        respuesta = self.client.post(
+            reverse('api_ventas_cambiar_estado'),
+            data=json.dumps({'ventas': [venta.id], 'estado': 'COTIZACION'}), content_type='application/json'
+        )
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.json()['resultados'], [{'venta_id': venta.id, 'ok': True, 'error': None}])
+        self.assertEqual(self._stock()[1], (5, 3))
+        
+        respuesta = self.client.post(
+            reverse('api_ventas_cambiar_estado'),
+            data=json.dumps({'ventas': [venta.id], 'estado': 'PERDIDA'}), content_type='application/json'
+        )
+        self.assertEqual(respuesta.status_code, 400)
+
+
+class IdempotenciaVentaTest(TestCase):
+    """Tests para los reintentos de ventas con clave de idempotencia."""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='cajero', password='12345')
+        self.client = Client()
+        self.client.login(username='cajero', password='12345')
+        self.producto = Producto.objects.create(
+            nombre="Tijeras", sku="TIJ001", stock_actual=10,
+            precio_venta=Decimal('25.00'), costo_unitario=Decimal('12.00')
+        )
+    
+    def _post_formulario(self, clave):
+        return self.client.post(reverse('nueva_venta'), {
+            'clave_idempotencia': clave, 'estado': 'COMPLETADA', 'prioridad_entrega': 'media',
+            'detalles-TOTAL_FORMS': '1', 'detalles-INITIAL_FORMS': '0',
+            'detalles-MIN_NUM_FORMS': '1', 'detalles-MAX_NUM_FORMS': '1000',
+            'detalles-0-producto': self.producto.id, 'detalles-0-cantidad': '3',
+            'detalles-0-precio_unitario_venta': '25.00',
+        })
+    
+    def test_reenvio_del_formulario_no_duplica_la_venta(self):
+        self.assertContains(self.client.get(reverse('nueva_venta')), 'name="clave_idempotencia"')
+        primera = self._post_formulario('a1b2c3')
+        segunda = self._post_formulario('a1b2c3')
+        venta = Venta.objects.get()
+        self.assertRedirects(primera, reverse('venta_detail', args=[venta.id]), fetch_redirect_response=False)
+        self.assertRedirects(segunda, reverse('venta_detail', args=[venta.id]), fetch_redirect_response=False)
+        self.producto.refresh_from_db()
+        self.assertEqual(self.producto.stock_actual, 7)
+        
+        # Otra clave es otra venta
+        self._post_formulario('d4e5f6')
+        self.assertEqual(Venta.objects.count(), 2)
+    
+    def test_api_repite_la_respuesta_original(self):
+        def enviar(clave, cantidad=2):
+            return self.client.post(
+                reverse('api_ventas_crear'),
+                data=json.dumps({'lineas': [{'producto': self.producto.id, 'cantidad': cantidad}]}),
+                content_type='application/json', headers={'Idempotency-Key': clave}
+            )
+        
+        # Un intento sin stock no consume la clave
+        self.assertEqual(enviar('k-1', cantidad=11).status_code, 409)
+        primera = enviar('k-1')
+        segunda = enviar('k-1')
+        self.assertEqual(primera.status_code, 201)
+        self.assertEqual(segunda.json(), primera.json())
+        self.assertEqual(segunda['Idempotent-Replayed'], 'true')
+        self.assertNotIn('Idempotent-Replayed', primera)
+        self.assertEqual(primera.json()['monto_total'], '50.00')
+        self.assertEqual(Venta.objects.count(), 1)
+        self.producto.refresh_from_db()
+        self.assertEqual(self.producto.stock_actual, 8)
+    
+    def test_purga_claves_vencidas(self):
+        ClaveIdempotencia.objects.create(usuario=self.user, clave='vieja', creada=timezone.now() - timedelta(days=2))
+        ClaveIdempotencia.objects.create(usuario=self.user, clave='nueva')
+        call_command('purgar_claves_idempotencia', stdout=StringIO())
+        self.assertEqual(list(ClaveIdempotencia.objects.values_list('clave', flat=True)), ['nueva'])
+
+
+class SincronizacionVentasTest(TestCase):
+    """Tests para la sincronización de ventas hechas sin conexión."""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='tienda', password='12345')
+        self.client = Client()
+        self.client.login(username='tienda', password='12345')
+        self.productos = [
+            Producto.objects.create(
+                nombre=f"Cuaderno {i}", sku=f"CUA{i:03d}", stock_actual=100,
+                precio_venta=Decimal('10.00'), costo_unitario=Decimal('4.00')
+            )
+            for i in range(20)
+        ]
+    
+    def _sincronizar(self, ventas):
+        return self.client.post(
+            reverse('api_ventas_sincronizar'), data=json.dumps({'ventas': ventas}), content_type='application/json'
+        )
+    
+    def test_lote_de_500_ventas(self):
+        ventas = [
+            {
+                'uuid': str(uuid.uuid4()),
+                'fecha': '2026-03-02T10:15:00',
+                'lineas': [
+                    {'producto': self.productos[i % 20].id, 'cantidad': 1},
+                    {'producto': self.productos[(i + 1) % 20].id, 'cantidad': 1, 'precio': '9.50'},
+                ],
+            }
+            for i in range(500)
+        ]
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self._sincronizar(ventas)
+        
+        self.assertEqual(respuesta.json()['creadas'], 500)
+        # Unas decenas de consultas (lotes de bulk_create), no una por venta
+        self.assertLess(len(consultas.captured_queries), 50)
+        self.assertEqual(set(Producto.objects.values_list('stock_actual', flat=True)), {50})
+        self.assertEqual(Venta.objects.filter(fecha__date=date(2026, 3, 2)).count(), 500)
+        self.assertEqual(VentaResumenDiario.objects.get(producto__isnull=True).ingresos, Decimal('9750.00'))
+        
+        # Reenviar el lote no crea nada
+        respuesta = self._sincronizar(ventas[:10])
+        self.assertEqual(respuesta.json()['duplicadas'], 10)
+        self.assertEqual(Venta.objects.count(), 500)
+    
+    def test_duplicados_conflictos_e_invalidas(self):
+        self.productos[0].stock_actual = 3
+        self.productos[0].save()
+        repetida, sin_stock, sin_producto = (str(uuid.uuid4()) for _ in range(3))
+        respuesta = self._sincronizar([
+            {'uuid': repetida, 'lineas': [{'producto': self.productos[0].id, 'cantidad': 2}]},
+            {'uuid': repetida, 'lineas': [{'producto': self.productos[0].id, 'cantidad': 2}]},
+            {'uuid': sin_stock, 'lineas': [{'producto': self.productos[0].id, 'cantidad': 2}]},
+            {'uuid': 'no-es-uuid', 'lineas': []},
+            {'uuid': sin_stock, 'lineas': [{'producto': self.productos[0].id, 'cantidad': 2}]},
+            {'uuid': sin_producto, 'lineas': [{'producto': 999999, 'cantidad': 1}]},
+            {'uuid': sin_producto, 'lineas': [{'producto': 999999, 'cantidad': 1}]},
+        ]).json()
+        
+        resultados = respuesta['resultados']
+        self.assertEqual(
+            [r['resultado'] for r in resultados],
+            ['creada', 'duplicada', 'conflicto', 'invalida', 'conflicto', 'invalida', 'invalida']
+        )
+        self.assertEqual(resultados[1]['venta_id'], resultados[0]['venta_id'])
+        self.assertEqual(resultados[2]['faltantes'][0]['disponible'], 1)
+        # Las copias de una venta que no se registró no se informan como ya sincronizadas
+        self.assertEqual(resultados[4], resultados[2])
+        self.assertEqual(resultados[6], resultados[5])
+        self.assertIsNone(resultados[6]['venta_id'])
+        self.productos[0].refresh_from_db()
+        self.assertEqual(self.productos[0].stock_actual, 1)
+
+
+class PreciosLoteTest(TestCase):
+    """Tests para la consulta de precio y stock de varios productos a la vez."""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='precios', password='12345')
+        self.client = Client()
+        self.client.login(username='precios', password='12345')
+        self.productos = [
+            Producto.objects.create(
+                nombre=f"Folder {i}", sku=f"FOL{i:03d}", stock_actual=i,
+                precio_venta=Decimal('2.50'), costo_unitario=Decimal('1.00')
+            )
+            for i in range(50)
+        ]
+        self.url = reverse('api_productos_precios') + '?ids=' + ','.join(str(p.id) for p in self.productos)
+        caches[settings.INDICE_PRODUCTOS_CACHE_ALIAS].clear()
+    
+    def _lecturas_de_productos(self, consultas):
+        return [q['sql'] for q in consultas.captured_queries if q['sql'].startswith('SELECT') and 'FROM "core_producto"' in q['sql']]
+    
+    def test_una_consulta_para_todas_las_lineas_y_etag(self):
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.get(self.url)
+        datos = respuesta.json()['productos']
+        self.assertEqual(len(datos), 50)
+        self.assertEqual(datos[str(self.productos[7].id)], {'precio': 2.5, 'stock': 7, 'stock_actual': 7, 'stock_reservado': 0})
+        self.assertEqual(len(self._lecturas_de_productos(consultas)), 1)
+        self.assertEqual(respuesta['Cache-Control'], 'private, no-cache')
+        
+        # El ETag no depende del caché del proceso: otro proceso (caché vacío) responde igual
+        caches[settings.INDICE_PRODUCTOS_CACHE_ALIAS].clear()
+        with CaptureQueriesContext(connection) as consultas:
+            condicional = self.client.get(self.url, HTTP_IF_NONE_MATCH=respuesta['ETag'])
+        self.assertEqual(condicional.status_code, 304)
+        self.assertEqual(len(self._lecturas_de_productos(consultas)), 1)
+    
+    def test_un_cambio_de_producto_invalida_la_respuesta(self):
+        respuesta = self.client.get(self.url)
+        # Un UPDATE sin señales (como el de otro proceso) también cambia el ETag
+        Producto.objects.filter(pk=self.productos[7].pk).update(precio_venta=Decimal('3.00'))
+        nueva = self.client.get(self.url, HTTP_IF_NONE_MATCH=respuesta['ETag'])
+        self.assertEqual(nueva.status_code, 200)
+        self.assertEqual(nueva.json()['productos'][str(self.productos[7].id)]['precio'], 3.0)
+        
+        self.assertEqual(self.client.get(reverse('api_productos_precios') + '?ids=1,x').status_code, 400)
+
+
+class StockSucursalTest(TestCase):
+    """Tests para el stock por sucursal."""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='bodega', password='12345')
+        self.client = Client()
+        self.client.login(username='bodega', password='12345')
+        self.norte = Sucursal.objects.create(nombre="Norte", codigo="N1", direccion="Calle 1", latitud=10, longitud=-74)
+        self.sur = Sucursal.objects.create(nombre="Sur", codigo="S1", direccion="Calle 2", latitud=11, longitud=-74)
+        self.proveedor = Proveedor.objects.create(nombre="Proveedor Sucursales")
+        self.productos = [
+            Producto.objects.create(
+                nombre=f"Tinta {i}", sku=f"TIN{i:03d}", stock_actual=0,
+                precio_venta=Decimal('8.00'), costo_unitario=Decimal('4.00')
+            )
+            for i in range(3)
+        ]
+    
+    def _recibir(self, sucursal, cantidad):
+        pedido = PedidoProveedor.objects.create(proveedor=self.proveedor, sucursal=sucursal)
+        for producto in self.productos:
+            PedidoDetalle.objects.create(pedido=pedido, producto=producto, cantidad=cantidad, costo_unitario_compra=Decimal('4.00'))
+        pedido.estado = 'RECIBIDO'
+        pedido.save()
+        return pedido
+    
+    def _stock(self, sucursal):
+        return dict(StockSucursal.objects.filter(sucursal=sucursal).values_list('producto__sku', 'cantidad'))
+    
+    def test_recepcion_y_venta_mueven_la_sucursal_con_un_update(self):
+        self._recibir(self.norte, 10)
+        self._recibir(self.sur, 4)
+        self.assertEqual(self._stock(self.norte), {'TIN000': 10, 'TIN001': 10, 'TIN002': 10})
+        
+        with CaptureQueriesContext(connection) as consultas:
+            VentaService.crear_venta(
+                Venta(usuario=self.user, estado='COMPLETADA', sucursal=self.norte),
+                [(producto, 3) for producto in self.productos]
+            )
+        updates = [q for q in consultas.captured_queries if q['sql'].startswith('UPDATE "core_stocksucursal"')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(self._stock(self.norte), {'TIN000': 7, 'TIN001': 7, 'TIN002': 7})
+        self.assertEqual(self._stock(self.sur), {'TIN000': 4, 'TIN001': 4, 'TIN002': 4})
+        self.assertEqual(Producto.objects.get(sku='TIN000').stock_actual, 11)
+        self.assertTrue(InventarioMovimiento.objects.filter(tipo='VENTA', sucursal=self.norte).exists())
+    
+    def test_venta_sin_stock_en_la_sucursal_no_se_guarda(self):
+        self._recibir(self.norte, 10)
+        self._recibir(self.sur, 2)
+        with self.assertRaises(StockInsuficiente) as error:
+            VentaService.crear_venta(
+                Venta(usuario=self.user, estado='COMPLETADA', sucursal=self.sur),
+                [(self.productos[0], 5)]
+            )
+        self.assertEqual(error.exception.faltantes[0]['sucursal_id'], self.sur.id)
+        self.assertEqual(error.exception.faltantes[0]['disponible'], 2)
+        self.assertFalse(Venta.objects.exists())
+        self.assertEqual(Producto.objects.get(sku='TIN000').stock_actual, 12)
+        self.assertEqual(self._stock(self.sur)['TIN000'], 2)
+    
+    def test_nota_de_entrega_descuenta_la_sucursal_de_la_venta(self):
+        self._recibir(self.norte, 10)
+        venta = VentaService.crear_venta(
+            Venta(usuario=self.user, estado='PAGADA_PENDIENTE_ENTREGA', sucursal=self.norte),
+            [(self.productos[0], 6)]
+        )
+        nota = NotaEntregaVenta.objects.create(venta=venta, usuario=self.user, descripcion="Primera entrega")
+        DetalleNotaEntrega.objects.create(nota_entrega=nota, producto=self.productos[0], cantidad_entregada=4)
+        nota.aplicar_descuento_inventario()
+        self.assertEqual(self._stock(self.norte)['TIN000'], 6)
+        
+        nota.revertir_descuento_inventario()
+        self.assertEqual(self._stock(self.norte)['TIN000'], 10)
+    
+    def test_saldo_inicial_y_conteo_fisico(self):
+        for producto in self.productos:
+            Producto.objects.filter(pk=producto.pk).update(stock_actual=10)
+        with self.assertRaises(CommandError):
+            call_command('ajustar_stock_sucursal', 'N1', 'TIN000=11', '--asignar', stdout=StringIO())
+        
+        # Saldo inicial: el stock global no cambia
+        call_command('ajustar_stock_sucursal', 'N1', 'TIN000=6', '--asignar', stdout=StringIO())
+        call_command('ajustar_stock_sucursal', 'S1', '--resto', stdout=StringIO())
+        self.assertEqual(self._stock(self.norte), {'TIN000': 6})
+        self.assertEqual(self._stock(self.sur), {'TIN000': 4, 'TIN001': 10, 'TIN002': 10})
+        self.assertEqual(Producto.objects.get(sku='TIN000').stock_actual, 10)
+        
+        VentaService.crear_venta(
+            Venta(usuario=self.user, estado='COMPLETADA', sucursal=self.norte), [(self.productos[0], 5)]
+        )
+        # Conteo físico: cambia la sucursal y el global
+        call_command('ajustar_stock_sucursal', 'N1', 'TIN000=0', stdout=StringIO())
+        self.assertEqual(self._stock(self.norte), {'TIN000': 0})
+        self.assertEqual(Producto.objects.get(sku='TIN000').stock_actual, 4)
+        self.assertEqual(
+            InventarioMovimiento.objects.filter(tipo='AJUSTE', sucursal=self.norte).count(), 2
+        )
+    
+    def test_faltantes_de_varias_ventas_en_una_consulta(self):
+        self._recibir(self.sur, 5)
+        ventas = [
+            VentaService.crear_venta(
+                Venta(usuario=self.user, estado='PAGADA_PENDIENTE_ENTREGA'),
+                [(self.productos[0], 3), (self.productos[1], 1)]
+            )
+            for _ in range(2)
+        ]
+        with CaptureQueriesContext(connection) as consultas:
+            faltantes = faltantes_sucursal([venta.id for venta in ventas], self.sur.id)
+        self.assertEqual(len(consultas.captured_queries), 1)
+        self.assertEqual(faltantes, [
+            {'producto_id': self.productos[0].id, 'nombre': 'Tinta 0', 'disponible': 5, 'solicitado': 6}
+        ])
+        # La sucursal norte no tiene nada
+        self.assertEqual(len(faltantes_sucursal([venta.id for venta in ventas], self.norte.id)), 2)
+    
+    def test_ruta_no_se_planea_si_la_sucursal_no_tiene_la_mercancia(self):
+        self._recibir(self.sur, 1)
+        venta = VentaService.crear_venta(
+            Venta(usuario=self.user, estado='PAGADA_PENDIENTE_ENTREGA', requiere_domicilio=True,
+                  latitud_entrega=10.5, longitud_entrega=-74.1),
+            [(self.productos[2], 2)]
+        )
+        repartidor = Repartidor.objects.create(nombre="Repartidor", telefono="300", documento="R1")
+        response = self.client.post(
+            reverse('api_calcular_ruta'),
+            json.dumps({'sucursal_id': self.sur.id, 'repartidor_id': repartidor.id,
+                        'ventas_ids': [venta.id], 'fecha_entrega': '2025-01-15'}),
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['faltantes'][0]['producto_id'], self.productos[2].id)
+
+
+class CantidadEntregadaTest(TestCase):
+    """Tests para el contador de unidades entregadas de cada línea de venta."""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='despacho', password='12345')
+        self.productos = [
+            Producto.objects.create(
+                nombre=f"Cuaderno {i}", sku=f"CUA{i:03d}", stock_actual=50,
+                precio_venta=Decimal('3.00'), costo_unitario=Decimal('1.00')
+            )
+            for i in range(20)
+        ]
+    
+    def _venta(self, lineas):
+        return VentaService.crear_venta(
+            Venta(usuario=self.user, estado='PAGADA_PENDIENTE_ENTREGA'),
+            [(producto, 5) for producto in self.productos[:lineas]]
+        )
+    
+    def _nota(self, venta, entregas):
+        nota = NotaEntregaVenta.objects.create(venta=venta, usuario=self.user, descripcion="Entrega")
+        for producto, cantidad in entregas:
+            DetalleNotaEntrega.objects.create(nota_entrega=nota, producto=producto, cantidad_entregada=cantidad)
+        nota.aplicar_descuento_inventario()
+        return nota
+    
+    def test_aplicar_y_revertir_mueven_el_contador(self):
+        venta = self._venta(2)
+        primera = self._nota(venta, [(self.productos[0], 2), (self.productos[1], 5)])
+        self._nota(venta, [(self.productos[0], 3)])
+        self.assertEqual(dict(venta.detalles.values_list('producto__sku', 'cantidad_entregada')), {'CUA000': 5, 'CUA001': 5})
+        self.assertTrue(venta.entrega_completa)
+        
+        primera.revertir_descuento_inventario()
+        self.assertEqual(venta.cantidad_entregada_producto(self.productos[0]), 3)
+        self.assertEqual(venta.cantidad_pendiente_producto(self.productos[1]), 5)
+        self.assertFalse(venta.entrega_completa)
+        
+        # No se puede entregar más de lo pendiente
+        nota = NotaEntregaVenta.objects.create(venta=venta, usuario=self.user, descripcion="Exceso")
+        with self.assertRaises(ValidationError):
+            DetalleNotaEntrega.objects.create(nota_entrega=nota, producto=self.productos[0], cantidad_entregada=3)
+    
+    def test_resumen_en_una_consulta_sin_importar_las_lineas(self):
+        consultas_por_venta = []
+        for lineas in (2, 20):
+            venta = self._venta(lineas)
+            self._nota(venta, [(producto, 1) for producto in self.productos[:lineas]])
+            with CaptureQueriesContext(connection) as consultas:
+                resumen = venta.resumen_entregas
+            consultas_por_venta.append(len(consultas.captured_queries))
+            self.assertEqual(len(resumen), lineas)
+            self.assertEqual(resumen[-1]['cantidad_pendiente'], 4)
+        self.assertEqual(consultas_por_venta, [1, 1])
+    
+    def test_recalcular_coincide_con_las_notas(self):
+        venta = self._venta(3)
+        self._nota(venta, [(self.productos[0], 2), (self.productos[2], 4)])
+        with CaptureQueriesContext(connection) as consultas:
+            entregado = entregado_por_producto([venta.id])
+        self.assertEqual(len(consultas.captured_queries), 1)
+        self.assertEqual(entregado, {
+            (venta.id, detalle.producto_id): detalle.cantidad_entregada
+            for detalle in venta.detalles.filter(cantidad_entregada__gt=0)
+        })
+        
+        VentaDetalle.objects.filter(venta=venta).update(cantidad_entregada=0)
+        self.assertEqual(recalcular([venta.id]), 2)
+        self.assertEqual(venta.cantidad_entregada_producto(self.productos[2]), 4)
+        self.assertEqual(recalcular(), 0)
+
+
+class ReservaConcurrenteTest(TransactionTestCase):
+    """50 cajas cobran a la vez el mismo SKU: nunca se vende más que el stock."""
+    
+    def test_solo_las_escrituras_de_stock_toman_el_bloqueo_al_empezar(self):
+        with CaptureQueriesContext(connection) as consultas:
+            with transaction.atomic():
+                Producto.objects.count()
+            with atomic_escritura():
+                with atomic_escritura():
+                    Producto.objects.count()
+        inicios = [q['sql'] for q in consultas.captured_queries if q['sql'].startswith('BEGIN')]
+        if connection.vendor == 'sqlite':
+            self.assertEqual(inicios, ['BEGIN', 'BEGIN IMMEDIATE'])
+    
+    def test_sin_sobreventa_con_50_cobros_simultaneos(self):
+        user = User.objects.create_user(username='concurrencia', password='12345')
+        producto = Producto.objects.create(
+            nombre="Última unidad", sku="ULT001", stock_actual=20,
+            precio_venta=Decimal('10.00'), costo_unitario=Decimal('5.00')
+        )
+        barrera = threading.Barrier(50)
+        resultados = []
+        
+        def cobrar():
+            try:
+                barrera.wait()
+                venta = Venta.objects.create(usuario=user, estado='BORRADOR')
+                try:
+                    # El borrador aparta la unidad si queda; sin stock falla al completar
+                    VentaDetalle.objects.create(venta=venta, producto=producto, cantidad=1, precio_unitario_venta=Decimal('10.00'))
+                    venta.estado = 'COMPLETADA'
+                    venta.save()
+                    resultados.append('ok')
+                except StockInsuficiente:
+                    resultados.append('sin_stock')
+            finally:
+                connection.close()
+        
+        hilos = [threading.Thread(target=cobrar) for _ in range(50)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        
+        producto.refresh_from_db()
+        self.assertEqual(resultados.count('ok'), 20)
+        self.assertEqual(resultados.count('sin_stock'), 30)
+        self.assertEqual(producto.stock_actual, 0)
+        self.assertEqual(InventarioMovimiento.objects.filter(producto=producto).count(), 20)
+
+
+class ResumenConcurrenteTest(TransactionTestCase):
+    """Dos ventas del mismo cliente y cajero se completan a la vez en un día sin resumen."""
+    
+    def test_dos_primeras_altas_simultaneas_quedan_en_una_fila(self):
+        user = User.objects.create_user(username='resumen_concurrente', password='12345')
+        cliente = Cliente.objects.create(nombre="Cliente Concurrente")
+        barrera = threading.Barrier(2)
+        errores = []
+        
+        def completar():
+            try:
+                barrera.wait()
+                Venta.objects.create(cliente=cliente, usuario=user, estado='COMPLETADA')
+            except Exception as error:
+                errores.append(error)
+            finally:
+                connection.close()
+        
+        hilos = [threading.Thread(target=completar) for _ in range(2)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        
+        self.assertEqual(errores, [])
+        self.assertEqual(
+            list(VentaResumenDiario.objects.filter(producto__isnull=True).values_list('cliente_id', 'num_ventas')),
+            [(cliente.id, 2)],
+        )
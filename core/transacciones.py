@@ -0,0 +1,40 @@
+"""
+Transacciones de escritura de stock.
+
+En SQLite una transacción normal (DEFERRED) empieza leyendo y pide el
+bloqueo de escritura al primer UPDATE; si otra transacción ya lo tiene, la
+que quería pasar de lectura a escritura falla al instante con "database is
+locked" (no espera el timeout). atomic_escritura() abre la transacción con
+BEGIN IMMEDIATE: toma el bloqueo de escritura al empezar y, si está ocupado,
+espera su turno hasta el timeout de la conexión.
+
+Solo se usa en los caminos que mueven stock (core.services.inventario,
+reservas, ventas, pedidos, notas de entrega y el resumen de ventas); el resto
+de transacciones, incluidas las de solo lectura, siguen siendo DEFERRED.
+En otras bases de datos es un transaction.atomic() normal: ahí bloquean
+las filas select_for_update() y los UPDATE condicionales.
+"""
+from contextlib import contextmanager
+
+from django.db import transaction
+
+
+@contextmanager
+def atomic_escritura(using=None):
+    """transaction.atomic() que en SQLite toma el bloqueo de escritura al empezar (si es la más externa)."""
+    conexion = transaction.get_connection(using)
+    if conexion.vendor != 'sqlite' or conexion.in_atomic_block:
+        with transaction.atomic(using=using):
+            yield
+        return
+
+    conexion.ensure_connection()
+    modo = conexion.transaction_mode
+    conexion.transaction_mode = 'IMMEDIATE'
+    try:
+        with transaction.atomic(using=using):
+            # El modo solo afecta al BEGIN de esta transacción
+            conexion.transaction_mode = modo
+            yield
+    finally:
+        conexion.transaction_mode = modo
@@ -1,10 +1,29 @@
-from django.urls import path
+from django.urls import path, include
+from rest_framework.routers import SimpleRouter
 from . import views
 from . import excel_views
+from . import api_views
+
+# API REST de solo lectura (catálogos)
+router = SimpleRouter()
+router.register('clientes', api_views.ClienteViewSet, basename='api-clientes')
+router.register('productos', api_views.ProductoViewSet, basename='api-productos')
+router.register('proveedores', api_views.ProveedorViewSet, basename='api-proveedores')
+router.register('sucursales', api_views.SucursalViewSet, basename='api-sucursales')
+router.register('repartidores', api_views.RepartidorViewSet, basename='api-repartidores')
 
 urlpatterns = [
     # Dashboard
     path('', views.dashboard, name='dashboard'),
+    path('api/dashboard/conteos/', views.api_dashboard_widget, {'widget': 'conteos'}, name='api_dashboard_conteos'),
+    path('api/dashboard/ventas-hoy/', views.api_dashboard_widget, {'widget': 'ventas_hoy'}, name='api_dashboard_ventas_hoy'),
+    path('api/dashboard/ventas-mes/', views.api_dashboard_widget, {'widget': 'ventas_mes'}, name='api_dashboard_ventas_mes'),
+    path('api/dashboard/productos-mas-vendidos/', views.api_dashboard_widget, {'widget': 'productos_mas_vendidos'}, name='api_dashboard_productos_mas_vendidos'),
+    path('api/dashboard/clientes-activos/', views.api_dashboard_widget, {'widget': 'clientes_activos'}, name='api_dashboard_clientes_activos'),
+    path('api/dashboard/stock-bajo/', views.api_dashboard_widget, {'widget': 'stock_bajo'}, name='api_dashboard_stock_bajo'),
+    path('api/dashboard/pedidos-pendientes/', views.api_dashboard_widget, {'widget': 'pedidos_pendientes'}, name='api_dashboard_pedidos_pendientes'),
+    path('api/dashboard/ventas-recientes/', views.api_dashboard_widget, {'widget': 'ventas_recientes'}, name='api_dashboard_ventas_recientes'),
+    path('api/analitica/ventas/', views.api_analitica_ventas, name='api_analitica_ventas'),
     
     # Clientes
     path('clientes/', views.cliente_list, name='cliente_list'),
@@ -50,6 +69,7 @@ urlpatterns = [
     # Pedidos
     path('pedidos/', views.pedido_list, name='pedido_list'),
     path('pedidos/nuevo/', views.pedido_add, name='pedido_add'),
+    path('pedidos/cuentas-por-pagar/', views.pedido_cuentas_por_pagar, name='pedido_cuentas_por_pagar'),
     path('pedidos/<int:pk>/', views.pedido_detail, name='pedido_detail'),
     path('pedidos/<int:pk>/cambiar-estado/', views.pedido_cambiar_estado, name='pedido_cambiar_estado'),
     path('pedidos/<int:pk>/pagos/nuevo/', views.pedido_pago_add, name='pedido_pago_add'),
@@ -76,8 +96,21 @@ urlpatterns = [
     
     # API endpoints - Productos
     path('api/producto/<int:producto_id>/precio/', views.get_producto_precio, name='get_producto_precio'),
+    path('api/productos/precios/', views.api_productos_precios, name='api_productos_precios'),
+    path('api/productos/stock-bajo/', views.api_productos_stock_bajo, name='api_productos_stock_bajo'),
+    path('api/inventario/stock/', views.api_stock_a_fecha, name='api_stock_a_fecha'),
     path('api/buscar-productos/', views.buscar_productos, name='buscar_productos'),
     
+    # API endpoints - Ventas
+    path('api/ventas/', views.api_ventas_crear, name='api_ventas_crear'),
+    path('api/ventas/sincronizar/', views.api_ventas_sincronizar, name='api_ventas_sincronizar'),
+    path('api/ventas/cambiar-estado/', views.api_ventas_cambiar_estado, name='api_ventas_cambiar_estado'),
+    path('api/pedidos/recibir/', views.api_pedidos_recibir, name='api_pedidos_recibir'),
+    path('api/pedidos/generar-reposicion/', views.api_pedidos_generar_reposicion, name='api_pedidos_generar_reposicion'),
+    
+    # API REST v1
+    path('api/v1/', include(router.urls)),
+    
     # API endpoints - Domicilios
     path('api/domicilios/ventas-pendientes/', views.api_ventas_pendientes, name='api_ventas_pendientes'),
     path('api/domicilios/calcular-ruta/', views.api_calcular_ruta_optima, name='api_calcular_ruta'),
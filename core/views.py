@@ -5,150 +5,88 @@ from django.contrib import messages
 from django.utils import timezone
 from datetime import datetime, timedelta
 from django.http import JsonResponse
-from django.db import transaction
+from django.core.paginator import Paginator
+from django.views.decorators.http import condition
+from django.db import IntegrityError, transaction
+from django.core.exceptions import ValidationError
 from django.db.models import Q, F
 from ortools.constraint_solver import routing_enums_pb2
 from ortools.constraint_solver import pywrapcp
 from datetime import datetime
 import json 
+import uuid
+from collections import defaultdict
+from decimal import Decimal
+from urllib.parse import urlencode
 import requests 
 
 
 from .models import Cliente, Producto, Categoria, Venta, VentaDetalle, Proveedor, PedidoProveedor, PedidoDetalle, PagoProveedor, NotaEntregaVenta, DetalleNotaEntrega, Sucursal, Repartidor, RutaEntrega, DetalleRuta
+from .services.dashboard import obtener_widget, invalidar_widgets, ultima_modificacion, productos_stock_bajo
+from .services.resumen_ventas import registrar_venta
+from .services.analitica import serie_ventas
+from .services.inventario import StockInsuficiente, faltantes_sucursal, stock_a_fecha
+from .services import idempotencia
+from .transacciones import atomic_escritura
+from .services.cuentas_por_pagar import con_saldos, cuentas_por_pagar
+from .services import reposicion
+from .services.pedidos import MAX_PEDIDOS_POR_LOTE, PedidoService
+from .services.ventas import MAX_VENTAS_POR_LOTE, VentaService
+from .paginacion import paginar_keyset
+from .busquedas import aplicar_busqueda
+from .services.busqueda_productos import buscar_productos as buscar_productos_indexados, LIMITE_RESULTADOS
+from .services import indice_productos, precios
 from .forms import ClienteForm, ProductoForm, VentaForm, VentaDetalleFormSet, ProveedorForm, PedidoProveedorForm, PedidoDetalleFormSet, PagoProveedorForm, NotaEntregaVentaForm, DetalleNotaEntregaFormSet, SucursalForm, RepartidorForm, RutaEntregaForm, VentaDomicilioForm
 
 # Dashboard
 @login_required
 def dashboard(request):
-    from django.db.models import Sum, Count, Avg
-    from decimal import Decimal
-    
-    # Fechas para análisis
-    hoy = timezone.now().date()
-    inicio_mes = hoy.replace(day=1)
-    hace_30_dias = hoy - timedelta(days=30)
-    
-    # Estadísticas básicas
-    total_productos = Producto.objects.count()
-    total_clientes = Cliente.objects.count()
-    total_proveedores = Proveedor.objects.count()
-    
-    # Ventas y ganancias
-    ventas_hoy_count = Venta.objects.filter(fecha__date=hoy, estado='COMPLETADA').count()
-    ventas_hoy_total = Venta.objects.filter(fecha__date=hoy, estado='COMPLETADA').aggregate(
-        total=Sum('monto_total')
-    )['total'] or Decimal('0')
-    
-    # Ventas del mes
-    ventas_mes_total = Venta.objects.filter(
-        fecha__date__gte=inicio_mes, 
-        estado='COMPLETADA'
-    ).aggregate(total=Sum('monto_total'))['total'] or Decimal('0')
-    
-    ventas_mes_count = Venta.objects.filter(
-        fecha__date__gte=inicio_mes, 
-        estado='COMPLETADA'
-    ).count()
-    
-    # Ganancias estimadas (diferencia entre precio venta y costo)
-    ganancias_mes = Decimal('0')
-    ventas_completadas = Venta.objects.filter(
-        fecha__date__gte=inicio_mes, 
-        estado='COMPLETADA'
-    ).prefetch_related('detalles__producto')
-    
-    for venta in ventas_completadas:
-        for detalle in venta.detalles.all():
-            # Calcular ganancia por producto (precio venta - costo estimado)
-            precio_venta = detalle.precio_unitario_venta * detalle.cantidad
-            # Usar el último costo de compra del producto como referencia
-            ultimo_pedido = PedidoDetalle.objects.filter(
-                producto=detalle.producto
-            ).order_by('-pedido__fecha_pedido').first()
-            
-            if ultimo_pedido:
-                costo_estimado = ultimo_pedido.costo_unitario_compra * detalle.cantidad
-                ganancia_producto = precio_venta - costo_estimado
-                # Solo sumar si la ganancia es positiva (evitar costos incorrectos)
-                if ganancia_producto > 0:
-                    ganancias_mes += ganancia_producto
-                else:
-                    # Si el costo es mayor que el precio, usar margen del 30%
-                    ganancias_mes += precio_venta * Decimal('0.3')
-            else:
-                # Si no hay costo de compra, asumir 40% de ganancia
-                ganancias_mes += precio_venta * Decimal('0.4')
-    
-    # Ticket promedio
-    ticket_promedio = Decimal('0')
-    if ventas_mes_count > 0:
-        ticket_promedio = ventas_mes_total / ventas_mes_count
-    
-    # Productos más vendidos (últimos 30 días)
-    productos_mas_vendidos = VentaDetalle.objects.filter(
-        venta__fecha__date__gte=hace_30_dias,
-        venta__estado='COMPLETADA'
-    ).values(
-        'producto__nombre', 'producto__sku'
-    ).annotate(
-        total_vendido=Sum('cantidad'),
-        ingresos=Sum(F('cantidad') * F('precio_unitario_venta'))
-    ).order_by('-total_vendido')[:5]
-    
-    # Clientes más activos
-    clientes_activos = Venta.objects.filter(
-        fecha__date__gte=hace_30_dias,
-        estado='COMPLETADA'
-    ).values(
-        'cliente__nombre'
-    ).annotate(
-        total_compras=Count('id'),
-        total_gastado=Sum('monto_total')
-    ).order_by('-total_gastado')[:5]
-    
-    # Productos con stock bajo
-    productos_stock_bajo = Producto.objects.filter(stock_actual__lte=F('stock_minimo')).count()
-    productos_alerta = Producto.objects.filter(stock_actual__lte=F('stock_minimo'))[:5]
-    
-    # Pedidos pendientes
-    pedidos_pendientes = PedidoProveedor.objects.filter(estado='PENDIENTE').count()
-    pedidos_alerta = PedidoProveedor.objects.filter(estado='PENDIENTE').select_related('proveedor')[:5]
-    
-    # Inversión en inventario (pedidos pendientes)
-    inversion_pendiente = PedidoProveedor.objects.filter(
-        estado='PENDIENTE'
-    ).aggregate(total=Sum('costo_total'))['total'] or Decimal('0')
-    
-    # Ventas recientes
-    ventas_recientes = Venta.objects.select_related('cliente').order_by('-fecha')[:5]
-    
-    context = {
-        # Estadísticas básicas
-        'total_productos': total_productos,
-        'total_clientes': total_clientes,
-        'total_proveedores': total_proveedores,
-        
-        # Ventas y ganancias
-        'ventas_hoy_count': ventas_hoy_count,
-        'ventas_hoy_total': ventas_hoy_total,
-        'ventas_mes_total': ventas_mes_total,
-        'ventas_mes_count': ventas_mes_count,
-        'ganancias_mes': ganancias_mes,
-        'ticket_promedio': ticket_promedio,
-        
-        # Inventario y pedidos
-        'productos_stock_bajo': productos_stock_bajo,
-        'productos_alerta': productos_alerta,
-        'pedidos_pendientes': pedidos_pendientes,
-        'pedidos_alerta': pedidos_alerta,
-        'inversion_pendiente': inversion_pendiente,
-        
-        # Análisis de ventas
-        'productos_mas_vendidos': productos_mas_vendidos,
-        'clientes_activos': clientes_activos,
-        'ventas_recientes': ventas_recientes,
-    }
-    return render(request, 'dashboard.html', context)
+    # Solo se renderiza la estructura; cada panel se carga desde su endpoint JSON
+    return render(request, 'dashboard.html')
+
+
+def _widget_etag(request, widget):
+    return f"{widget}-{int(ultima_modificacion(widget).timestamp() * 1000000)}"
+
+
+def _widget_last_modified(request, widget):
+    return ultima_modificacion(widget)
+
+
+@login_required
+@condition(etag_func=_widget_etag, last_modified_func=_widget_last_modified)
+def api_dashboard_widget(request, widget):
+    """API: Datos de un panel del dashboard (admite GET condicional)."""
+    response = JsonResponse(obtener_widget(widget))
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+@login_required
+def api_analitica_ventas(request):
+    """API: Serie temporal de ventas y ganancias en formato columnar."""
+    hoy = timezone.localdate()
+    try:
+        desde = datetime.strptime(request.GET['desde'], '%Y-%m-%d').date() if request.GET.get('desde') else hoy - timedelta(days=29)
+        hasta = datetime.strptime(request.GET['hasta'], '%Y-%m-%d').date() if request.GET.get('hasta') else hoy
+        ventana = int(request.GET.get('ventana', 7))
+    except ValueError:
+        return JsonResponse({'error': 'Parámetros no válidos (fechas YYYY-MM-DD, ventana entera)'}, status=400)
+    if desde > hasta or ventana < 1:
+        return JsonResponse({'error': 'Rango de fechas o ventana no válidos'}, status=400)
+
+    try:
+        datos = serie_ventas(
+            desde, hasta,
+            intervalo=request.GET.get('intervalo', 'dia'),
+            categoria_id=request.GET.get('categoria') or None,
+            usuario_id=request.GET.get('usuario') or None,
+            agrupar_por=request.GET.get('agrupar') or None,
+            ventana=ventana,
+        )
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse(datos)
 
 # Clientes
 @login_required
@@ -156,12 +94,7 @@ def cliente_list(request):
     search = request.GET.get('search', '')
     clientes = Cliente.objects.all()
     
-    if search:
-        clientes = clientes.filter(
-            Q(nombre__icontains=search) | 
-            Q(email__icontains=search) | 
-            Q(telefono__icontains=search)
-        )
+    clientes = aplicar_busqueda(clientes, search, 'cliente')
     
     return render(request, 'clientes/list.html', {
         'clientes': clientes,
@@ -221,21 +154,19 @@ def producto_list(request):
     
     productos = Producto.objects.select_related('categoria')
     
-    if search:
-        productos = productos.filter(
-            Q(nombre__icontains=search) | 
-            Q(sku__icontains=search) |
-            Q(descripcion__icontains=search)
-        )
-    
     if categoria_id:
         productos = productos.filter(categoria_id=categoria_id)
     
+    if search:
+        # Índice de texto completo, ordenado por relevancia
+        productos = buscar_productos_indexados(productos, search)
+    
     categorias = Categoria.objects.all()
     
     return render(request, 'productos/list.html', {
         'productos': productos,
         'categorias': categorias,
+        'limite_resultados': LIMITE_RESULTADOS if search and len(productos) >= LIMITE_RESULTADOS else None,
         'search': search,
         'categoria_selected': categoria_id
     })
@@ -302,62 +233,73 @@ def venta_list(request):
     if estado:
         ventas = ventas.filter(estado=estado)
     
-    ventas = ventas.order_by('-fecha')
+    # Solo se cargan (y prefetch) las filas de la página pedida
+    pagina = paginar_keyset(ventas, 'fecha', request.GET.get('despues'), request.GET.get('antes'))
     
     return render(request, 'ventas/list.html', {
-        'ventas': ventas,
+        'ventas': pagina,
+        'pagina': pagina,
+        'monto_pagina': sum(venta.monto_total for venta in pagina),
+        'filtros': urlencode({k: v for k, v in (('search', search), ('estado', estado)) if v}),
         'search': search,
         'estado_selected': estado,
         'estados': Venta.ESTADO_CHOICES
     })
 
+def _respuesta_venta(venta):
+    return {'venta_id': venta.id, 'estado': venta.estado, 'monto_total': str(venta.monto_total)}
+
+def _crear_venta_idempotente(usuario, clave, venta, lineas):
+    """
+    Crea la venta con VentaService; con una clave de idempotencia válida solo
+    la primera vez. Devuelve (respuesta, repetida).
+    """
+    def crear():
+        VentaService.crear_venta(venta, lineas)
+        return venta, _respuesta_venta(venta)
+
+    if not idempotencia.clave_valida(clave):
+        return crear()[1], False
+    registro, repetida = idempotencia.ejecutar_una_vez(usuario, clave, crear)
+    return registro.respuesta or {'venta_id': registro.venta_id}, repetida
+
+def _venta_ya_registrada(request, respuesta):
+    messages.info(request, f'Este envío ya se había registrado como la Venta #{respuesta["venta_id"]}.')
+    if Venta.objects.filter(pk=respuesta['venta_id']).exists():
+        return redirect('venta_detail', pk=respuesta['venta_id'])
+    return redirect('venta_list')
+
 @login_required
 def nueva_venta(request):
     if request.method == 'POST':
+        # Un reenvío (doble clic, red inestable) trae la misma clave: se responde sin repetir la venta
+        clave = request.POST.get('clave_idempotencia', '')
+        anterior = idempotencia.buscar(request.user, clave) if idempotencia.clave_valida(clave) else None
+        if anterior is not None:
+            return _venta_ya_registrada(request, anterior.respuesta or {'venta_id': anterior.venta_id})
+
         venta_form = VentaForm(request.POST)
         formset = VentaDetalleFormSet(request.POST)
         
         if venta_form.is_valid() and formset.is_valid():
-            # Validar stock antes de crear la venta
-            stock_errors = []
-            for form in formset:
-                if form.cleaned_data and not form.cleaned_data.get('DELETE', False):
-                    producto = form.cleaned_data.get('producto')
-                    cantidad = form.cleaned_data.get('cantidad', 0)
-                    
-                    if producto and cantidad > 0:
-                        if producto.stock_actual < cantidad:
-                            stock_errors.append(
-                                f"Stock insuficiente para {producto.nombre}. "
-                                f"Disponible: {producto.stock_actual}, Solicitado: {cantidad}"
-                            )
-            
-            if stock_errors:
-                for error in stock_errors:
+            try:
+                venta = venta_form.save(commit=False)
+                venta.usuario = request.user
+                respuesta, repetida = _crear_venta_idempotente(request.user, clave, venta, [
+                    (form.cleaned_data['producto'], form.cleaned_data['cantidad'], form.cleaned_data.get('precio_unitario_venta'))
+                    for form in formset.forms
+                    if form.cleaned_data.get('producto') and not form.cleaned_data.get('DELETE', False)
+                ])
+                if repetida:
+                    return _venta_ya_registrada(request, respuesta)
+                messages.success(request, f'Venta #{venta.id} creada exitosamente.')
+                return redirect('venta_detail', pk=venta.id)
+            except ValidationError as e:
+                # Una línea por producto sin stock suficiente (StockInsuficiente)
+                for error in e.messages:
                     messages.error(request, error)
-            else:
-                with transaction.atomic():
-                    venta = venta_form.save(commit=False)
-                    venta.usuario = request.user
-                    venta.save()
-                    
-                    formset.instance = venta
-                    detalles = formset.save()
-                    
-                    # Actualizar stock de productos
-                    for detalle in detalles:
-                        producto = detalle.producto
-                        producto.stock_actual -= detalle.cantidad
-                        producto.save()
-                    
-                    # Calcular total
-                    total = sum(d.cantidad * d.precio_unitario_venta for d in detalles)
-                    venta.monto_total = total
-                    venta.save()
-                    messages.success(request, f'Venta #{venta.id} creada exitosamente.')
-                    return redirect('venta_detail', pk=venta.id)
     else:
-        venta_form = VentaForm()
+        venta_form = VentaForm(initial={'clave_idempotencia': uuid.uuid4().hex})
         formset = VentaDetalleFormSet()
     
     return render(request, 'ventas/nueva_venta.html', {
@@ -368,9 +310,9 @@ def nueva_venta(request):
 @login_required
 def venta_detail(request, pk):
 
-    domicilio_form = VentaDomicilioForm(instance=venta)
     venta = get_object_or_404(Venta, pk=pk)
-    detalles = venta.detalles.select_related('producto')
+    domicilio_form = VentaDomicilioForm(instance=venta)
+    detalles = venta.detalles.select_related('producto', 'reserva')
     return render(request, 'ventas/detail.html', {
         'venta': venta,
         'detalles': detalles,
@@ -435,33 +377,230 @@ def venta_editar_domicilio(request, pk):
             
     return redirect('venta_detail', pk=pk)
 
+@login_required
+def api_ventas_crear(request):
+    """
+    API: Crea una venta. Cuerpo JSON: {"lineas": [{"producto": id, "cantidad": n, "precio": "10.50"}],
+    "cliente": id, "estado": "COMPLETADA", ...} (precio opcional). Con el encabezado Idempotency-Key
+    un reintento devuelve la respuesta original, marcada con Idempotent-Replayed, sin crear otra venta.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Método no permitido'}, status=405)
+    clave = request.headers.get('Idempotency-Key', '')
+    if clave and not idempotencia.clave_valida(clave):
+        return JsonResponse({'error': f'Idempotency-Key admite hasta {idempotencia.MAX_LONGITUD} caracteres'}, status=400)
+    anterior = idempotencia.buscar(request.user, clave) if clave else None
+    if anterior is not None:
+        return _respuesta_repetida(anterior.respuesta or {'venta_id': anterior.venta_id})
+
+    try:
+        data = json.loads(request.body)
+        pedidas = [
+            (int(linea['producto']), int(linea['cantidad']), Decimal(str(linea['precio'])) if linea.get('precio') else None)
+            for linea in data['lineas']
+        ]
+    except (KeyError, TypeError, ValueError, ArithmeticError):
+        return JsonResponse({'error': 'Parámetros no válidos ({"lineas": [{"producto": id, "cantidad": n}]})'}, status=400)
+    # Los campos omitidos toman el valor por omisión del modelo
+    venta_form = VentaForm({
+        campo: data[campo] if campo in data else Venta._meta.get_field(campo).get_default()
+        for campo in VentaForm._meta.fields
+    })
+    if not venta_form.is_valid():
+        return JsonResponse({'error': 'Datos de la venta no válidos', 'errores': venta_form.errors}, status=400)
+    productos = Producto.objects.in_bulk({producto_id for producto_id, _, _ in pedidas})
+    if not pedidas or any(producto_id not in productos or cantidad < 1 for producto_id, cantidad, _ in pedidas):
+        return JsonResponse({'error': 'Cada línea necesita un producto existente y una cantidad positiva'}, status=400)
+
+    venta = venta_form.save(commit=False)
+    venta.usuario = request.user
+    try:
+        respuesta, repetida = _crear_venta_idempotente(request.user, clave, venta, [
+            (productos[producto_id], cantidad, precio) for producto_id, cantidad, precio in pedidas
+        ])
+    except StockInsuficiente as e:
+        return JsonResponse({'error': ' '.join(e.messages), 'faltantes': e.faltantes}, status=409)
+    if repetida:
+        return _respuesta_repetida(respuesta)
+    return JsonResponse(respuesta, status=201)
+
+def _respuesta_repetida(respuesta):
+    response = JsonResponse(respuesta, status=201)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+@login_required
+def api_ventas_sincronizar(request):
+    """
+    API: Registra un lote de ventas hechas sin conexión en el punto de venta.
+    Cuerpo JSON: {"ventas": [{"uuid": "...", "fecha": "...", "cliente": id, "lineas": [...]}]}.
+    Reenviar un lote es seguro: las ventas ya registradas vuelven como duplicadas.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Método no permitido'}, status=405)
+    try:
+        ventas = json.loads(request.body)['ventas']
+    except (KeyError, TypeError, ValueError):
+        return JsonResponse({'error': 'Parámetros no válidos ({"ventas": [...]})'}, status=400)
+    if not isinstance(ventas, list) or not ventas or len(ventas) > MAX_VENTAS_POR_LOTE:
+        return JsonResponse({'error': f'Se requieren entre 1 y {MAX_VENTAS_POR_LOTE} ventas'}, status=400)
+
+    try:
+        resultados = VentaService.sincronizar(request.user, ventas)
+    except (IntegrityError, ValidationError):
+        # Otro envío del mismo lote o del stock se cruzó con este: no se aplicó nada, reintentar
+        return JsonResponse({'error': 'El lote se cruzó con otra sincronización, intenta de nuevo.'}, status=409)
+    conteo = defaultdict(int)
+    for resultado in resultados:
+        conteo[resultado['resultado']] += 1
+    return JsonResponse({
+        'creadas': conteo['creada'],
+        'duplicadas': conteo['duplicada'],
+        'conflictos': conteo['conflicto'],
+        'invalidas': conteo['invalida'],
+        'resultados': resultados,
+    })
+
+@login_required
+def api_ventas_cambiar_estado(request):
+    """
+    API: Cambia el estado de muchas ventas en una transacción (p. ej. el cierre del día).
+    Cuerpo JSON: {"ventas": [1, 2, 3], "estado": "COMPLETADA"}. Informa el resultado de cada venta.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Método no permitido'}, status=405)
+    try:
+        data = json.loads(request.body)
+        venta_ids = [int(pk) for pk in data['ventas']]
+        estado = data['estado']
+    except (KeyError, TypeError, ValueError):
+        return JsonResponse({'error': 'Parámetros no válidos ({"ventas": [ids], "estado": "..."})'}, status=400)
+    if estado not in dict(Venta.ESTADO_CHOICES):
+        return JsonResponse({'error': 'El estado seleccionado no es válido.'}, status=400)
+    if not venta_ids or len(venta_ids) > MAX_VENTAS_POR_LOTE:
+        return JsonResponse({'error': f'Se requieren entre 1 y {MAX_VENTAS_POR_LOTE} ventas'}, status=400)
+
+    try:
+        resultados = VentaService.cambiar_estados(venta_ids, estado)
+    except ValidationError as e:
+        # Otro proceso tomó el stock entre la validación y la escritura: no se aplicó nada
+        return JsonResponse({'error': ' '.join(e.messages)}, status=409)
+    return JsonResponse({
+        'estado': estado,
+        'aplicadas': sum(1 for error in resultados.values() if error is None),
+        'fallidas': sum(1 for error in resultados.values() if error is not None),
+        'resultados': [
+            {'venta_id': venta_id, 'ok': error is None, 'error': error}
+            for venta_id, error in resultados.items()
+        ],
+    })
+
 # API endpoints para AJAX
 @login_required
 def get_producto_precio(request, producto_id):
-    try:
-        producto = Producto.objects.get(id=producto_id)
-        return JsonResponse({
-            'precio': float(producto.precio_venta),
-            'stock': producto.stock_actual
-        })
-    except Producto.DoesNotExist:
+    # stock es lo que se puede vender: descontadas las reservas de cotizaciones y borradores
+    datos = precios.consultar([producto_id]).get(str(producto_id))
+    if datos is None:
         return JsonResponse({'error': 'Producto no encontrado'}, status=404)
+    return JsonResponse(datos)
+
+def _precios_solicitados(request):
+    """Datos de ?ids=... leídos una sola vez por petición (los usan el ETag y la vista), o None si los ids no son válidos."""
+    if not hasattr(request, '_precios'):
+        try:
+            ids = {int(pk) for pk in request.GET.get('ids', '').split(',') if pk}
+        except ValueError:
+            ids = set()
+        request._precios = precios.consultar(ids) if 0 < len(ids) <= precios.MAX_PRODUCTOS else None
+    return request._precios
+
+def _precios_etag(request):
+    datos = _precios_solicitados(request)
+    return None if datos is None else precios.firma(datos)
+
+@login_required
+@condition(etag_func=_precios_etag)
+def api_productos_precios(request):
+    """
+    API: Precio y stock de varios productos (?ids=1,2,3) en una sola petición, p. ej. al
+    abrir un borrador con muchas líneas. Admite GET condicional (ETag calculado de las filas leídas).
+    """
+    datos = _precios_solicitados(request)
+    if datos is None:
+        return JsonResponse({'error': f'Se requieren entre 1 y {precios.MAX_PRODUCTOS} ids (ids=1,2,3)'}, status=400)
+    response = JsonResponse({'productos': datos})
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+@login_required
+def api_productos_stock_bajo(request):
+    """API: Productos con stock bajo ordenados por severidad (mayor déficit primero), paginados."""
+    try:
+        page_size = min(max(int(request.GET.get('page_size', 20)), 1), 100)
+    except ValueError:
+        page_size = 20
+    paginator = Paginator(
+        productos_stock_bajo().values('id', 'nombre', 'sku', 'stock_actual', 'stock_minimo', 'deficit'),
+        page_size
+    )
+    page = paginator.get_page(request.GET.get('page'))
+    return JsonResponse({
+        'count': paginator.count,
+        'page': page.number,
+        'num_pages': paginator.num_pages,
+        'has_next': page.has_next(),
+        'productos': list(page.object_list),
+    })
+
+@login_required
+def api_stock_a_fecha(request):
+    """API: Stock de los productos indicados al final de una fecha, según el libro de inventario."""
+    try:
+        fecha = datetime.strptime(request.GET['fecha'], '%Y-%m-%d').date()
+        producto_ids = [int(pk) for pk in request.GET['productos'].split(',') if pk]
+    except (KeyError, ValueError):
+        return JsonResponse({'error': 'Parámetros no válidos (fecha YYYY-MM-DD, productos=1,2,3)'}, status=400)
+    if not producto_ids or len(producto_ids) > 500:
+        return JsonResponse({'error': 'Se requieren entre 1 y 500 productos'}, status=400)
+    return JsonResponse({
+        'fecha': fecha.isoformat(),
+        'stock': {str(pk): stock for pk, stock in stock_a_fecha(fecha, producto_ids).items()},
+    })
+
+def _producto_indexado(producto):
+    return indice_productos.ProductoIndexado(
+        producto.id, producto.nombre, producto.sku, producto.precio_venta, producto.stock_disponible
+    )
 
 @login_required
 def buscar_productos(request):
     query = request.GET.get('q', '')
+    # con_stock=0 incluye productos agotados (pedidos a proveedor)
+    con_stock = request.GET.get('con_stock', '1') != '0'
+    venta_id = request.GET.get('venta', '')
     if query:
-        productos = Producto.objects.filter(
-            Q(nombre__icontains=query) | Q(sku__icontains=query),
-            stock_actual__gt=0
-        )[:10]
+        if venta_id.isdigit():
+            # Notas de entrega: solo los productos de la venta
+            productos = aplicar_busqueda(
+                Producto.objects.filter(id__in=VentaDetalle.objects.filter(venta_id=venta_id).values('producto')),
+                query, 'producto'
+            ).order_by('nombre', 'id')[:10]
+            productos = [_producto_indexado(p) for p in productos]
+        else:
+            # Índice en memoria por prefijo; las subcadenas que no empiezan palabra van al índice de texto
+            productos = indice_productos.buscar(query, limite=10, con_stock=con_stock)
+            if not productos:
+                productos = [
+                    _producto_indexado(p)
+                    for p in buscar_productos_indexados(Producto.objects.all(), query, limite=10, con_stock=con_stock)
+                ]
         
         results = [{
             'id': p.id,
             'nombre': p.nombre,
             'sku': p.sku,
-            'precio': float(p.precio_venta),
-            'stock': p.stock_actual
+            'precio': float(p.precio),
+            'stock': p.stock
         } for p in productos]
         
         return JsonResponse({'productos': results})
@@ -475,12 +614,7 @@ def proveedor_list(request):
     search = request.GET.get('search', '')
     proveedores = Proveedor.objects.all()
     
-    if search:
-        proveedores = proveedores.filter(
-            Q(nombre__icontains=search) | 
-            Q(email__icontains=search) | 
-            Q(telefono__icontains=search)
-        )
+    proveedores = aplicar_busqueda(proveedores, search, 'proveedor')
     
     return render(request, 'proveedores/list.html', {
         'proveedores': proveedores,
@@ -539,7 +673,8 @@ def pedido_list(request):
     search = request.GET.get('search', '')
     estado = request.GET.get('estado', '')
     
-    pedidos = PedidoProveedor.objects.select_related('proveedor').prefetch_related('detalles_pedido__producto')
+    # Pagado y saldo anotados: sin una consulta de pagos por pedido
+    pedidos = con_saldos(PedidoProveedor.objects.select_related('proveedor').prefetch_related('detalles_pedido__producto'))
     
     if search:
         pedidos = pedidos.filter(
@@ -550,10 +685,12 @@ def pedido_list(request):
     if estado:
         pedidos = pedidos.filter(estado=estado)
     
-    pedidos = pedidos.order_by('-fecha_pedido')
+    pagina = paginar_keyset(pedidos, 'fecha_pedido', request.GET.get('despues'), request.GET.get('antes'))
     
     return render(request, 'pedidos/list.html', {
-        'pedidos': pedidos,
+        'pedidos': pagina,
+        'pagina': pagina,
+        'filtros': urlencode({k: v for k, v in (('search', search), ('estado', estado)) if v}),
         'search': search,
         'estado_selected': estado,
         'estados': PedidoProveedor.ESTADO_CHOICES
@@ -566,7 +703,7 @@ def pedido_add(request):
         formset = PedidoDetalleFormSet(request.POST)
 
         if pedido_form.is_valid() and formset.is_valid():
-            with transaction.atomic():
+            with atomic_escritura():
                 pedido = pedido_form.save()
                 formset.instance = pedido
                 detalles = formset.save()
@@ -592,7 +729,7 @@ def pedido_add(request):
 # === PAGOS A PROVEEDORES ===
 @login_required
 def pedido_pago_add(request, pk):
-    pedido = get_object_or_404(PedidoProveedor, pk=pk)
+    pedido = get_object_or_404(con_saldos(PedidoProveedor.objects.all()), pk=pk)
     if request.method == 'POST':
         form = PagoProveedorForm(request.POST, request.FILES)
         if form.is_valid():
@@ -612,7 +749,7 @@ def pedido_pago_add(request, pk):
 
 @login_required
 def pedido_detail(request, pk):
-    pedido = get_object_or_404(PedidoProveedor, pk=pk)
+    pedido = get_object_or_404(con_saldos(PedidoProveedor.objects.select_related('proveedor')), pk=pk)
     detalles = pedido.detalles_pedido.select_related('producto')
     pagos = pedido.pagos.select_related('usuario').order_by('-fecha_pago') if hasattr(pedido, 'pagos') else []
     return render(request, 'pedidos/detail.html', {
@@ -623,27 +760,79 @@ def pedido_detail(request, pk):
         'saldo_pendiente': pedido.saldo_pendiente,
     })
 
+@login_required
+def pedido_cuentas_por_pagar(request):
+    """Reporte de saldos pendientes con proveedores, en una sola consulta."""
+    proveedor_id = request.GET.get('proveedor', '')
+    proveedores, total = cuentas_por_pagar(proveedor_id if proveedor_id.isdigit() else None)
+    return render(request, 'pedidos/cuentas_por_pagar.html', {
+        'proveedores': proveedores,
+        'total': total,
+        'proveedor_selected': proveedor_id,
+        'todos_proveedores': Proveedor.objects.order_by('nombre'),
+    })
+
+@login_required
+def api_pedidos_recibir(request):
+    """
+    API: Recibe muchos pedidos en una transacción (p. ej. un camión con varias órdenes).
+    Cuerpo JSON: {"pedidos": [1, 2, 3]}. Informa el resultado de cada pedido.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Método no permitido'}, status=405)
+    try:
+        pedido_ids = [int(pk) for pk in json.loads(request.body)['pedidos']]
+    except (KeyError, TypeError, ValueError):
+        return JsonResponse({'error': 'Parámetros no válidos ({"pedidos": [ids]})'}, status=400)
+    if not pedido_ids or len(pedido_ids) > MAX_PEDIDOS_POR_LOTE:
+        return JsonResponse({'error': f'Se requieren entre 1 y {MAX_PEDIDOS_POR_LOTE} pedidos'}, status=400)
+
+    resultados = PedidoService.recibir(pedido_ids)
+    return JsonResponse({
+        'recibidos': sum(1 for error in resultados.values() if error is None),
+        'fallidos': sum(1 for error in resultados.values() if error is not None),
+        'resultados': [
+            {'pedido_id': pedido_id, 'ok': error is None, 'error': error}
+            for pedido_id, error in resultados.items()
+        ],
+    })
+
+@login_required
+def api_pedidos_generar_reposicion(request):
+    """
+    API: Crea pedidos BORRADOR, uno por proveedor, para los productos bajo su
+    umbral de reorden (ver core.services.reposicion).
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Método no permitido'}, status=405)
+    creados, sin_proveedor = reposicion.generar_pedidos()
+    return JsonResponse({
+        'pedidos': [
+            {'id': pedido.id, 'proveedor_id': pedido.proveedor_id, 'lineas': len(detalles),
+             'costo_total': str(pedido.costo_total)}
+            for pedido, detalles in creados
+        ],
+        'sin_proveedor': sin_proveedor,
+    }, status=201 if creados else 200)
+
 @login_required
 def pedido_cambiar_estado(request, pk):
     pedido = get_object_or_404(PedidoProveedor, pk=pk)
     
     if request.method == 'POST':
         nuevo_estado = request.POST.get('estado')
-        if nuevo_estado in dict(PedidoProveedor.ESTADO_CHOICES):
+        if nuevo_estado == 'RECIBIDO':
+            # La recepción es la misma que la de la API en lote: suma el stock una sola vez
+            error = PedidoService.recibir([pedido.id])[pedido.id]
+            if error:
+                messages.error(request, error)
+            else:
+                messages.success(request, f'Pedido #{pedido.id} marcado como recibido. Stock actualizado.')
+        elif nuevo_estado in dict(PedidoProveedor.ESTADO_CHOICES):
             pedido.estado = nuevo_estado
             pedido.save()
-            
-            if nuevo_estado == 'RECIBIDO':
-                # Actualizar stock de productos
-                for detalle in pedido.detalles_pedido.all():
-                    detalle.producto.stock_actual += detalle.cantidad
-                    detalle.producto.save()
-                messages.success(request, f'Pedido #{pedido.id} marcado como recibido. Stock actualizado.')
-            else:
-                messages.success(request, f'Estado del pedido #{pedido.id} actualizado.')
-                
-            return redirect('pedido_detail', pk=pedido.id)
-    
+            messages.success(request, f'Estado del pedido #{pedido.id} actualizado.')
+
     return redirect('pedido_detail', pk=pedido.id)
 
 # === NOTAS DE ENTREGA ===
@@ -658,13 +847,19 @@ def nota_entrega_crear(request, venta_id):
         messages.error(request, f'No se pueden agregar notas de entrega para ventas en estado "{venta.get_estado_display()}"')
         return redirect('venta_detail', pk=venta.id)
     
+    # Solo productos de esta venta
+    detalles_kwargs = {
+        'productos': Producto.objects.filter(id__in=venta.detalles.values('producto')),
+        'form_kwargs': {'venta': venta},
+    }
+    
     if request.method == 'POST':
         form = NotaEntregaVentaForm(request.POST)
-        formset = DetalleNotaEntregaFormSet(request.POST)
+        formset = DetalleNotaEntregaFormSet(request.POST, **detalles_kwargs)
         
         if form.is_valid() and formset.is_valid():
             try:
-                with transaction.atomic():
+                with atomic_escritura():
                     # Crear la nota de entrega
                     nota = form.save(commit=False)
                     nota.venta = venta
@@ -687,12 +882,7 @@ def nota_entrega_crear(request, venta_id):
                 messages.error(request, f'Error al crear la nota de entrega: {str(e)}')
     else:
         form = NotaEntregaVentaForm()
-        formset = DetalleNotaEntregaFormSet()
-        
-        # Configurar el formset para mostrar solo productos de esta venta
-        for form_detalle in formset:
-            productos_venta = venta.detalles.values_list('producto', flat=True)
-            form_detalle.fields['producto'].queryset = Producto.objects.filter(id__in=productos_venta)
+        formset = DetalleNotaEntregaFormSet(**detalles_kwargs)
     
     return render(request, 'notas_entrega/form.html', {
         'form': form,
@@ -771,12 +961,7 @@ def sucursal_list(request):
     search = request.GET.get('search', '')
     sucursales = Sucursal.objects.all()
     
-    if search:
-        sucursales = sucursales.filter(
-            Q(nombre__icontains=search) | 
-            Q(codigo__icontains=search) |
-            Q(ciudad__icontains=search)
-        )
+    sucursales = aplicar_busqueda(sucursales, search, 'sucursal')
     
     return render(request, 'sucursales/list.html', {
         'sucursales': sucursales,
@@ -841,12 +1026,7 @@ def repartidor_list(request):
     
     repartidores = Repartidor.objects.all()
     
-    if search:
-        repartidores = repartidores.filter(
-            Q(nombre__icontains=search) | 
-            Q(documento__icontains=search) |
-            Q(telefono__icontains=search)
-        )
+    repartidores = aplicar_busqueda(repartidores, search, 'repartidor')
     
     if estado:
         repartidores = repartidores.filter(estado=estado)
@@ -1022,9 +1202,13 @@ def ruta_marcar_entrega(request, detalle_id):
         
         # Actualizar estado de la venta (sin validar stock)
         venta = detalle.venta
+        estado_anterior = venta.estado
         venta.estado = 'COMPLETADA'
         # Usar update para evitar el método save() que valida stock
         Venta.objects.filter(id=venta.id).update(estado='COMPLETADA')
+        if estado_anterior != 'COMPLETADA':
+            registrar_venta(venta, 1)
+        invalidar_widgets(Venta)
         
         messages.success(request, f'Entrega #{detalle.venta.id} marcada como completada')
         
@@ -1124,6 +1308,14 @@ def api_calcular_ruta_optima(request):
         sucursal = Sucursal.objects.get(id=sucursal_id)
         repartidor = Repartidor.objects.get(id=repartidor_id)
         ventas = Venta.objects.filter(id__in=ventas_ids).prefetch_related('detalles__producto')
+
+        # La sucursal de origen debe tener la mercancía antes de planear la ruta
+        faltantes = faltantes_sucursal(ventas_ids, sucursal.id)
+        if faltantes and not data.get('permitir_faltantes'):
+            return JsonResponse({
+                'error': f'La sucursal {sucursal.nombre} no tiene stock suficiente para estas ventas',
+                'faltantes': faltantes,
+            }, status=409)
         
         print(f"\n📊 VALIDANDO VENTAS:")
         print(f"   Ventas encontradas en BD: {ventas.count()}")
@@ -6,7 +6,9 @@ import sys
 
 def main():
     """Run administrative tasks."""
-    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
+    # Las pruebas usan config.settings_test (base de pruebas en archivo)
+    configuracion = "config.settings_test" if sys.argv[1:2] == ["test"] else "config.settings"
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", configuracion)
     try:
         from django.core.management import execute_from_command_line
     except ImportError as exc: